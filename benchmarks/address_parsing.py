@@ -0,0 +1,63 @@
+"""Benchmark parsing a payout list of mixed base58 and bech32 addresses.
+
+Run with `python benchmarks/address_parsing.py`.
+"""
+import hashlib
+import timeit
+
+from trezorlib.tools import b58check_decode
+
+from microwallet import account_types, address, coins
+from microwallet.formats import bech32
+
+COIN = coins.by_name["Bitcoin"]
+COUNT = 50000
+
+
+def pubkeys():
+    for i in range(COUNT):
+        yield b"\x02" + hashlib.sha256(i.to_bytes(4, "big")).digest()
+
+
+def trial_decode(coin, addr):
+    # output script derivation as it was before format dispatch
+    witver, witprog = bech32.decode(coin["bech32_prefix"], addr)
+    if witver is not None:
+        return witver, witprog
+    return b58check_decode(addr)
+
+
+def main():
+    types = (
+        account_types.ACCOUNT_TYPE_LEGACY,
+        account_types.ACCOUNT_TYPE_DEFAULT,
+        account_types.ACCOUNT_TYPE_SEGWIT,
+    )
+    encoders = [t.address_encoder(COIN) for t in types]
+    addresses = [encoders[i % 3](pk) for i, pk in enumerate(pubkeys())]
+
+    old = min(
+        timeit.repeat(
+            lambda: [trial_decode(COIN, a) for a in addresses], number=1, repeat=3
+        )
+    )
+    single = min(
+        timeit.repeat(
+            lambda: [address.derive_output_script(COIN, a) for a in addresses],
+            number=1,
+            repeat=3,
+        )
+    )
+    batch = min(
+        timeit.repeat(
+            lambda: address.derive_output_scripts(COIN, addresses), number=1, repeat=3
+        )
+    )
+    print(f"{'trial decoding':>16}: {old * 1000:8.1f} ms per {COUNT}")
+    print(f"{'dispatched':>16}: {single * 1000:8.1f} ms per {COUNT}")
+    print(f"{'batch':>16}: {batch * 1000:8.1f} ms per {COUNT}")
+    print(f"{'speedup':>16}: {old / batch:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Benchmark the table-driven bech32 codec against the reference implementation.
+
+Run with `python benchmarks/bech32_throughput.py`.
+"""
+import hashlib
+import timeit
+
+from microwallet.formats import bech32, bech32_fast
+
+HRP = "bc"
+PROGRAMS = [
+    (0, hashlib.sha256(i.to_bytes(4, "big")).digest()[:20]) for i in range(5000)
+] + [(0, hashlib.sha256(i.to_bytes(4, "little")).digest()) for i in range(5000)]
+
+
+def best(func):
+    return min(timeit.repeat(func, number=1, repeat=5))
+
+
+def main():
+    addresses = [bech32.encode(HRP, *p) for p in PROGRAMS]
+    assert bech32_fast.encode_many(HRP, PROGRAMS) == addresses
+
+    results = [
+        ("reference encode", best(lambda: [bech32.encode(HRP, *p) for p in PROGRAMS])),
+        ("fast encode_many", best(lambda: bech32_fast.encode_many(HRP, PROGRAMS))),
+        ("reference decode", best(lambda: [bech32.decode(HRP, a) for a in addresses])),
+        ("fast decode_many", best(lambda: bech32_fast.decode_many(HRP, addresses))),
+    ]
+    for name, seconds in results:
+        rate = len(PROGRAMS) / seconds
+        print(f"{name:>16}: {seconds * 1000:8.1f} ms, {rate:10.0f} addresses/s")
+    print(f"{'encode speedup':>16}: {results[0][1] / results[1][1]:8.2f}x")
+    print(f"{'decode speedup':>16}: {results[2][1] / results[3][1]:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark public child key derivation.
+
+Run with `python benchmarks/bip32_derivation.py`.
+"""
+import timeit
+
+from microwallet import bip32
+from microwallet.formats import xpub
+
+XPUB = (
+    "xpub6BiVtCpG9fQQdziwDT8EyYPLnuXs14FwNZqGHhMzPDMdLKc97agw"
+    "FKMb3FfiweRsnqkeHYymF31RJc9EozZxHUSHzkjQ2H9SKGe7GmRDGPM"
+)
+CHILDREN = 1000
+REPEAT = 3
+
+
+def one_by_one(node):
+    return [bip32.get_subnode(node, i) for i in range(CHILDREN)]
+
+
+def batched(node):
+    return bip32.get_subnodes(node, 0, CHILDREN)
+
+
+def main():
+    _, node = xpub.deserialize(XPUB)
+    node = bip32.get_subnode(node, 0)
+    assert one_by_one(node) == batched(node)
+
+    results = {}
+    for func in (one_by_one, batched):
+        best = min(timeit.repeat(lambda: func(node), number=1, repeat=REPEAT))
+        results[func.__name__] = best
+        print(f"{func.__name__:>12}: {best * 1000:8.1f} ms per {CHILDREN} children")
+
+    speedup = results["one_by_one"] / results["batched"]
+    print(f"{'speedup':>12}: {speedup:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
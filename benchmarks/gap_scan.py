@@ -0,0 +1,57 @@
+"""Benchmark gap-limit discovery against a backend with simulated latency.
+
+Run with `python benchmarks/gap_scan.py`.
+"""
+import asyncio
+import timeit
+
+from microwallet.account import Account
+
+XPUB = (
+    "zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG"
+    "868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs"
+)
+RTT = 0.05
+ACTIVE = 100
+
+
+class LatencyBackend:
+    def __init__(self, account):
+        self.active = {a.str for _, a in zip(range(ACTIVE), account.addresses())}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def get_address_data(self, address):
+        await asyncio.sleep(RTT)
+        total = 1000 if address in self.active else 0
+        return {"address": address, "totalReceived": total, "balance": total}
+
+
+async def discover(account):
+    return [a async for a in account.active_address_data()]
+
+
+def run(window):
+    account = Account.from_xpub("Bitcoin", XPUB, scan_window=window)
+    account.backend = LatencyBackend(account)
+    loop = asyncio.get_event_loop()
+    start = timeit.default_timer()
+    found = loop.run_until_complete(discover(account))
+    assert len(found) == ACTIVE
+    return timeit.default_timer() - start
+
+
+def main():
+    for window in (1, 20, 40, 100):
+        elapsed = run(window)
+        print(
+            f"window {window:>4}: {elapsed * 1000:8.1f} ms ({elapsed / RTT:5.1f} RTT)"
+        )
+
+
+if __name__ == "__main__":
+    main()
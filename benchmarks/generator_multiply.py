@@ -0,0 +1,51 @@
+"""Benchmark fixed-base multiplication by the secp256k1 generator.
+
+Run with `python benchmarks/generator_multiply.py`.
+"""
+import hashlib
+import os
+import tempfile
+import timeit
+
+from fastecdsa.curve import secp256k1
+
+from microwallet import ec
+
+SCALARS = [
+    int.from_bytes(hashlib.sha256(i.to_bytes(4, "big")).digest(), "big")
+    for i in range(1000)
+]
+
+
+def main():
+    start = timeit.default_timer()
+    table = ec.GeneratorTable.build()
+    build_time = timeit.default_timer() - start
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "table.bin")
+        table.save(path)
+        start = timeit.default_timer()
+        ec.GeneratorTable.load(path)
+        load_time = timeit.default_timer() - start
+
+    print(f"{'table build':>16}: {build_time * 1000:8.1f} ms")
+    print(f"{'table load':>16}: {load_time * 1000:8.1f} ms")
+
+    generic = min(
+        timeit.repeat(lambda: [k * secp256k1.G for k in SCALARS], number=1, repeat=3)
+    )
+    fixed = min(
+        timeit.repeat(
+            lambda: ec.batch_normalize([table.multiply(k) for k in SCALARS]),
+            number=1,
+            repeat=3,
+        )
+    )
+    print(f"{'fastecdsa k*G':>16}: {generic * 1000:8.1f} ms per {len(SCALARS)}")
+    print(f"{'fixed-base table':>16}: {fixed * 1000:8.1f} ms per {len(SCALARS)}")
+    print(f"{'speedup':>16}: {generic / fixed:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark address derivation of a 2-of-3 multisig account.
+
+Compares a single-key account with a three-cosigner account, both deriving
+in a pool of worker processes. Run with `python benchmarks/multisig_scan.py`.
+"""
+import asyncio
+import timeit
+
+from microwallet import account_types
+from microwallet.account import Account
+from microwallet.bip32 import get_subnode
+from microwallet.derivation import DerivationService
+from microwallet.formats import xpub
+from microwallet.multisig import MultisigAccount
+
+ADDRESSES = 2000
+WORKERS = 3
+# cosigner nodes are children of this account
+XPUB = (
+    "zpub6rszzdAK6RubKxxKxydVq6Bpjz1mt8BBitik5JMBy3QZeegBLHYp"
+    "9Nw5UR6xa6PrMdn4hfF79rQcfri7pvqo5jJdrYj1WowiVDtGBjD9nbS"
+)
+
+
+async def scan(account):
+    n = 0
+    async for _ in account.address_stream():
+        n += 1
+        if n == ADDRESSES:
+            break
+
+
+def run(account):
+    loop = asyncio.get_event_loop()
+    start = timeit.default_timer()
+    loop.run_until_complete(scan(account))
+    return timeit.default_timer() - start
+
+
+def main():
+    _, root = xpub.deserialize(XPUB)
+    nodes = [get_subnode(root, 100 + i) for i in range(3)]
+    with DerivationService(WORKERS) as deriver:
+        single = Account(
+            "Bitcoin", nodes[0], account_types.ACCOUNT_TYPE_SEGWIT, deriver=deriver
+        )
+        multi = MultisigAccount("Bitcoin", nodes, 2, deriver=deriver)
+        # warm up the pool
+        run(single)
+        single_time = run(single)
+        multi_time = run(multi)
+
+    multi_serial = MultisigAccount("Bitcoin", nodes, 2)
+    serial_time = run(multi_serial)
+
+    print(f"{'single-key':>20}: {single_time * 1000:8.1f} ms per {ADDRESSES}")
+    print(f"{'2-of-3 parallel':>20}: {multi_time * 1000:8.1f} ms per {ADDRESSES}")
+    print(f"{'2-of-3 serial':>20}: {serial_time * 1000:8.1f} ms per {ADDRESSES}")
+    print(f"{'parallel / single':>20}: {multi_time / single_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
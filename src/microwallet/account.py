@@ -1,35 +1,121 @@
 import asyncio
+import collections
 import functools
 import inspect
+import itertools
+import logging
+import time
 import typing
 from decimal import Decimal
 
 import attr
 
-from . import account_types, coins, exceptions
+from . import account_types, coins, exceptions, keycache
 from .address import Address, derive_output_script
 from .bip32 import get_subnode
-from .blockbook import BlockbookWebsocketBackend
+from .blockbook import HISTORY_PAGE_SIZE, BlockbookWebsocketBackend
+from .derivation import derive_chunk
 from .formats import transaction, xpub
 
+LOG = logging.getLogger(__name__)
+
 RBF_SEQUENCE_NUMBER = 0xFFFF_FFFD
 SATOSHIS = Decimal(1e8)
 
 BIP32_ADDRESS_DISCOVERY_LIMIT = 20
+DERIVATION_BATCH_SIZE = 20
+# enough to have the window past the gap limit requested before it is reached
+ADDRESS_DATA_WINDOW = 2 * BIP32_ADDRESS_DISCOVERY_LIMIT
+FETCH_CONCURRENCY = 20
+# seconds for which a discovery pass is trusted
+SNAPSHOT_TTL = 60
 
 
-@attr.s(auto_attribs=True)
+@attr.s(auto_attribs=True, slots=True)
 class Utxo:
     address: Address
-    tx: typing.Dict[str, typing.Any]
+    txid: str
     vout: int
-    value: Decimal
+    value: int
+    # parent transaction, filled in by `Account.load_transactions`
+    tx: typing.Optional[typing.Dict[str, typing.Any]] = None
+
+
+@attr.s(auto_attribs=True)
+class AccountSnapshot:
+    """Result of a single discovery pass over an account.
+
+    Holds active addresses of both chains with their data, all UTXOs, the first
+    unused address of each chain and the fee rate at the time of the scan.
+    """
+
+    addresses: typing.List[Address]
+    utxos: typing.List[Utxo]
+    unused: typing.Dict[bool, Address]
+    fee_rate: int
+    taken_at: float
+    ttl: float
+
+    def is_valid(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return now - self.taken_at < self.ttl
+
+    @property
+    def balance(self):
+        return Decimal(sum(address.balance for address in self.addresses))
+
+
+@attr.s(auto_attribs=True)
+class AddressBatch:
+    """Consecutive range of addresses on one chain, stored column-wise."""
+
+    path_prefix: typing.List[int]
+    start: int
+    public_keys: typing.List[bytes]
+    addresses: typing.List[str]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def path(self, n):
+        return self.path_prefix + [self.start + n]
+
+    def __iter__(self):
+        """Iterate over `(path, address, public_key)` tuples."""
+        for n, (address, public_key) in enumerate(
+            zip(self.addresses, self.public_keys)
+        ):
+            yield self.path(n), address, public_key
 
 
 def NULL_PROGRESS(addrs=None, txes=None):
     pass
 
 
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+def _chain_index(path):
+    """Parse `(change, index)` out of the last two components of a path string."""
+    try:
+        change, index = (int(n) for n in path.split("/")[-2:])
+    except (AttributeError, ValueError):
+        raise exceptions.BackendError(f"Unexpected derivation path: {path}") from None
+    if change not in (0, 1):
+        raise exceptions.BackendError(f"Unexpected derivation path: {path}")
+    return bool(change), index
+
+
+async def cancel_all(futures):
+    """Cancel `futures` and wait until all of them have unwound."""
+    for fut in futures:
+        fut.cancel()
+    await asyncio.gather(*futures, return_exceptions=True)
+
+
 def require_backend(func):
     @functools.wraps(func)
     async def run_normal(self, *args, **kwargs):
@@ -39,8 +125,13 @@ def require_backend(func):
     @functools.wraps(func)
     async def run_generator(self, *args, **kwargs):
         async with self.backend:
-            async for x in func(self, *args, **kwargs):
-                yield x
+            agen = func(self, *args, **kwargs)
+            try:
+                async for x in agen:
+                    yield x
+            finally:
+                # close the inner generator while the backend is still open
+                await agen.aclose()
 
     if inspect.isasyncgenfunction(func):
         return run_generator
@@ -56,6 +147,12 @@ class Account:
         account_type=account_types.ACCOUNT_TYPE_LEGACY,
         path=None,
         backend=None,
+        key_cache_dir=None,
+        deriver=None,
+        scan_window=ADDRESS_DATA_WINDOW,
+        xpub_discovery=True,
+        snapshot_ttl=SNAPSHOT_TTL,
+        store=None,
     ):
         self.coin_name = coin_name
         try:
@@ -75,6 +172,16 @@ class Account:
         self.addr_node = get_subnode(node, 0)
         self.change_node = get_subnode(node, 1)
 
+        self.key_cache_dir = key_cache_dir
+        self._key_caches = {}
+        self.deriver = deriver
+        self.scan_window = scan_window
+        self.xpub_discovery = xpub_discovery
+        self.snapshot_ttl = snapshot_ttl
+        self.snapshot = None
+        self.store = store
+        self._transactions = {}
+
     @classmethod
     def from_xpub(cls, coin_name, xpubstr, **kwargs):
         try:
@@ -97,88 +204,571 @@ class Account:
 
         return cls(coin_name, node, account_type, **kwargs)
 
+    @property
+    def xpub(self):
+        """The account xpub with the version of its type, or None if there is none."""
+        field = self.account_type.xpub_magic_field
+        if field is None or self.coin.get(field) is None:
+            return None
+        return xpub.serialize(self.coin[field], self.node)
+
+    def _master_node(self, change):
+        return self.addr_node if not change else self.change_node
+
+    def _address_encoder(self):
+        return self.account_type.address_encoder(self.coin)
+
+    def _key_cache(self, change):
+        if self.key_cache_dir is None:
+            return None
+        if change not in self._key_caches:
+            master_node = self._master_node(change)
+            key = keycache.cache_key(
+                self.coin_name,
+                str(self.account_type.type_id),
+                master_node.public_key,
+                master_node.chain_code,
+            )
+            try:
+                self._key_caches[change] = keycache.KeyCache.open(
+                    self.key_cache_dir, key
+                )
+            except OSError:
+                self._key_caches[change] = None
+        return self._key_caches[change]
+
+    def _derive(self, change, start, count):
+        """Derive `(key material, address)` records for a range of one chain."""
+        return derive_chunk(
+            self._master_node(change), start, count, self._address_encoder()
+        )
+
+    async def _derive_async(self, change, start, count):
+        return await self.deriver.derive(
+            self._master_node(change), start, count, self._address_encoder()
+        )
+
+    def _make_addresses(self, change, start, records):
+        return [
+            Address(self.path + [int(change), i], change, public_key, address_str)
+            for i, (public_key, address_str) in enumerate(records, start)
+        ]
+
+    def _cached_addresses(self, change):
+        cache = self._key_cache(change)
+        if cache is None:
+            return
+        for i, (public_key, address_str) in enumerate(cache.records()):
+            yield Address(self.path + [int(change), i], change, public_key, address_str)
+
     def addresses(self, change=False):
         i = 0
-        master_node = self.addr_node if not change else self.change_node
-        address_version = self.coin[self.account_type.address_version_field]
-        address_func = self.account_type.address_str
-        while True:
-            node = get_subnode(master_node, i)
-            address_str = address_func(address_version, node.public_key)
-            path = self.path + [int(change), i]
-            yield Address(path, change, node.public_key, address_str)
+        for address in self._cached_addresses(change):
+            yield address
             i += 1
 
-    @require_backend
-    async def _address_data(self, change=False):
-        addr_iter = self.addresses(change)
+        cache = self._key_cache(change)
         while True:
-            chunk = []
-            try:
-                for _ in range(20):
-                    chunk.append(next(addr_iter))
-            except StopIteration:
-                pass
-            if not chunk:
-                return
+            records = self._derive(change, i, DERIVATION_BATCH_SIZE)
+            if cache is not None:
+                cache.append(i, records)
+            yield from self._make_addresses(change, i, records)
+            i += len(records)
+
+    def address_range(self, start, count, change=False):
+        """Get `count` addresses starting at index `start` as an `AddressBatch`.
+
+        Cached addresses are read from the key cache, the rest is derived in a
+        single batch.
+        """
+        public_keys = []
+        addresses = []
+        end = start + count
+        index = start
+
+        cache = self._key_cache(change)
+        if cache is not None:
+            while index < min(end, len(cache)):
+                public_key, address_str = cache[index]
+                public_keys.append(public_key)
+                addresses.append(address_str)
+                index += 1
+
+        if index < end:
+            records = self._derive(change, index, end - index)
+            if cache is not None:
+                cache.append(index, records)
+            for public_key, address_str in records:
+                public_keys.append(public_key)
+                addresses.append(address_str)
+
+        return AddressBatch(self.path + [int(change)], start, public_keys, addresses)
+
+    async def address_stream(self, change=False):
+        """Asynchronous version of `addresses`.
+
+        If a derivation service is configured in `self.deriver`, chunks of
+        addresses are derived ahead in its worker processes while the caller
+        consumes the current chunk. Otherwise, addresses are derived serially,
+        yielding to the event loop after every batch.
+        """
+        if self.deriver is None:
+            for n, address in enumerate(self.addresses(change), 1):
+                yield address
+                if n % DERIVATION_BATCH_SIZE == 0:
+                    await asyncio.sleep(0)
+            return
+
+        i = 0
+        for address in self._cached_addresses(change):
+            yield address
+            i += 1
 
-            batch = [
-                asyncio.ensure_future(self.backend.get_address_data(a.str))
-                for a in chunk
-            ]
-            # await asyncio.wait(batch)
-            for address, data in zip(chunk, batch):
-                address.data = await data
+        cache = self._key_cache(change)
+        chunk_size = self.deriver.chunk_size
+        pending = collections.deque()
+        try:
+            while True:
+                while len(pending) < self.deriver.prefetch:
+                    fut = asyncio.ensure_future(
+                        self._derive_async(change, i, chunk_size)
+                    )
+                    pending.append((i, fut))
+                    i += chunk_size
+
+                start, fut = pending.popleft()
+                records = await fut
+                if cache is not None:
+                    cache.append(start, records)
+                for address in self._make_addresses(change, start, records):
+                    yield address
+        finally:
+            # let the cancelled derivations unwind before the stream is closed
+            await cancel_all([fut for _, fut in pending])
+
+    @require_backend
+    async def _address_data(self, change=False, window=None, slow_start=False):
+        """Yield addresses with their backend data, in order.
+
+        Up to `window` requests (`self.scan_window` by default) are kept in
+        flight: whenever an address is yielded, a request for the next one is
+        sent. Requests still pending when the consumer stops are cancelled.
+
+        With `slow_start`, the window starts at a single request and grows by
+        one with every yielded address, so that a consumer which stops early
+        leaves at most as many surplus requests as it has consumed.
+        """
+        if window is None:
+            window = self.scan_window
+        limit = 1 if slow_start else window
+        addr_iter = self.address_stream(change)
+        pending = collections.deque()
+        try:
+            while True:
+                async for address in addr_iter:
+                    fut = asyncio.ensure_future(
+                        self.backend.get_address_data(address.str)
+                    )
+                    pending.append((address, fut))
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    return
+
+                address, fut = pending.popleft()
+                address.update(await fut)
                 yield address
+                limit = min(limit + 1, window)
+        finally:
+            # requests not sent yet are never sent, late responses are dropped
+            await cancel_all([fut for _, fut in pending])
+            await addr_iter.aclose()
 
     async def active_address_data(self, change=False):
         unused_counter = 0
-        async for address in self._address_data(change):
-            if address.data["totalReceived"] > 0:
-                unused_counter = 0
-                yield address
-            else:
-                unused_counter += 1
-
-            if unused_counter > BIP32_ADDRESS_DISCOVERY_LIMIT:
-                break
+        addr_iter = self._address_data(change)
+        try:
+            async for address in addr_iter:
+                if address.used:
+                    unused_counter = 0
+                    yield address
+                else:
+                    unused_counter += 1
+
+                if unused_counter > BIP32_ADDRESS_DISCOVERY_LIMIT:
+                    break
+        finally:
+            # discard the speculatively requested surplus right away
+            await addr_iter.aclose()
 
     async def get_unused_address(self, change=False):
-        async for address in self._address_data(change):
-            if address.data["totalReceived"] == 0:
-                return address
+        snapshot = self._valid_snapshot()
+        if snapshot is not None:
+            return snapshot.unused[change]
+
+        if self._use_xpub_discovery():
+            used = await self._xpub_used_addresses()
+            if used is not None:
+                return self._xpub_unused_address(used, change)
+
+        # the first unused address is usually close, do not request far ahead
+        addr_iter = self._address_data(
+            change, window=DERIVATION_BATCH_SIZE, slow_start=True
+        )
+        try:
+            async for address in addr_iter:
+                if not address.used:
+                    return address
+        finally:
+            await addr_iter.aclose()
+
+    def _use_xpub_discovery(self):
+        return (
+            self.xpub_discovery
+            and self.xpub is not None
+            and getattr(self.backend, "supports_xpub_queries", False) is True
+        )
+
+    def addresses_at(self, paths):
+        """Make `Address` objects for an iterable of `(change, index)` pairs."""
+        result = {}
+        for change in (False, True):
+            indexes = [i for c, i in paths if c == change]
+            if not indexes:
+                continue
+            start = min(indexes)
+            batch = self.address_range(start, max(indexes) - start + 1, change)
+            for i in indexes:
+                record = batch.public_keys[i - start], batch.addresses[i - start]
+                result[change, i] = self._make_addresses(change, i, [record])[0]
+        return result
+
+    def _xpub_unused_address(self, used, change):
+        used_indexes = {a.path[-1] for a in used if a.change == change}
+        index = next(i for i in itertools.count() if i not in used_indexes)
+        address = self.addresses_at([(change, index)])[change, index]
+        address.balance = address.received = 0
+        return address
+
+    @require_backend
+    async def _xpub_used_addresses(self):
+        """Used addresses with their balances, from an account-level xpub query.
+
+        Return None if the backend fails to answer it, so that this call falls
+        back to scanning addresses.
+        """
+        try:
+            info = await self.backend.get_xpub_info(self.xpub)
+            tokens = {_chain_index(t["path"]): t for t in info.get("tokens", [])}
+            addresses = self.addresses_at(tokens)
+            result = []
+            for path, token in sorted(tokens.items()):
+                address = addresses[path]
+                if address.str != token["name"]:
+                    raise exceptions.BackendError(
+                        f"Address mismatch at {token['path']}"
+                    )
+                address.update(token)
+                result.append(address)
+            return result
+        except exceptions.BackendError as e:
+            LOG.warning(f"Xpub discovery failed, scanning addresses instead: {e}")
+            return None
+
+    @require_backend
+    async def _xpub_utxos(self):
+        """UTXOs grouped by address, from an account-level xpub query.
+
+        Return None if the backend fails to answer it, so that this call falls
+        back to scanning addresses.
+        """
+        try:
+            utxos = await self.backend.get_xpub_utxos(self.xpub)
+            by_path = collections.defaultdict(list)
+            for utxo in utxos:
+                by_path[_chain_index(utxo["path"])].append(utxo)
+            addresses = self.addresses_at(by_path)
+            for path, path_utxos in by_path.items():
+                expected = addresses[path].str
+                if any(u.get("address", expected) != expected for u in path_utxos):
+                    raise exceptions.BackendError(
+                        f"Address mismatch at {path_utxos[0]['path']}"
+                    )
+            return [(addresses[path], by_path[path]) for path in sorted(by_path)]
+        except exceptions.BackendError as e:
+            LOG.warning(f"Xpub discovery failed, scanning addresses instead: {e}")
+            return None
+
+    async def _collect_active(self, change):
+        return [address async for address in self.active_address_data(change)]
+
+    @require_backend
+    async def active_addresses(self):
+        """Active addresses of both chains, receive chain first.
+
+        With xpub discovery, all used addresses come from a single account-level
+        query. Otherwise, addresses are scanned one by one and the change chain
+        is discovered concurrently in the background, so that the scan takes as
+        long as the longer of the two chains.
+        """
+        snapshot = self._valid_snapshot()
+        if snapshot is not None:
+            for address in snapshot.addresses:
+                yield address
+            return
+
+        if self._use_xpub_discovery():
+            used = await self._xpub_used_addresses()
+            if used is not None:
+                for address in used:
+                    if address.used:
+                        yield address
+                return
+
+        change_scan = asyncio.ensure_future(self._collect_active(change=True))
+        try:
+            async for address in self.active_address_data(change=False):
+                yield address
+            for address in await change_scan:
+                yield address
+        finally:
+            await cancel_all([change_scan])
 
     async def balance(self):
+        snapshot = self._valid_snapshot()
+        if snapshot is not None:
+            return snapshot.balance
+
         balance = Decimal(0)
-        for change in (False, True):
-            async for addr in self.active_address_data(change):
-                balance += addr.data["balance"]
+        async for addr in self.active_addresses():
+            balance += addr.balance
         return balance
 
     @require_backend
-    async def find_utxos(self, progress=NULL_PROGRESS):
+    async def find_utxos(self, progress=NULL_PROGRESS, concurrency=FETCH_CONCURRENCY):
+        """Yield UTXOs of all active addresses, in address order.
+
+        UTXO lists of up to `concurrency` addresses ahead are requested while
+        the current ones are processed. Parent transactions are not fetched,
+        see `load_transactions`.
+        """
+        snapshot = self._valid_snapshot()
+        if snapshot is not None:
+            for utxo in snapshot.utxos:
+                yield utxo
+            return
+
+        groups = await self._xpub_utxos() if self._use_xpub_discovery() else None
+        address_iter = self.active_addresses() if groups is None else None
+        utxo_iter = self._utxo_stream(address_iter, groups, progress, concurrency)
+        try:
+            async for utxo in utxo_iter:
+                yield utxo
+        finally:
+            await utxo_iter.aclose()
+
+    async def _utxo_stream(self, address_iter, groups, progress, concurrency):
+        """Yield UTXOs of addresses from `address_iter`, or of known `groups`.
+
+        `groups` is a list of `(address, utxo list)` pairs whose UTXO lists are
+        already known. The stream takes over `address_iter` and closes it.
+        """
         addrs = 0
-        txes = 0
+        pending = collections.deque()
 
-        # XXX interleave main/change?
-        for change in (False, True):
-            async for address in self.active_address_data(change):
-                utxos = await self.backend.get_utxos(address.str)
+        for address, utxos in groups or ():
+            utxos_fut = asyncio.get_event_loop().create_future()
+            utxos_fut.set_result(utxos)
+            pending.append((address, utxos_fut))
+
+        try:
+            while True:
+                if address_iter is not None:
+                    async for address in address_iter:
+                        utxos_fut = asyncio.ensure_future(
+                            self.backend.get_utxos(address.str)
+                        )
+                        pending.append((address, utxos_fut))
+                        if len(pending) >= concurrency:
+                            break
+                if not pending:
+                    return
+
+                address, utxos_fut = pending.popleft()
+                utxos = await utxos_fut
                 addrs += 1
-                progress(addrs=addrs, txes=txes)
+                progress(addrs=addrs)
                 for utxo in utxos:
-                    txdata = await self.backend.get_txdata(utxo["txid"])
                     yield Utxo(
                         address=address,
-                        tx=txdata,
+                        txid=utxo["txid"],
                         vout=int(utxo["vout"]),
-                        value=Decimal(utxo["value"]),
+                        value=int(utxo["value"]),
                     )
-                    txes += 1
-                    progress(addrs=addrs, txes=txes)
+        finally:
+            await cancel_all([fut for _, fut in pending])
+            if address_iter is not None:
+                await address_iter.aclose()
+
+    @require_backend
+    async def load_transactions(self, utxos, concurrency=FETCH_CONCURRENCY):
+        """Fill in parent transactions of `utxos` that are not loaded yet.
+
+        Each transaction is fetched once, with at most `concurrency` requests
+        in flight, and kept for later calls. With a wallet store, stored
+        transactions are used and newly fetched ones are saved.
+        """
+        missing = {u.txid for u in utxos if u.tx is None} - self._transactions.keys()
+        if missing and self.store is not None:
+            stored = self.store.transactions(missing)
+            self._transactions.update(stored)
+            missing -= stored.keys()
+
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch(txid):
+            async with limit:
+                self._transactions[txid] = await self.backend.get_txdata(txid)
+
+        futures = [asyncio.ensure_future(fetch(txid)) for txid in missing]
+        try:
+            await asyncio.gather(*futures)
+        finally:
+            await cancel_all(futures)
+        if missing and self.store is not None:
+            self.store.save_transactions({t: self._transactions[t] for t in missing})
+
+        for utxo in utxos:
+            if utxo.tx is None:
+                utxo.tx = self._transactions[utxo.txid]
+        return utxos
+
+    @require_backend
+    async def history(
+        self, page_size=HISTORY_PAGE_SIZE, from_height=None, to_height=None
+    ):
+        """Yield transactions of the account, page by page.
+
+        With xpub queries, transactions of the whole account come newest first.
+        Otherwise the history of every active address is listed in turn, and a
+        transaction touching several addresses is yielded for each of them.
+        Blocks can be limited to `from_height` .. `to_height`. To resume an
+        interrupted listing, pass the block height of the last transaction as
+        `to_height`; transactions of that block are yielded again.
+        """
+        if self._use_xpub_discovery():
+            descriptors = [self.xpub]
+        else:
+            descriptors = [address.str async for address in self.active_addresses()]
+
+        for descriptor in descriptors:
+            pages = self.backend.get_history(
+                descriptor, page_size, from_height=from_height, to_height=to_height
+            )
+            try:
+                async for tx in pages:
+                    yield tx
+            finally:
+                await pages.aclose()
+
+    async def _scan_chain(self, change):
+        """Active addresses of a chain and its first unused address."""
+        active = []
+        unused = None
+        unused_counter = 0
+        addr_iter = self._address_data(change)
+        try:
+            async for address in addr_iter:
+                if address.used:
+                    unused_counter = 0
+                    active.append(address)
+                else:
+                    unused_counter += 1
+                    if unused is None:
+                        unused = address
+
+                if unused_counter > BIP32_ADDRESS_DISCOVERY_LIMIT:
+                    break
+        finally:
+            await addr_iter.aclose()
+        return active, unused
+
+    async def _discover(self):
+        """Return active addresses, known UTXO groups and first unused addresses."""
+        if self._use_xpub_discovery():
+            used = await self._xpub_used_addresses()
+            groups = await self._xpub_utxos() if used is not None else None
+            if groups is not None:
+                active = [a for a in used if a.used]
+                unused = {c: self._xpub_unused_address(used, c) for c in (False, True)}
+                return active, groups, unused
+
+        change_scan = asyncio.ensure_future(self._scan_chain(change=True))
+        try:
+            receive, receive_unused = await self._scan_chain(change=False)
+            change, change_unused = await change_scan
+        finally:
+            await cancel_all([change_scan])
+        unused = {False: receive_unused, True: change_unused}
+        return receive + change, None, unused
+
+    def _valid_snapshot(self):
+        if self.snapshot is not None and not self.snapshot.is_valid():
+            self.snapshot = None
+        return self.snapshot
+
+    def invalidate_snapshot(self):
+        self.snapshot = None
 
     @require_backend
+    async def refresh_snapshot(self, progress=NULL_PROGRESS):
+        """Run a discovery pass and keep its result in `self.snapshot`.
+
+        Until the snapshot expires after `self.snapshot_ttl` seconds or is
+        invalidated, `balance`, `active_addresses`, `find_utxos`,
+        `get_unused_address` and `estimate_fee` are answered from it.
+
+        If the account has a wallet store, the pass is an incremental sync of
+        the store instead of a full scan.
+        """
+        self.snapshot = None
+        if self.store is not None:
+            self.snapshot = await self.store.sync(self, progress)
+            return self.snapshot
+
+        fee_fut = asyncio.ensure_future(self.estimate_fee())
+        try:
+            active, groups, unused = await self._discover()
+            address_iter = _iterate(active) if groups is None else None
+            utxo_iter = self._utxo_stream(
+                address_iter, groups, progress, FETCH_CONCURRENCY
+            )
+            try:
+                utxos = [utxo async for utxo in utxo_iter]
+            finally:
+                await utxo_iter.aclose()
+            fee_rate = await fee_fut
+        finally:
+            await cancel_all([fee_fut])
+
+        self.snapshot = AccountSnapshot(
+            addresses=active,
+            utxos=utxos,
+            unused=unused,
+            fee_rate=fee_rate,
+            taken_at=time.monotonic(),
+            ttl=self.snapshot_ttl,
+        )
+        return self.snapshot
+
     async def estimate_fee(self):
+        snapshot = self._valid_snapshot()
+        if snapshot is not None:
+            return snapshot.fee_rate
+        return await self._estimate_fee()
+
+    @require_backend
+    async def _estimate_fee(self):
         # TODO properly estimate fee
         try:
             backend_estimate = await self.backend.estimate_fee(5)
@@ -283,7 +873,7 @@ class Account:
         script_sig, witness = self.account_type.script_sig(utxo.address, fake_sig)
         return (
             dict(
-                tx=bytes.fromhex(utxo.tx["txid"]),
+                tx=bytes.fromhex(utxo.txid),
                 index=utxo.vout,
                 script_sig=script_sig,
                 sequence=RBF_SEQUENCE_NUMBER,
@@ -293,4 +883,7 @@ class Account:
 
     @require_backend
     async def broadcast(self, signed_tx_bytes):
-        return await self.backend.broadcast(signed_tx_bytes)
+        result = await self.backend.broadcast(signed_tx_bytes)
+        # spent outputs and the change address are no longer current
+        self.invalidate_snapshot()
+        return result
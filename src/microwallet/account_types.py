@@ -1,4 +1,5 @@
-from typing import Any, Callable, List, Tuple
+import functools
+from typing import Any, Callable, List, Optional, Tuple
 
 import attr
 
@@ -11,42 +12,75 @@ from . import address
 class AccountType:
     type_id: int
     segwit: bool
-    address_str: Callable[[Any, bytes], str]
     script_sig: Callable[[address.Address, bytes], Tuple[bytes, List[bytes]]]
-    # TODO script_pubkey
+    script_pubkey: Callable[[bytes], bytes]
     input_script_type: int
     output_script_type: int
     address_version_field: str
+    encode_address: Callable[[Any, bytes], str]
+    prepare_version: Callable[[Any], Any] = lambda version: version
+    # coin field with the xpub version of this account type
+    xpub_magic_field: Optional[str] = None
+
+    def address_encoder(self, coin_data) -> Callable[[bytes], str]:
+        """Return a function encoding a public key to an address of this type.
+
+        The coin's version prefix is prepared only once. The result can be
+        pickled, so it can be sent to worker processes.
+        """
+        version = self.prepare_version(coin_data[self.address_version_field])
+        return functools.partial(self.encode_address, version)
 
 
 ACCOUNT_TYPE_LEGACY = AccountType(
     type_id=44,
     segwit=False,
-    address_str=address.address_p2pkh,
     script_sig=address.script_sig_p2pkh,
+    script_pubkey=address.script_pubkey_p2pkh,
     input_script_type=InputScriptType.SPENDADDRESS,
     output_script_type=OutputScriptType.PAYTOADDRESS,
     address_version_field="address_type",
+    encode_address=address.encode_p2pkh,
+    prepare_version=address.version_to_bytes,
+    xpub_magic_field="xpub_magic",
 )
 
 ACCOUNT_TYPE_DEFAULT = AccountType(
     type_id=49,
     segwit=True,
-    address_str=address.address_p2sh_p2wpkh,
     script_sig=address.script_sig_p2sh_p2wpkh,
+    script_pubkey=address.script_pubkey_p2sh_p2wpkh,
     input_script_type=InputScriptType.SPENDP2SHWITNESS,
     output_script_type=OutputScriptType.PAYTOP2SHWITNESS,
     address_version_field="address_type_p2sh",
+    encode_address=address.encode_p2sh_p2wpkh,
+    prepare_version=address.version_to_bytes,
+    xpub_magic_field="xpub_magic_segwit_p2sh",
 )
 
 ACCOUNT_TYPE_SEGWIT = AccountType(
     type_id=84,
     segwit=True,
-    address_str=address.address_p2wpkh,
     script_sig=address.script_sig_p2wpkh,
+    script_pubkey=address.script_pubkey_p2wpkh,
+    input_script_type=InputScriptType.SPENDWITNESS,
+    output_script_type=OutputScriptType.PAYTOWITNESS,
+    address_version_field="bech32_prefix",
+    encode_address=address.encode_p2wpkh,
+    xpub_magic_field="xpub_magic_segwit_native",
+)
+
+# BIP-48 native segwit multisig. Key material of an address is its witness
+# script rather than a single public key.
+ACCOUNT_TYPE_MULTISIG_SEGWIT = AccountType(
+    type_id=48,
+    segwit=True,
+    script_sig=address.script_sig_p2wsh_multisig,
+    script_pubkey=address.script_pubkey_p2wsh,
     input_script_type=InputScriptType.SPENDWITNESS,
     output_script_type=OutputScriptType.PAYTOWITNESS,
     address_version_field="bech32_prefix",
+    encode_address=address.encode_p2wsh,
 )
 
 
@@ -1,10 +1,12 @@
+import hashlib
 import typing
 
 import attr
 
-from trezorlib.tools import b58check_decode, b58check_encode, hash_160
+from trezorlib.tools import hash_160
 
-from .formats import bech32, op_push
+from .formats import base58, bech32_fast, op_push
+from .script import ScriptKind, classify
 
 
 SCRIPT_PREFIX_P2PKH = b"\x76\xA9\x14"
@@ -15,16 +17,27 @@ SCRIPT_PREFIX_P2SH = b"\xA9\x14"
 SCRIPT_SUFFIX_P2SH = b"\x87"
 SCRIPT_LENGTH_P2SH = 23
 
-SCRIPT_PREFIX_OP_RETURN = b"\x6A\x76"
 
-
-@attr.s(auto_attribs=True)
+@attr.s(auto_attribs=True, slots=True)
 class Address:
     path: typing.List[int]
     change: bool
     public_key: bytes
     str: str
-    data: typing.Dict[str, typing.Any] = {}
+    # witness script of multisig addresses
+    script: typing.Optional[bytes] = None
+    # satoshis as last reported by the backend, None until looked up
+    balance: typing.Optional[int] = None
+    received: typing.Optional[int] = None
+
+    @property
+    def used(self):
+        return bool(self.received)
+
+    def update(self, data):
+        """Keep the balance and total received out of a backend response."""
+        self.balance = int(data.get("balance") or 0)
+        self.received = int(data.get("totalReceived") or 0)
 
 
 def version_to_bytes(version):
@@ -33,26 +46,69 @@ def version_to_bytes(version):
 
 
 def address_p2pkh(version, pubkey):
+    return encode_p2pkh(version_to_bytes(version), pubkey)
+
+
+def address_p2sh_p2wpkh(version, pubkey):
+    return encode_p2sh_p2wpkh(version_to_bytes(version), pubkey)
+
+
+def address_p2wpkh(version, pubkey):
+    return encode_p2wpkh(version, pubkey)
+
+
+# Encoders taking a pre-computed version prefix. Used through
+# `AccountType.address_encoder` when encoding many addresses at once.
+
+
+def encode_p2pkh(prefix_bytes, pubkey):
     assert pubkey[0] != 4, "uncompressed pubkey"
-    prefix_bytes = version_to_bytes(version)
     pubkey_bytes = hash_160(pubkey)
-    return b58check_encode(prefix_bytes + pubkey_bytes)
+    return base58.check_encode(prefix_bytes + pubkey_bytes)
 
 
-def address_p2sh_p2wpkh(version, pubkey):
+def encode_p2sh_p2wpkh(prefix_bytes, pubkey):
     assert pubkey[0] != 4, "uncompressed pubkey"
-    prefix_bytes = version_to_bytes(version)
     pubkey_bytes = hash_160(pubkey)
     witness = b"\x00\x14" + pubkey_bytes
     witness_bytes = hash_160(witness)
-    return b58check_encode(prefix_bytes + witness_bytes)
+    return base58.check_encode(prefix_bytes + witness_bytes)
 
 
-def address_p2wpkh(version, pubkey):
+def encode_p2wpkh(hrp, pubkey):
     assert pubkey[0] != 4, "uncompressed pubkey"
     witver = 0
     witprog = hash_160(pubkey)
-    return bech32.encode(version, witver, witprog)
+    return bech32_fast.encode(hrp, witver, witprog)
+
+
+def multisig_script(threshold, pubkeys):
+    """Build an m-of-n OP_CHECKMULTISIG script. Keys are used in the given order."""
+    if not 1 <= threshold <= len(pubkeys) <= 16:
+        raise ValueError("Invalid multisig parameters")
+    script = bytearray([0x50 + threshold])
+    for pubkey in pubkeys:
+        script += op_push(pubkey) + pubkey
+    script += bytes([0x50 + len(pubkeys), 0xAE])
+    return bytes(script)
+
+
+def encode_p2wsh(hrp, witness_script):
+    witprog = hashlib.sha256(witness_script).digest()
+    return bech32_fast.encode(hrp, 0, witprog)
+
+
+def script_pubkey_p2pkh(pubkey):
+    return SCRIPT_PREFIX_P2PKH + hash_160(pubkey) + SCRIPT_SUFFIX_P2PKH
+
+
+def script_pubkey_p2sh_p2wpkh(pubkey):
+    witness = b"\x00\x14" + hash_160(pubkey)
+    return SCRIPT_PREFIX_P2SH + hash_160(witness) + SCRIPT_SUFFIX_P2SH
+
+
+def script_pubkey_p2wpkh(pubkey):
+    return b"\x00\x14" + hash_160(pubkey)
 
 
 def script_sig_p2pkh(address, signature):
@@ -70,22 +126,33 @@ def script_sig_p2sh_p2wpkh(address, signature):
     return script_sig, [signature, address.public_key]
 
 
+def script_pubkey_p2wsh(witness_script):
+    return b"\x00\x20" + hashlib.sha256(witness_script).digest()
+
+
 def script_sig_p2wpkh(address, signature):
     return b"", [signature, address.public_key]
 
 
-def derive_output_script(coin, address):
-    bech32_prefix = coin.get("bech32_prefix", "---")
-    witver, witprog = bech32.decode(bech32_prefix, address)
-    if witver is not None and witprog is not None:
-        witver = witver + 0x50 if witver else 0  # convert 1..16 to OP_1..OP_16
-        return (
-            witver.to_bytes(1, "little") + len(witprog).to_bytes(1, "little") + witprog
-        )
+def script_sig_p2wsh_multisig(address, signature):
+    # OP_CHECKMULTISIG pops one extra item, hence the leading empty one
+    threshold = address.script[0] - 0x50
+    return b"", [b""] + [signature] * threshold + [address.script]
+
+
+def is_bech32_address(coin, address):
+    """Tell bech32 addresses from base58 ones by the human-readable part."""
+    hrp = coin.get("bech32_prefix")
+    # coins without segwit have bech32_prefix set to None
+    return bool(hrp) and address[: len(hrp) + 1].lower() == hrp + "1"
 
-    address_bytes = b58check_decode(address)
-    p2sh_version = version_to_bytes(coin["address_type_p2sh"])
-    p2pkh_version = version_to_bytes(coin["address_type"])
+
+def _witness_output_script(witver, witprog):
+    witver = witver + 0x50 if witver else 0  # convert 1..16 to OP_1..OP_16
+    return witver.to_bytes(1, "little") + len(witprog).to_bytes(1, "little") + witprog
+
+
+def _base58_output_script(address_bytes, p2pkh_version, p2sh_version):
     if address_bytes.startswith(p2sh_version):
         script_hash = address_bytes[len(p2sh_version) :]
         return SCRIPT_PREFIX_P2SH + script_hash + SCRIPT_SUFFIX_P2SH
@@ -93,71 +160,102 @@ def derive_output_script(coin, address):
         pk_hash = address_bytes[len(p2pkh_version) :]
         return SCRIPT_PREFIX_P2PKH + pk_hash + SCRIPT_SUFFIX_P2PKH
     else:
+        return None
+
+
+def derive_output_script(coin, address):
+    if is_bech32_address(coin, address):
+        witver, witprog = bech32_fast.decode(coin["bech32_prefix"], address)
+        if witver is None:
+            raise ValueError("Invalid bech32 address")
+        return _witness_output_script(witver, witprog)
+
+    script = _base58_output_script(
+        base58.check_decode(address),
+        version_to_bytes(coin["address_type"]),
+        version_to_bytes(coin["address_type_p2sh"]),
+    )
+    if script is None:
         raise ValueError("Unrecognized address")
+    return script
+
+
+def derive_output_scripts(coin, addresses):
+    """Batch version of `derive_output_script`.
+
+    Addresses are split by format and each group is decoded in one batch.
+    Raise `ValueError` naming the first invalid address.
+    """
+    addresses = list(addresses)
+    bech32_idx = []
+    base58_idx = []
+    for i, address in enumerate(addresses):
+        if is_bech32_address(coin, address):
+            bech32_idx.append(i)
+        else:
+            base58_idx.append(i)
+
+    scripts = [None] * len(addresses)
+    if bech32_idx:
+        decoded = bech32_fast.decode_many(
+            coin["bech32_prefix"], (addresses[i] for i in bech32_idx)
+        )
+        for i, (witver, witprog) in zip(bech32_idx, decoded):
+            if witver is not None:
+                scripts[i] = _witness_output_script(witver, witprog)
+    if base58_idx:
+        p2pkh_version = version_to_bytes(coin["address_type"])
+        p2sh_version = version_to_bytes(coin["address_type_p2sh"])
+        decoded = base58.check_decode_many(addresses[i] for i in base58_idx)
+        for i, address_bytes in zip(base58_idx, decoded):
+            if address_bytes is not None:
+                scripts[i] = _base58_output_script(
+                    address_bytes, p2pkh_version, p2sh_version
+                )
+
+    for address, script in zip(addresses, scripts):
+        if script is None:
+            raise ValueError(f"Unrecognized address: {address}")
+    return scripts
 
 
 def script_is_p2pkh(output_script):
-    return (
-        len(output_script) == SCRIPT_LENGTH_P2PKH
-        and output_script.startswith(SCRIPT_PREFIX_P2PKH)
-        and output_script.endswith(SCRIPT_SUFFIX_P2PKH)
-    )
+    return classify(output_script).kind is ScriptKind.P2PKH
 
 
 def script_is_p2sh(output_script):
-    return (
-        len(output_script) == SCRIPT_LENGTH_P2SH
-        and output_script.startswith(SCRIPT_PREFIX_P2SH)
-        and output_script.endswith(SCRIPT_SUFFIX_P2SH)
-    )
+    return classify(output_script).kind is ScriptKind.P2SH
 
 
 def script_is_witness(output_script):
-    return (
-        # possible script lengths
-        4 <= len(output_script) <= 42
-        # first byte is OP_0 .. OP_16 (0x00 or 0x51..0x60)
-        and (output_script[0] == 0 or 0x51 <= output_script[0] <= 0x60)
-        # second byte is length of rest of data
-        and len(output_script) - 2 == output_script[1]
-    )
+    return classify(output_script).is_witness
 
 
 def get_op_return_data(output_script: bytes) -> typing.Optional[bytes]:
-    prefix_len = len(SCRIPT_PREFIX_OP_RETURN) + 1
-    try:
-        prefix, data = output_script[:prefix_len], output_script[prefix_len:]
-        if (
-            # maximum allowed (standard) OPRETURN output
-            len(output_script) <= 83
-            and prefix.startswith(SCRIPT_PREFIX_OP_RETURN)
-            # byte after prefix is length of rest
-            and len(data) == prefix[-1]
-        ):
-            return data
-
-    except Exception:
-        pass
+    classified = classify(output_script)
+    if classified.kind is not ScriptKind.OP_RETURN:
+        return None
+    return bytes(classified.payload)
 
-    return None
 
-
-def derive_address(coin, output_script: bytes) -> str:
-    if script_is_p2pkh(output_script):
-        pk_hash = output_script[len(SCRIPT_PREFIX_P2PKH) : -len(SCRIPT_SUFFIX_P2PKH)]
+def address_from_script(coin, classified) -> str:
+    """Encode the address of an already classified output script."""
+    if classified.kind is ScriptKind.P2PKH:
         version_bytes = version_to_bytes(coin["address_type"])
-        return b58check_encode(version_bytes + pk_hash)
+        return base58.check_encode(version_bytes + classified.payload)
 
-    elif script_is_p2sh(output_script):
-        script_hash = output_script[len(SCRIPT_PREFIX_P2SH) : -len(SCRIPT_SUFFIX_P2SH)]
+    elif classified.kind is ScriptKind.P2SH:
         version_bytes = version_to_bytes(coin["address_type_p2sh"])
-        return b58check_encode(version_bytes + script_hash)
+        return base58.check_encode(version_bytes + classified.payload)
 
-    elif script_is_witness(output_script):
-        witver = output_script[0] - 0x50 if output_script[0] else 0
-        witprog = output_script[2:]
-        assert len(witprog) == output_script[1], "invalid witness script"
-        return bech32.encode(coin["bech32_prefix"], witver, witprog)
+    elif classified.is_witness:
+        return bech32_fast.encode(
+            coin["bech32_prefix"], classified.witness_version, classified.payload
+        )
 
     else:
         raise ValueError("unrecognized output script")
+
+
+def derive_address(coin, output_script: bytes) -> str:
+    return address_from_script(coin, classify(output_script))
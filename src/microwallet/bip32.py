@@ -4,13 +4,110 @@ import struct
 from trezorlib.tools import HARDENED_FLAG, hash_160
 from trezorlib.messages import HDNodeType
 
-from fastecdsa.curve import secp256k1
-from fastecdsa.point import Point
-from fastecdsa.encoding.sec1 import SEC1Encoder
+from . import ec
+
+
+class Node:
+    """Public BIP32 node, used for derivation instead of `HDNodeType`.
+
+    Keeps the decoded curve point next to the compressed public key, so that
+    deriving children does not need to decode it again. The fingerprint is only
+    computed (from the parent public key) when it is requested.
+    """
+
+    __slots__ = (
+        "depth",
+        "child_num",
+        "chain_code",
+        "public_key",
+        "point",
+        "_fingerprint",
+        "_parent_key",
+    )
+
+    def __init__(
+        self,
+        depth,
+        child_num,
+        chain_code,
+        public_key,
+        point=None,
+        fingerprint=None,
+        parent_key=None,
+    ):
+        if fingerprint is None and parent_key is None:
+            raise ValueError("Either fingerprint or parent key must be provided")
+        self.depth = depth
+        self.child_num = child_num
+        self.chain_code = chain_code
+        self.public_key = public_key
+        if point is None:
+            point = ec.decode_compressed(public_key)
+        self.point = point
+        self._fingerprint = fingerprint
+        self._parent_key = parent_key
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = int.from_bytes(hash_160(self._parent_key)[:4], "big")
+        return self._fingerprint
+
+    @classmethod
+    def from_hdnode(cls, hdnode):
+        if hdnode.public_key is None:
+            raise ValueError("Public key required")
+        return cls(
+            depth=hdnode.depth,
+            child_num=hdnode.child_num,
+            chain_code=hdnode.chain_code,
+            public_key=hdnode.public_key,
+            fingerprint=hdnode.fingerprint,
+        )
+
+    def to_hdnode(self):
+        return HDNodeType(
+            depth=self.depth,
+            child_num=self.child_num,
+            chain_code=self.chain_code,
+            fingerprint=self.fingerprint,
+            public_key=self.public_key,
+        )
+
+    def _key(self):
+        return (
+            self.depth,
+            self.child_num,
+            self.chain_code,
+            self.public_key,
+            self.fingerprint,
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash((self.chain_code, self.public_key))
+
+    def __repr__(self):
+        return (
+            f"<Node depth={self.depth} child_num={self.child_num} "
+            f"public_key={self.public_key.hex()}>"
+        )
+
+
+def as_node(node):
+    """Convert `HDNodeType` to `Node`. `Node` instances are returned unchanged."""
+    if isinstance(node, Node):
+        return node
+    return Node.from_hdnode(node)
 
 
 def get_subnode(node, i):
     # Public Child key derivation (CKD) algorithm of BIP32
+    node = as_node(node)
     i_as_bytes = struct.pack(">L", i)
 
     if i & HARDENED_FLAG:
@@ -23,24 +120,72 @@ def get_subnode(node, i):
     I_left_as_exponent = int.from_bytes(I64[:32], "big")
 
     # BIP32 magic converts old public key to new public point
-    point = SEC1Encoder.decode_public_key(node.public_key, secp256k1)
-    result = I_left_as_exponent * secp256k1.G + point
+    result = ec.add_affine(ec.multiply_generator(I_left_as_exponent), node.point)
 
-    if point == Point.IDENTITY_ELEMENT:
+    if result is None:
         raise ValueError("Point cannot be INFINITY")
 
     # Convert public point to compressed public key
-    public_key = SEC1Encoder.encode_public_key(result)
+    point = ec.to_affine(result)
+    public_key = ec.encode_compressed(point)
 
-    return HDNodeType(
+    return Node(
         depth=node.depth + 1,
         child_num=i,
         chain_code=I64[32:],
-        fingerprint=hash_160(node.public_key)[:4],
         public_key=public_key,
+        point=point,
+        parent_key=node.public_key,
     )
 
 
+def get_subnodes(node, start, count):
+    """Derive `count` consecutive non-hardened children of `node`, starting at `start`.
+
+    The result is the same as `[get_subnode(node, i) for i in range(start, start +
+    count)]`, but the parent key is decoded and hashed only once, and all the
+    resulting points are converted to affine coordinates with a single shared
+    field inversion.
+    """
+    node = as_node(node)
+    if count <= 0:
+        return []
+    if (start | (start + count - 1)) & HARDENED_FLAG:
+        raise ValueError("Prime derivation not supported")
+
+    mac = hmac.HMAC(key=node.chain_code, msg=node.public_key, digestmod=hashlib.sha512)
+
+    chain_codes = []
+    points = []
+    for i in range(start, start + count):
+        child_mac = mac.copy()
+        child_mac.update(struct.pack(">L", i))
+        I64 = child_mac.digest()
+        I_left_as_exponent = int.from_bytes(I64[:32], "big")
+
+        tweak = ec.multiply_generator(I_left_as_exponent)
+        result = ec.add_affine(tweak, node.point)
+        if result is None:
+            raise ValueError("Point cannot be INFINITY")
+
+        points.append(result)
+        chain_codes.append(I64[32:])
+
+    return [
+        Node(
+            depth=node.depth + 1,
+            child_num=i,
+            chain_code=chain_code,
+            public_key=ec.encode_compressed(point),
+            point=point,
+            parent_key=node.public_key,
+        )
+        for i, chain_code, point in zip(
+            range(start, start + count), chain_codes, ec.batch_normalize(points)
+        )
+    ]
+
+
 def derive(node, path):
     for i in path:
         node = get_subnode(node, i)
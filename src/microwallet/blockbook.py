@@ -1,4 +1,5 @@
 import asyncio
+import itertools
 import json
 import logging
 import random
@@ -7,13 +8,27 @@ from urllib.parse import urlparse
 
 import websockets
 
-from . import coins
+from . import coins, exceptions
 
 LOG = logging.getLogger(__name__)
 
+XPUB_PAGE_SIZE = 1000
+HISTORY_PAGE_SIZE = 100
+AMOUNT_FIELDS = ("balance", "totalReceived", "totalSent")
+
+
+def _amounts_to_decimal(data):
+    for key in AMOUNT_FIELDS:
+        if key in data:
+            data[key] = Decimal(data[key] or 0)
+    return data
+
 
 class BlockbookWebsocketBackend:
-    def __init__(self, coin_name, url=None, ssl_context=None):
+    # getAccountInfo and getAccountUtxo accept xpubs as descriptors
+    supports_xpub_queries = True
+
+    def __init__(self, coin_name, url=None, ssl_context=None, limit=None):
         try:
             self.coin = coins.by_name[coin_name]
         except KeyError as e:
@@ -35,10 +50,14 @@ class BlockbookWebsocketBackend:
             self.url = f"wss://{parsed_url.netloc}{parsed_url.path}/websocket"
 
         self.ssl_context = ssl_context
+        # semaphore bounding requests in flight, may be shared between backends
+        self.limit = limit
         self.socket = None
         self._responder = None
         self._ws_response_cache = {}
         self._connections = 0
+        # ids are never reused, so that a late response cannot resolve a newer request
+        self._request_ids = itertools.count()
 
     async def __aenter__(self):
         if self._connections > 0:
@@ -72,8 +91,12 @@ class BlockbookWebsocketBackend:
             try:
                 response = fut.result()
                 data = json.loads(response, parse_float=Decimal)
-                to_resume = self._ws_response_cache.pop(data["id"])
-                to_resume.set_result(data)
+                to_resume = self._ws_response_cache.pop(data["id"], None)
+                if to_resume is None:
+                    # the request was cancelled, nobody is waiting for this
+                    LOG.debug(f"Dropping response to abandoned request {data['id']}")
+                elif not to_resume.done():
+                    to_resume.set_result(data)
             except Exception as e:
                 LOG.error(f"Exception when reading websocket: {e}")
 
@@ -90,34 +113,49 @@ class BlockbookWebsocketBackend:
             await self.socket.close()
             self.socket = None
             for fut in self._ws_response_cache.values():
-                fut.set_exception(RuntimeError("Connection was closed"))
+                if not fut.done():
+                    fut.set_exception(RuntimeError("Connection was closed"))
             self._ws_response_cache = {}
             self._connections = 0
         else:
             self._connections -= 1
 
     async def fetch_json(self, method, **params):
+        if self.limit is None:
+            return await self._fetch_json(method, **params)
+        async with self.limit:
+            return await self._fetch_json(method, **params)
+
+    async def _fetch_json(self, method, **params):
         if not self.socket:
             raise RuntimeError("Backend not connected")
 
         # prepare a Future that will resume when *our* response comes,
         # insert reference into response cache
         fut = asyncio.Future()
-        request_id = str(id(fut))
+        request_id = str(next(self._request_ids))
         self._ws_response_cache[request_id] = fut
 
-        # send a request packet
-        packet = dict(id=request_id, method=method, params=params)
-        packet_str = json.dumps(packet)
-        await self.socket.send(packet_str)
+        try:
+            # send a request packet
+            packet = dict(id=request_id, method=method, params=params)
+            packet_str = json.dumps(packet)
+            await self.socket.send(packet_str)
 
-        # await resumption when our response arrives
-        data = await fut
+            # await resumption when our response arrives
+            data = await fut
+        finally:
+            # a cancelled request must not leave its future behind; a late
+            # response to it is dropped by the responder
+            self._ws_response_cache.pop(request_id, None)
         if "error" in data["data"]:
-            # TODO custom exception handling
-            raise Exception(data["data"]["error"]["message"])
+            raise exceptions.BackendError(data["data"]["error"]["message"])
         return data["data"]
 
+    async def get_best_height(self):
+        info = await self.fetch_json("getInfo")
+        return int(info["bestHeight"])
+
     async def get_txdata(self, txhash):
         return await self.fetch_json("getTransactionSpecific", txid=txhash)
 
@@ -125,10 +163,94 @@ class BlockbookWebsocketBackend:
         data = await self.fetch_json(
             "getAccountInfo", descriptor=address, details="basic"
         )
-        for key in ("balance", "totalReceived", "totalSent"):
-            if key in data:
-                data[key] = Decimal(data[key] or 0)
-        return data
+        return _amounts_to_decimal(data)
+
+    async def get_xpub_info(self, xpub, tokens="used"):
+        """Get account info of an xpub, including balances of its addresses.
+
+        Addresses are listed in `tokens`, each with its derivation path. Results
+        of all pages are merged.
+        """
+
+        async def fetch_page(page):
+            return await self.fetch_json(
+                "getAccountInfo",
+                descriptor=xpub,
+                details="tokenBalances",
+                tokens=tokens,
+                page=page,
+                pageSize=XPUB_PAGE_SIZE,
+            )
+
+        result = _amounts_to_decimal(await fetch_page(1))
+        result["tokens"] = [_amounts_to_decimal(t) for t in result.get("tokens", [])]
+        seen = {token["name"] for token in result["tokens"]}
+        # the first response tells how many pages follow
+        for page in range(2, result.get("totalPages", 1) + 1):
+            data = await fetch_page(page)
+            new_tokens = [
+                _amounts_to_decimal(token)
+                for token in data.get("tokens", [])
+                if token["name"] not in seen
+            ]
+            # a page without new tokens means the rest only pages transactions
+            if not new_tokens:
+                break
+            seen.update(token["name"] for token in new_tokens)
+            result["tokens"].extend(new_tokens)
+        return result
+
+    async def get_history(
+        self, descriptor, page_size=HISTORY_PAGE_SIZE, from_height=None, to_height=None
+    ):
+        """Yield transactions of an address or xpub, newest first.
+
+        Transactions are requested `page_size` at a time, limited to blocks
+        `from_height` to `to_height` if given. The next page is fetched while
+        the current one is consumed, so at most two pages are held in memory.
+        Transactions shifted to the next page by new arrivals are not repeated.
+        """
+        params = dict(descriptor=descriptor, details="txs", pageSize=page_size)
+        if from_height is not None:
+            params["from"] = from_height
+        if to_height is not None:
+            params["to"] = to_height
+
+        def fetch(page):
+            return asyncio.ensure_future(
+                self.fetch_json("getAccountInfo", page=page, **params)
+            )
+
+        page = 1
+        next_page = fetch(page)
+        previous = set()
+        try:
+            while next_page is not None:
+                data = await next_page
+                next_page = None
+                transactions = data.get("transactions", [])
+                total_pages = data.get("totalPages", -1)
+                if total_pages >= 0:
+                    more = page < total_pages
+                else:
+                    more = len(transactions) >= page_size
+                if more and transactions:
+                    page += 1
+                    next_page = fetch(page)
+
+                current = set()
+                for tx in transactions:
+                    current.add(tx["txid"])
+                    if tx["txid"] not in previous:
+                        yield tx
+                previous = current
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+                await asyncio.gather(next_page, return_exceptions=True)
+
+    async def get_xpub_utxos(self, xpub):
+        return await self.fetch_json("getAccountUtxo", descriptor=xpub)
 
     async def get_utxos(self, address):
         return await self.fetch_json("getAccountUtxo", descriptor=address)
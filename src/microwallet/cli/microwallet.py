@@ -1,7 +1,9 @@
 """Console script for microwallet."""
 import asyncio
 import base64
+import csv
 import functools
+import json
 import os
 import ssl
 import sys
@@ -9,10 +11,25 @@ from decimal import Decimal
 
 import click
 
-from microwallet import account, account_types, coins, exceptions, trezor
+from microwallet import (
+    account,
+    account_types,
+    coins,
+    derivation,
+    discovery,
+    exceptions,
+    fleet,
+    keycache,
+    multisig,
+    ownership,
+    pool,
+    store,
+    trezor,
+)
 from microwallet.psbt import make_psbt
 from microwallet.account import SATOSHIS
-from microwallet.blockbook import BlockbookWebsocketBackend
+from microwallet.blockbook import HISTORY_PAGE_SIZE, BlockbookWebsocketBackend
+from microwallet.cli.psbtool import unparse_path
 
 DEV_BACKEND_PORTS = {
     "Bitcoin": 9130,
@@ -22,6 +39,8 @@ DEV_BACKEND_PORTS = {
     "Dogecoin": 9138,
 }
 
+EXPORT_CHUNK_SIZE = 1000
+
 SSL_UNVERIFIED_CONTEXT = ssl.SSLContext()
 SSL_UNVERIFIED_CONTEXT.verify_mode = ssl.CERT_NONE
 
@@ -87,6 +106,21 @@ def select_trezor(trezor_path):
         return trezors[0]
 
 
+def make_backend(coin_name, url=None, limit=None):
+    if int(os.environ.get("MICROWALLET_DEV_BACKEND", 0)):
+        coin_port = DEV_BACKEND_PORTS[coin_name]
+        url = f"wss://blockbook-dev.corp.sldev.cz:{coin_port}/websocket"
+        return BlockbookWebsocketBackend(
+            coin_name, url, SSL_UNVERIFIED_CONTEXT, limit=limit
+        )
+    ssl_context = (
+        SSL_UNVERIFIED_CONTEXT
+        if int(os.environ.get("MICROWALLET_INSECURE", 0))
+        else None
+    )
+    return BlockbookWebsocketBackend(coin_name, url, ssl_context, limit=limit)
+
+
 @click.group()
 # fmt: off
 @click.option("-c", "--coin-name", default="Bitcoin", help="Coin name")
@@ -94,41 +128,119 @@ def select_trezor(trezor_path):
 @click.option("-a", "--account", "account_num", type=int, default=0, help="Account number")
 @click.option("-t", "--type", "account_type", type=ChoiceType(ACCOUNT_TYPES), help="Account type")
 @click.option("-p", "--trezor-path", default=os.environ.get("TREZOR_PATH"), help="Path, label or serial number of a Trezor device")
-@click.option("-x", "--xpub", help="Use this xpub instead of retrieving an account from Trezor")
+@click.option("-x", "--xpub", multiple=True, help="Use this xpub instead of retrieving an account from Trezor (repeat for multisig cosigners)")
+@click.option("-m", "--threshold", type=int, help="Number of signatures required by a multisig account")
+@click.option("--cache-dir", type=click.Path(file_okay=False), default=str(keycache.default_cache_dir()), help="Directory for cached derived keys")
+@click.option("--no-cache", is_flag=True, help="Do not cache derived keys")
+@click.option("--scan-window", type=int, default=account.ADDRESS_DATA_WINDOW, help="Address data requests kept in flight while scanning")
+@click.option("--db", type=click.Path(dir_okay=False), default=os.environ.get("MICROWALLET_DB"), help="Wallet database for incremental sync")
+@click.option("--no-xpub-discovery", is_flag=True, help="Scan addresses one by one instead of querying the backend by xpub")
+@click.option("-w", "--workers", type=int, default=int(os.environ.get("MICROWALLET_WORKERS", 0)), help="Worker processes for key derivation (0 = derive serially)")
 @click.pass_context
 # fmt: on
-def main(ctx, coin_name, account_num, account_type, trezor_path, xpub, url):
+def main(
+    ctx,
+    coin_name,
+    account_num,
+    account_type,
+    trezor_path,
+    xpub,
+    threshold,
+    url,
+    cache_dir,
+    no_cache,
+    scan_window,
+    db,
+    no_xpub_discovery,
+    workers,
+):
     """Console script for microwallet."""
     if coin_name not in coins.by_name:
         die(f"Unknown coin: {coin_name}")
     if not account_type:
         account_type = account_types.default_account_type(coins.by_name[coin_name])
 
+    if int(os.environ.get("MICROWALLET_DEV_BACKEND", 0)) or url:
+        backend = make_backend(coin_name, url)
+    else:
+        backend = None
+
+    if workers:
+        deriver = derivation.DerivationService(workers)
+        ctx.call_on_close(deriver.close)
+    else:
+        deriver = None
+
+    def configure(acc):
+        if not no_cache:
+            acc.key_cache_dir = cache_dir
+        acc.scan_window = scan_window
+        acc.xpub_discovery = not no_xpub_discovery
+        if deriver is not None:
+            acc.deriver = deriver
+        if backend is not None:
+            acc.backend = backend
+        return acc
+
+    if ctx.invoked_subcommand == "fleet-scan":
+        # accounts come from the xpub list, one backend per coin
+        def fleet_backend(fleet_coin, limit):
+            fleet_url = url if fleet_coin == coin_name else None
+            return make_backend(fleet_coin, fleet_url, limit)
+
+        ctx.obj = (
+            None,
+            functools.partial(
+                fleet.scan_fleet,
+                make_backend=fleet_backend,
+                scan_window=scan_window,
+                xpub_discovery=not no_xpub_discovery,
+            ),
+        )
+        return
+
+    if ctx.invoked_subcommand == "discover":
+        # accounts are opened by the command, all of them on one backend
+        if xpub:
+            die("Account discovery needs a Trezor")
+        client = select_trezor(trezor_path)
+        if backend is None:
+            backend = BlockbookWebsocketBackend(coin_name)
+
+        def open_account(acc_type, number):
+            return configure(trezor.get_account(client, coin_name, number, acc_type))
+
+        ctx.obj = (
+            client,
+            functools.partial(discovery.discover_accounts, coin_name, open_account),
+        )
+        return
+
     if not xpub:
         client = select_trezor(trezor_path)
         acc = trezor.get_account(client, coin_name, account_num, account_type)
+    elif len(xpub) == 1 and not threshold:
+        client = None
+        acc = account.Account.from_xpub(coin_name, xpub[0])
     else:
+        if not threshold:
+            die("Please specify the multisig threshold")
         client = None
-        acc = account.Account.from_xpub(coin_name, xpub)
+        try:
+            acc = multisig.MultisigAccount.from_xpubs(coin_name, xpub, threshold)
+        except ValueError as e:
+            die(str(e))
 
-    if int(os.environ.get("MICROWALLET_DEV_BACKEND", 0)):
-        coin_port = DEV_BACKEND_PORTS[coin_name]
-        url = f"wss://blockbook-dev.corp.sldev.cz:{coin_port}/websocket"
-        acc.backend = BlockbookWebsocketBackend(coin_name, url, SSL_UNVERIFIED_CONTEXT)
-
-    elif url:
-        ssl_context = (
-            SSL_UNVERIFIED_CONTEXT
-            if int(os.environ.get("MICROWALLET_INSECURE", 0))
-            else None
-        )
-        acc.backend = BlockbookWebsocketBackend(coin_name, url, ssl_context)
+    configure(acc)
+    if db:
+        acc.store = store.WalletStore(db)
+        ctx.call_on_close(acc.store.close)
 
     ctx.obj = client, acc
 
 
 def async_command(func):
-    @click.command(name=func.__name__)
+    @click.command(name=func.__name__.replace("_", "-"))
     @click.pass_obj
     @functools.wraps(func)
     def wrapper(obj, *args, **kwargs):
@@ -151,15 +263,27 @@ def progress(addrs=None, txes=None):
 
 @async_command
 @click.option("-u", "--utxo", is_flag=True, help="Show individual UTXOs")
-async def show(obj, utxo):
+@click.option("-o", "--offline", is_flag=True, help="Show balance as of the last sync")
+async def show(obj, utxo, offline):
     _, account = obj
     symbol = account.coin["shortcut"]
+    if offline:
+        if account.store is None:
+            die("Please specify a wallet database with --db")
+        if not utxo:
+            total = account.store.balance(account) / SATOSHIS
+            click.echo(f"Balance: {total:f} {symbol}")
+            return
+        account.snapshot = account.store.snapshot(account, fee_rate=None)
+    elif account.store is not None:
+        await account.refresh_snapshot(progress=progress)
+        click.echo("\r\033[K", nl=False)
+
     if utxo:
         total = Decimal(0)
         async for u in account.find_utxos(progress=progress):
             val_out = u.value / SATOSHIS
-            txid = u.tx["txid"]
-            click.echo(f"{u.address.str}: {txid}:{u.vout} - {val_out:f} {symbol}")
+            click.echo(f"{u.address.str}: {u.txid}:{u.vout} - {val_out:f} {symbol}")
             total += u.value
         click.echo("\r\033[K", nl=False)
     else:
@@ -169,20 +293,204 @@ async def show(obj, utxo):
 
 
 @async_command
+@click.option(
+    "-f", "--full", is_flag=True, help="Fetch UTXOs of all funded addresses again"
+)
+async def sync(obj, full):
+    """Update the wallet database."""
+    _, account = obj
+    if account.store is None:
+        die("Please specify a wallet database with --db")
+    snapshot = await account.store.sync(account, progress=progress, full=full)
+    click.echo("\r\033[K", nl=False)
+    height = account.store.sync_height(account)
+    balance = snapshot.balance / SATOSHIS
+    click.echo(f"Synced to block {height}: {balance:f} {account.coin['shortcut']}")
+
+
+@async_command
+# fmt: off
+@click.option("-f", "--from", "from_height", type=int, help="First block height")
+@click.option("-t", "--to", "to_height", type=int, help="Last block height (resume an interrupted listing from here)")
+@click.option("-n", "--page-size", type=int, default=HISTORY_PAGE_SIZE, help="Transactions requested at a time")
+# fmt: on
+async def history(obj, from_height, to_height, page_size):
+    """List transactions of the account, newest first."""
+    _, account = obj
+    async for tx in account.history(page_size, from_height, to_height):
+        click.echo(f"{tx.get('blockHeight', 0)}\t{tx['txid']}")
+
+
+@async_command
+# fmt: off
+@click.option("-T", "--types", "type_names", multiple=True, type=ChoiceType(ACCOUNT_TYPES), help="Account type to look for (repeatable, default: all supported)")
+# fmt: on
+async def discover(obj, type_names):
+    """Find used accounts of all types."""
+    _, discover_accounts = obj
+    summaries = await discover_accounts(types=list(type_names) or None)
+    names = {t.type_id: name for name, t in ACCOUNT_TYPES.items()}
+    for summary in summaries:
+        name = names[summary.account_type.type_id]
+        symbol = summary.account.coin["shortcut"]
+        if not summary.used:
+            click.echo(f"{name} #{summary.number}: unused")
+            continue
+        balance = summary.balance / SATOSHIS
+        click.echo(
+            f"{name} #{summary.number}: {summary.active_addresses} addresses, "
+            f"{balance:f} {symbol}"
+        )
+
+
+@async_command
+# fmt: off
+@click.option("-u", "--utxo", is_flag=True, help="Count UTXOs, totalling them as the balance")
+@click.option("-r", "--max-requests", type=int, default=fleet.FLEET_MAX_REQUESTS, help="Backend requests in flight across all coins")
+@click.option("-n", "--max-accounts", type=int, default=fleet.FLEET_MAX_ACCOUNTS, help="Accounts scanned at the same time")
+@click.argument("xpub_file", type=click.File("r"))
+# fmt: on
+async def fleet_scan(obj, utxo, max_requests, max_accounts, xpub_file):
+    """Scan accounts of many xpubs listed with their coin names in a file."""
+    _, scan_fleet = obj
+    try:
+        entries = list(fleet.read_fleet(xpub_file))
+    except ValueError as e:
+        die(str(e))
+
+    stats = fleet.FleetStats()
+    async for result in scan_fleet(
+        entries, max_requests=max_requests, max_accounts=max_accounts, utxos=utxo
+    ):
+        stats.add(result)
+        entry = result.entry
+        if not result.ok:
+            click.echo(
+                f"{entry.line}\t{entry.coin_name}\t{entry.xpub}\terror: {result.error}"
+            )
+            continue
+        symbol = coins.by_name[entry.coin_name]["shortcut"]
+        balance = result.balance / SATOSHIS
+        line = f"{entry.line}\t{entry.coin_name}\t{entry.xpub}\t{balance:f} {symbol}"
+        if result.utxos is not None:
+            line += f"\t{result.utxos} UTXOs"
+        click.echo(line)
+
+    click.echo(
+        f"Scanned {stats.scanned} xpubs ({stats.failed} failed) "
+        f"in {stats.elapsed:.1f} s: {stats.xpubs_per_minute:.1f} xpubs/minute",
+        err=True,
+    )
+
+
+@main.command()
+# fmt: off
+@click.option("-s", "--start", type=int, default=0, help="First address index")
+@click.option("-n", "--count", type=int, required=True, help="Number of addresses")
+@click.option("-C", "--change", is_flag=True, help="Export change addresses")
+@click.option("-f", "--format", "output_format", type=click.Choice(["csv", "ndjson"]), default="csv", help="Output format")
+@click.option("-o", "--output", type=click.File("w"), default="-", help="Output file")
+# fmt: on
+@click.pass_obj
+def addresses(obj, start, count, change, output_format, output):
+    """Export a range of addresses with their paths and public keys.
+
+    Multisig addresses come with their witness scripts instead.
+    """
+    _, account = obj
+    if isinstance(account, multisig.MultisigAccount):
+        columns = ("path", "address", "witness_script")
+    else:
+        columns = ("path", "address", "public_key")
+    if output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(columns)
+
+    end = start + count
+    for chunk_start in range(start, end, EXPORT_CHUNK_SIZE):
+        chunk_size = min(EXPORT_CHUNK_SIZE, end - chunk_start)
+        batch = account.address_range(chunk_start, chunk_size, change)
+        for path, address, key_material in batch:
+            row = unparse_path(path), address, key_material.hex()
+            if output_format == "csv":
+                writer.writerow(row)
+            else:
+                record = dict(zip(columns, row))
+                output.write(json.dumps(record) + "\n")
+
+
+@main.command(name="ownership-index")
+# fmt: off
+@click.option("-n", "--lookahead", type=int, default=ownership.DEFAULT_LOOKAHEAD, help="Addresses per chain")
+@click.option("-i", "--index", "index_file", type=click.Path(dir_okay=False), required=True, help="Index file to create or extend")
+# fmt: on
+@click.pass_obj
+def ownership_index(obj, lookahead, index_file):
+    """Add the account to a scriptPubKey ownership index file."""
+    client, account = obj
+    if os.path.exists(index_file):
+        index = ownership.OwnershipIndex.load(index_file)
+    else:
+        index = ownership.OwnershipIndex()
+    fingerprint = trezor.get_master_fingerprint(client) if client else None
+    index.add_account(account, lookahead, fingerprint=fingerprint)
+    index.save(index_file)
+    click.echo(f"{len(index)} scripts in index")
+
+
+@async_command
+# fmt: off
 @click.option("-s/-S", "--show/--no-show", help="Display address on Trezor")
-async def receive(obj, show):
+@click.option("-r", "--reserve", is_flag=True, help="Reserve a fresh address from the lookahead pool in the wallet database")
+# fmt: on
+async def receive(obj, show, reserve):
     client, account = obj
-    address = await account.get_unused_address()
+    if reserve:
+        if account.store is None:
+            die("Please specify a wallet database with --db")
+        address_pool = pool.AddressPool(account)
+        try:
+            address = await address_pool.get_address()
+        except exceptions.AddressPoolExhausted as e:
+            die(str(e))
+    else:
+        address_pool = None
+        address = await account.get_unused_address()
     click.echo(address.str)
     if client and show:
         trezor.show_address(client, account, address)
+    if address_pool is not None:
+        # the address is out already, top up the pool before exiting
+        await address_pool.wait_refill()
+
+
+@async_command
+@click.argument("index", type=int)
+async def release(obj, index):
+    """Return a reserved receive address to the lookahead pool."""
+    _, account = obj
+    if account.store is None:
+        die("Please specify a wallet database with --db")
+    try:
+        released = await pool.AddressPool(account).release(index)
+    except ValueError as e:
+        die(str(e))
+    if not released:
+        die("The address has received funds in the meantime")
 
 
 async def do_fund(account, address, amount, verbose):
+    if isinstance(account, multisig.MultisigAccount):
+        die("Spending from multisig accounts is not supported")
+    # a single discovery pass answers UTXOs, fee rate and the change address
+    await account.refresh_snapshot(progress=progress)
+    click.echo("\r\033[K", nl=False)
     try:
         utxos, change = await account.fund_tx([(address, amount)])
     except exceptions.InsufficientFunds:
         die("Insufficient funds")
+    # signing and PSBTs need the parent transactions of spent outputs
+    await account.load_transactions(utxos)
 
     if verbose:
         symbol = account.coin["shortcut"]
@@ -191,7 +499,7 @@ async def do_fund(account, address, amount, verbose):
         total_out = amount + Decimal(change or 0)
         for u in utxos:
             am_out = u.value / SATOSHIS
-            click.echo(f"{u.tx['txid']}:{u.vout} - {am_out:f} {symbol}", err=True)
+            click.echo(f"{u.txid}:{u.vout} - {am_out:f} {symbol}", err=True)
             total_in += u.value
         fee_rate = await account.estimate_fee()
         actual_fee = total_in - total_out
@@ -12,6 +12,7 @@ from trezorlib.tools import HARDENED_FLAG
 from microwallet.formats import psbt
 from microwallet.psbt import trezor
 from microwallet import coins
+from microwallet.ownership import OwnershipIndex
 
 
 def unparse_path(address_n):
@@ -117,7 +118,8 @@ def psbt_read(psbt_base64, psbt_file):
 @click.argument("psbt_base64", required=False)
 @click.option("-f", "--file", "psbt_file", type=click.File("rb"))
 @click.option("-c", "--coin-name", default="Bitcoin")
-def to_json(psbt_base64, psbt_file, coin_name):
+@click.option("-i", "--ownership-index", type=click.Path(exists=True, dir_okay=False))
+def to_json(psbt_base64, psbt_file, coin_name, ownership_index):
     """Convert PSBT to Trezor-compatible JSON transaction.
     
     You can use `trezorctl btc sign-tx <file>` to sign it."""
@@ -125,6 +127,7 @@ def to_json(psbt_base64, psbt_file, coin_name):
     header, inputs, outputs = psbt.read_psbt(psbt_bytes)
 
     coin = coins.by_name[coin_name]
+    ownership = OwnershipIndex.load(ownership_index) if ownership_index else None
 
     fingerprints = set()
     for inout in inputs + outputs:
@@ -166,7 +169,9 @@ def to_json(psbt_base64, psbt_file, coin_name):
 
     for i, (tx_out, psbt_out) in enumerate(zip(header.transaction.outputs, outputs), 1):
         try:
-            trezor_out = trezor.make_output(tx_out, psbt_out, master_fingerprint, coin)
+            trezor_out = trezor.make_output(
+                tx_out, psbt_out, master_fingerprint, coin, ownership
+            )
             trezor_outputs.append(trezor_out)
         except Exception as e:
             raise click.ClickException(f"In output #{i}: {e}") from e
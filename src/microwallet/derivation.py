@@ -0,0 +1,73 @@
+"""Derivation of address chunks outside of the asyncio event loop."""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .bip32 import get_subnodes
+
+DEFAULT_CHUNK_SIZE = 100
+
+
+def derive_chunk(node, start, count, address_encoder):
+    """Derive `(public_key, address)` pairs for children `start .. start + count`.
+
+    Module-level function so that it can be sent to worker processes.
+    """
+    return [
+        (n.public_key, address_encoder(n.public_key))
+        for n in get_subnodes(node, start, count)
+    ]
+
+
+def derive_public_keys(node, start, count):
+    """Derive public keys of children `start .. start + count`."""
+    return [n.public_key for n in get_subnodes(node, start, count)]
+
+
+class DerivationService:
+    """Derives address chunks in a pool of worker processes.
+
+    With `workers=0`, chunks are derived serially in the calling thread instead.
+    `workers=None` uses one worker per CPU. The pool is started on first use.
+    """
+
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 0:
+            raise ValueError("Number of workers must not be negative")
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor = None
+
+    @property
+    def prefetch(self):
+        """Number of chunks worth keeping in flight."""
+        return max(1, self.workers)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, func, *args):
+        """Run a picklable module-level function in the pool."""
+        if self.workers == 0:
+            return func(*args)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def derive(self, node, start, count, address_encoder):
+        return await self.run(derive_chunk, node, start, count, address_encoder)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,76 @@
+"""Discovery of used accounts across account numbers and script types."""
+import asyncio
+from decimal import Decimal
+
+import attr
+
+from . import account_types, coins
+from .account import Account, cancel_all
+
+
+@attr.s(auto_attribs=True)
+class AccountSummary:
+    account: Account
+    number: int
+    active_addresses: int
+    balance: Decimal
+
+    @property
+    def account_type(self):
+        return self.account.account_type
+
+    @property
+    def used(self):
+        return self.active_addresses > 0
+
+
+def supported_account_types(coin_name):
+    coin = coins.by_name[coin_name]
+    result = [account_types.ACCOUNT_TYPE_LEGACY]
+    if coin["segwit"]:
+        result.append(account_types.ACCOUNT_TYPE_DEFAULT)
+        if coin.get("bech32_prefix"):
+            result.append(account_types.ACCOUNT_TYPE_SEGWIT)
+    return result
+
+
+async def summarize(account, number):
+    addresses = [address async for address in account.active_addresses()]
+    balance = Decimal(sum(address.balance for address in addresses))
+    return AccountSummary(account, number, len(addresses), balance)
+
+
+async def _discover_type(open_account, account_type, first):
+    summaries = [await summarize(first, 0)]
+    while summaries[-1].used:
+        number = summaries[-1].number + 1
+        account = open_account(account_type, number)
+        summaries.append(await summarize(account, number))
+    return summaries
+
+
+async def discover_accounts(coin_name, open_account, types=None):
+    """Find used accounts of all `types`, scanning the types concurrently.
+
+    `open_account(account_type, number)` returns an `Account`. Account numbers
+    of every type are walked from zero up to the first unused account, which is
+    included in the result. The backend of the first account stays connected
+    for the whole discovery, so accounts sharing it share one connection.
+
+    Return a list of `AccountSummary` records, ordered by type and number.
+    """
+    if types is None:
+        types = supported_account_types(coin_name)
+    first = [open_account(account_type, 0) for account_type in types]
+
+    async with first[0].backend:
+        tasks = [
+            asyncio.ensure_future(_discover_type(open_account, account_type, account))
+            for account_type, account in zip(types, first)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            await cancel_all(tasks)
+
+    return [summary for summaries in results for summary in summaries]
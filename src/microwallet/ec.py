@@ -0,0 +1,290 @@
+"""Pure-Python secp256k1 point arithmetic for batched public derivation.
+
+Points are handled in Jacobian coordinates `(X, Y, Z)`, representing the affine
+point `(X / Z^2, Y / Z^3)`, so that additions do not need a field inversion.
+The point at infinity is represented by `None`. Conversion back to affine
+coordinates is done for many points at once, sharing a single inversion.
+"""
+import hashlib
+import os
+import random
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+from fastecdsa.curve import secp256k1
+
+P = secp256k1.p
+N = secp256k1.q
+G = (secp256k1.G.x, secp256k1.G.y)
+
+WINDOW_BITS = 8
+WINDOWS = 256 // WINDOW_BITS
+WINDOW_MASK = (1 << WINDOW_BITS) - 1
+
+GENERATOR_TABLE_ENV = "MICROWALLET_GENERATOR_TABLE"
+GENERATOR_TABLE_MAGIC = b"MWGT\x01"
+# entries compared with fastecdsa when a table is loaded
+GENERATOR_TABLE_SPOT_CHECKS = 8
+
+AffinePoint = Tuple[int, int]
+JacobianPoint = Tuple[int, int, int]
+
+
+if sys.version_info >= (3, 8):
+
+    def inverse(x: int) -> int:
+        """Modular inverse in the base field."""
+        return pow(x, -1, P)
+
+
+else:
+    # three-argument pow() does not accept negative exponents before Python 3.8
+    def inverse(x: int) -> int:
+        """Modular inverse in the base field."""
+        return pow(x, P - 2, P)
+
+
+def double(point: Optional[JacobianPoint]) -> Optional[JacobianPoint]:
+    if point is None:
+        return None
+    X, Y, Z = point
+    if Y == 0:
+        return None
+    YY = Y * Y % P
+    S = 4 * X * YY % P
+    M = 3 * X * X % P
+    X3 = (M * M - 2 * S) % P
+    Y3 = (M * (S - X3) - 8 * YY * YY) % P
+    Z3 = 2 * Y * Z % P
+    return X3, Y3, Z3
+
+
+def add_affine(
+    point: Optional[JacobianPoint], other: AffinePoint
+) -> Optional[JacobianPoint]:
+    """Add an affine point to a Jacobian point ("mixed" addition)."""
+    x2, y2 = other
+    if point is None:
+        return x2, y2, 1
+    X1, Y1, Z1 = point
+    Z1Z1 = Z1 * Z1 % P
+    H = (x2 * Z1Z1 - X1) % P
+    R = (y2 * Z1 * Z1Z1 - Y1) % P
+    if H == 0:
+        if R == 0:
+            return double(point)
+        return None
+
+    HH = H * H % P
+    HHH = H * HH % P
+    V = X1 * HH % P
+    X3 = (R * R - HHH - 2 * V) % P
+    Y3 = (R * (V - X3) - Y1 * HHH) % P
+    Z3 = Z1 * H % P
+    return X3, Y3, Z3
+
+
+def batch_normalize(points: Sequence[JacobianPoint]) -> List[AffinePoint]:
+    """Convert Jacobian points to affine, using Montgomery's batch inversion.
+
+    Only one field inversion is performed for the whole batch; every point costs
+    a handful of multiplications on top of that.
+    """
+    if not points:
+        return []
+
+    prefixes = []
+    acc = 1
+    for _, _, Z in points:
+        prefixes.append(acc)
+        acc = acc * Z % P
+
+    acc_inv = inverse(acc)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        z_inv = acc_inv * prefixes[i] % P
+        acc_inv = acc_inv * Z % P
+        z_inv2 = z_inv * z_inv % P
+        result[i] = X * z_inv2 % P, Y * z_inv2 * z_inv % P
+    return result
+
+
+def to_affine(point: JacobianPoint) -> AffinePoint:
+    return batch_normalize([point])[0]
+
+
+def decode_compressed(public_key: bytes) -> AffinePoint:
+    """Decode a SEC1 compressed public key to an affine point."""
+    if len(public_key) != 33 or public_key[0] not in (2, 3):
+        raise ValueError("Invalid compressed public key")
+    x = int.from_bytes(public_key[1:], "big")
+    if x >= P:
+        raise ValueError("Invalid compressed public key")
+    y_squared = (pow(x, 3, P) + 7) % P
+    # P = 3 mod 4, so the square root is a single exponentiation
+    y = pow(y_squared, (P + 1) // 4, P)
+    if y * y % P != y_squared:
+        raise ValueError("Public key is not on the curve")
+    if y & 1 != public_key[0] & 1:
+        y = P - y
+    return x, y
+
+
+def encode_compressed(point: AffinePoint) -> bytes:
+    """SEC1 compressed encoding of an affine point."""
+    x, y = point
+    prefix = b"\x03" if y & 1 else b"\x02"
+    return prefix + x.to_bytes(32, "big")
+
+
+class GeneratorTable:
+    """Fixed-base multiplication table for the secp256k1 generator.
+
+    The scalar is split into 8-bit windows. For every window `j`, the table holds
+    the affine points `m * 2^(8j) * G` for `m = 1..255`, so a multiplication is
+    at most 32 mixed additions and no doublings at all.
+    """
+
+    def __init__(self, rows: List[List[AffinePoint]]) -> None:
+        if len(rows) != WINDOWS or any(len(row) != WINDOW_MASK for row in rows):
+            raise ValueError("Invalid generator table shape")
+        # index 0 stands for a zero digit, which is skipped during multiplication
+        self.rows = [[None] + row for row in rows]
+
+    @classmethod
+    def build(cls) -> "GeneratorTable":
+        rows = []
+        base = G
+        for _ in range(WINDOWS):
+            multiples = [(base[0], base[1], 1)]
+            for _ in range(WINDOW_MASK):
+                multiples.append(add_affine(multiples[-1], base))
+            # the last entry is 256 * base, i.e., the base of the next window
+            *row, base = batch_normalize(multiples)
+            rows.append(row)
+        return cls(rows)
+
+    def multiply(self, k: int) -> Optional[JacobianPoint]:
+        """Compute `k * G` in Jacobian coordinates."""
+        k %= N
+        result = None
+        for row in self.rows:
+            digit = k & WINDOW_MASK
+            if digit:
+                result = add_affine(result, row[digit])
+            k >>= WINDOW_BITS
+        return result
+
+    def to_bytes(self) -> bytes:
+        payload = b"".join(
+            x.to_bytes(32, "big") + y.to_bytes(32, "big")
+            for row in self.rows
+            for x, y in row[1:]
+        )
+        return GENERATOR_TABLE_MAGIC + hashlib.sha256(payload).digest() + payload
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "GeneratorTable":
+        header_len = len(GENERATOR_TABLE_MAGIC) + 32
+        magic = data[: len(GENERATOR_TABLE_MAGIC)]
+        digest = data[len(GENERATOR_TABLE_MAGIC) : header_len]
+        payload = data[header_len:]
+        if magic != GENERATOR_TABLE_MAGIC:
+            raise ValueError("Not a generator table")
+        if len(payload) != WINDOWS * WINDOW_MASK * 64:
+            raise ValueError("Invalid generator table length")
+        if hashlib.sha256(payload).digest() != digest:
+            raise ValueError("Generator table checksum mismatch")
+
+        points = [
+            (
+                int.from_bytes(payload[i : i + 32], "big"),
+                int.from_bytes(payload[i + 32 : i + 64], "big"),
+            )
+            for i in range(0, len(payload), 64)
+        ]
+        rows = [points[i : i + WINDOW_MASK] for i in range(0, len(points), WINDOW_MASK)]
+        table = cls(rows)
+        table.verify()
+        return table
+
+    def verify(self) -> None:
+        """Check the table against independently computed points.
+
+        The checksum of a table file only guards against accidental damage. Here,
+        the row bases must form the doubling chain `256^j * G`, the last entry of
+        every row plus its base must give the next base, every point must lie on
+        the curve, and a few random entries must match a multiplication done by
+        fastecdsa. Raise `ValueError` otherwise.
+        """
+        chain = []
+        point = (G[0], G[1], 1)
+        for _ in range(WINDOWS + 1):
+            chain.append(point)
+            for _ in range(WINDOW_BITS):
+                point = double(point)
+        chain = batch_normalize(chain)
+        if chain[:-1] != [row[1] for row in self.rows]:
+            raise ValueError("Generator table does not match secp256k1")
+        next_bases = [add_affine(row[-1] + (1,), row[1]) for row in self.rows]
+        if batch_normalize(next_bases) != chain[1:]:
+            raise ValueError("Generator table does not match secp256k1")
+
+        for row in self.rows:
+            for x, y in row[1:]:
+                if (y * y - x * x * x - 7) % P:
+                    raise ValueError("Generator table point is not on the curve")
+
+        rng = random.SystemRandom()
+        for _ in range(GENERATOR_TABLE_SPOT_CHECKS):
+            j, m = rng.randrange(WINDOWS), rng.randrange(2, WINDOW_MASK)
+            expected = (m << (WINDOW_BITS * j)) * secp256k1.G
+            if self.rows[j][m] != (expected.x, expected.y):
+                raise ValueError("Generator table does not match secp256k1")
+
+    @classmethod
+    def load(cls, path: str) -> "GeneratorTable":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+
+_generator_table = None
+
+
+def generator_table() -> GeneratorTable:
+    """Return the process-wide generator table, building it on first use.
+
+    If the `MICROWALLET_GENERATOR_TABLE` environment variable names a file, the
+    table is loaded from it, or built and stored there if the file is missing or
+    invalid.
+    """
+    global _generator_table
+    if _generator_table is not None:
+        return _generator_table
+
+    path = os.environ.get(GENERATOR_TABLE_ENV)
+    if path:
+        try:
+            _generator_table = GeneratorTable.load(path)
+            return _generator_table
+        except (OSError, ValueError):
+            pass
+
+    _generator_table = GeneratorTable.build()
+    if path:
+        try:
+            _generator_table.save(path)
+        except OSError:
+            pass
+    return _generator_table
+
+
+def multiply_generator(k: int) -> Optional[JacobianPoint]:
+    return generator_table().multiply(k)
@@ -1,2 +1,10 @@
 class InsufficientFunds(Exception):
     pass
+
+
+class AddressPoolExhausted(Exception):
+    pass
+
+
+class BackendError(Exception):
+    pass
@@ -0,0 +1,159 @@
+"""Scanning of many watch-only accounts on one event loop."""
+import asyncio
+import time
+import typing
+from decimal import Decimal
+
+import attr
+
+from . import coins
+from .account import Account, cancel_all
+
+FLEET_MAX_REQUESTS = 200
+FLEET_MAX_ACCOUNTS = 50
+
+
+@attr.s(auto_attribs=True)
+class FleetEntry:
+    line: int
+    coin_name: str
+    xpub: str
+
+
+@attr.s(auto_attribs=True)
+class FleetResult:
+    entry: FleetEntry
+    balance: typing.Optional[Decimal] = None
+    utxos: typing.Optional[int] = None
+    error: typing.Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+@attr.s(auto_attribs=True)
+class FleetStats:
+    scanned: int = 0
+    failed: int = 0
+    started: float = attr.Factory(time.monotonic)
+    finished: typing.Optional[float] = None
+
+    def add(self, result):
+        self.scanned += 1
+        if not result.ok:
+            self.failed += 1
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    @property
+    def xpubs_per_minute(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.scanned * 60 / self.elapsed
+
+
+def read_fleet(lines):
+    """Parse `coin_name xpub` lines into `FleetEntry` records.
+
+    Fields are separated by whitespace or a comma. Empty lines and lines
+    starting with `#` are skipped.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.replace(",", " ").split()
+        if len(fields) != 2:
+            raise ValueError(f"Line {number}: expected coin name and xpub")
+        coin_name, xpubstr = fields
+        if coin_name not in coins.by_name:
+            raise ValueError(f"Line {number}: unknown coin: {coin_name}")
+        yield FleetEntry(number, coin_name, xpubstr)
+
+
+async def scan_account(entry, backend, utxos=False, **account_kwargs):
+    """Scan the account of one `entry`, turning any failure into the result."""
+    started = time.monotonic()
+    result = FleetResult(entry)
+    try:
+        account = Account.from_xpub(
+            entry.coin_name, entry.xpub, backend=backend, **account_kwargs
+        )
+        if utxos:
+            found = [utxo async for utxo in account.find_utxos()]
+            result.utxos = len(found)
+            result.balance = Decimal(sum(utxo.value for utxo in found))
+        else:
+            result.balance = await account.balance()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        result.error = str(e) or type(e).__name__
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+async def scan_fleet(
+    entries,
+    make_backend,
+    max_requests=FLEET_MAX_REQUESTS,
+    max_accounts=FLEET_MAX_ACCOUNTS,
+    utxos=False,
+    **account_kwargs,
+):
+    """Scan accounts of `entries`, yielding a `FleetResult` as each one finishes.
+
+    `make_backend(coin_name, limit)` is called once per coin. Its backend stays
+    connected for the whole scan and must hold `limit`, a semaphore shared by
+    all backends, to at most `max_requests` requests in flight. Up to
+    `max_accounts` accounts are scanned at the same time. If the backend of a
+    coin cannot connect, all its accounts are reported as failed.
+    """
+    limit = asyncio.Semaphore(max_requests)
+    backends = {}
+    failures = {}
+    pending = set()
+    entries = iter(entries)
+
+    async def backend_for(coin_name):
+        """Connected backend of a coin, or None if it could not connect."""
+        if coin_name not in backends and coin_name not in failures:
+            try:
+                backend = make_backend(coin_name, limit)
+                await backend.__aenter__()
+            except Exception as e:
+                # every account of the coin fails, the other coins go on
+                error = str(e) or type(e).__name__
+                failures[coin_name] = f"Backend unavailable: {error}"
+            else:
+                backends[coin_name] = backend
+        return backends.get(coin_name)
+
+    try:
+        while True:
+            for entry in entries:
+                backend = await backend_for(entry.coin_name)
+                if backend is None:
+                    yield FleetResult(entry, error=failures[entry.coin_name])
+                    continue
+                scan = scan_account(entry, backend, utxos, **account_kwargs)
+                pending.add(asyncio.ensure_future(scan))
+                if len(pending) >= max_accounts:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for fut in done:
+                yield fut.result()
+    finally:
+        await cancel_all(pending)
+        for backend in backends.values():
+            await backend.__aexit__(None, None, None)
@@ -0,0 +1,118 @@
+"""Base58 and Base58Check codec.
+
+Compatible with the codec in `trezorlib.tools`, but the big-number arithmetic
+is done in chunks of ten base58 digits: one big-integer division or
+multiplication per chunk, and small-integer arithmetic on digit pairs inside
+it.
+"""
+import hashlib
+
+ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BASE = len(ALPHABET)
+
+CHUNK_DIGITS = 10
+PAIR_BASE = BASE * BASE
+CHUNK_BASE = PAIR_BASE ** 5
+
+CHECKSUM_LENGTH = 4
+
+_DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+_PAIRS = [a + b for a in ALPHABET for b in ALPHABET]
+_PAIR_DIGITS = {pair: value for value, pair in enumerate(_PAIRS)}
+
+
+def encode(data):
+    """Encode bytes to a base58 string."""
+    value = int.from_bytes(data, "big")
+    pairs = _PAIRS
+    out = []
+    append = out.append
+    while value:
+        value, chunk = divmod(value, CHUNK_BASE)
+        chunk, pair = divmod(chunk, PAIR_BASE)
+        append(pairs[pair])
+        chunk, pair = divmod(chunk, PAIR_BASE)
+        append(pairs[pair])
+        chunk, pair = divmod(chunk, PAIR_BASE)
+        append(pairs[pair])
+        chunk, pair = divmod(chunk, PAIR_BASE)
+        append(pairs[pair])
+        append(pairs[chunk])
+    out.reverse()
+    zeros = len(data) - len(data.lstrip(b"\0"))
+    return ALPHABET[0] * zeros + "".join(out).lstrip(ALPHABET[0])
+
+
+def decode(string, length=None):
+    """Decode a base58 string to bytes.
+
+    Raise `ValueError` for characters outside the alphabet. If `length` is
+    given and the result has a different length, return None.
+    """
+    if isinstance(string, bytes):
+        string = string.decode()
+    pairs = _PAIR_DIGITS
+    size = len(string)
+    head = size % CHUNK_DIGITS
+    value = 0
+    try:
+        for char in string[:head]:
+            value = value * BASE + _DIGITS[char]
+        for i in range(head, size, CHUNK_DIGITS):
+            chunk = pairs[string[i : i + 2]]
+            chunk = chunk * PAIR_BASE + pairs[string[i + 2 : i + 4]]
+            chunk = chunk * PAIR_BASE + pairs[string[i + 4 : i + 6]]
+            chunk = chunk * PAIR_BASE + pairs[string[i + 6 : i + 8]]
+            chunk = chunk * PAIR_BASE + pairs[string[i + 8 : i + 10]]
+            value = value * CHUNK_BASE + chunk
+    except KeyError:
+        raise ValueError("invalid Base58 string") from None
+
+    zeros = size - len(string.lstrip(ALPHABET[0]))
+    result = b"\0" * zeros + value.to_bytes((value.bit_length() + 7) // 8, "big")
+    if length is not None and len(result) != length:
+        return None
+    return result
+
+
+def checksum(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:CHECKSUM_LENGTH]
+
+
+def check_encode(data):
+    """Encode bytes to a base58 string with a checksum."""
+    return encode(data + checksum(data))
+
+
+def check_decode(string, length=None):
+    """Decode a base58 string with a checksum.
+
+    Raise `ValueError` if the string is invalid or the checksum does not match.
+    """
+    decoded = decode(string, length)
+    if decoded is None:
+        raise ValueError("invalid length")
+    data, check = decoded[:-CHECKSUM_LENGTH], decoded[-CHECKSUM_LENGTH:]
+    if checksum(data) != check:
+        raise ValueError("invalid checksum")
+    return data
+
+
+def check_encode_many(items):
+    """Encode an iterable of bytes to a list of base58check strings."""
+    return [check_encode(data) for data in items]
+
+
+def check_decode_many(strings):
+    """Decode an iterable of base58check strings to a list of bytes.
+
+    Invalid strings are decoded to None instead of raising, so that one bad
+    entry does not abort the whole batch.
+    """
+    result = []
+    for string in strings:
+        try:
+            result.append(check_decode(string))
+        except ValueError:
+            result.append(None)
+    return result
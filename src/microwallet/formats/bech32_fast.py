@@ -0,0 +1,160 @@
+"""Table-driven Bech32 codec for segwit addresses.
+
+Behaves like the reference implementation in `bech32`, but works on bytes:
+5-bit groups are produced and consumed through the base32 codec of the standard
+library and translation tables, and the checksum is computed ten bits at a time
+from a precomputed table.
+"""
+import base64
+import functools
+
+from .bech32 import CHARSET, bech32_hrp_expand
+
+MAX_LENGTH = 90
+CHECKSUM_LENGTH = 6
+
+_RFC4648_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+_VALUES = bytes(range(32))
+
+# 5-bit values <-> characters of the bech32 and RFC 4648 alphabets
+_RFC4648_TO_VALUES = bytes.maketrans(_RFC4648_ALPHABET, _VALUES)
+_VALUES_TO_RFC4648 = bytes.maketrans(_VALUES, _RFC4648_ALPHABET)
+_VALUES_TO_CHARSET = bytes.maketrans(_VALUES, CHARSET.encode())
+_INVALID = 0xFF
+_CHARSET_TO_VALUES = bytearray([_INVALID] * 256)
+for _value, _char in enumerate(CHARSET.encode()):
+    _CHARSET_TO_VALUES[_char] = _value
+_CHARSET_TO_VALUES = bytes(_CHARSET_TO_VALUES)
+
+
+GENERATOR = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+
+
+def _polymod_table(steps):
+    # The checksum step is linear, so the contribution of the top bits of the
+    # state over several steps can be tabulated.
+    shift = 30 - 5 * steps
+    table = []
+    for top in range(1 << 5 * steps):
+        chk = top << shift
+        for _ in range(steps):
+            bits = chk >> 25
+            chk = (chk & 0x1FFFFFF) << 5
+            for i, gen in enumerate(GENERATOR):
+                if (bits >> i) & 1:
+                    chk ^= gen
+        table.append(chk)
+    return tuple(table)
+
+
+POLYMOD_TABLE_1 = _polymod_table(1)
+POLYMOD_TABLE_2 = _polymod_table(2)
+
+
+def polymod(values, chk=1):
+    """Bech32 checksum of a sequence of 5-bit values, starting from state `chk`."""
+    table = POLYMOD_TABLE_2
+    it = iter(values)
+    for hi in it:
+        lo = next(it, None)
+        if lo is None:
+            # odd number of values, single step for the last one
+            return (chk & 0x1FFFFFF) << 5 ^ hi ^ POLYMOD_TABLE_1[chk >> 25]
+        chk = (chk & 0xFFFFF) << 10 ^ (hi << 5 | lo) ^ table[chk >> 20]
+    return chk
+
+
+@functools.lru_cache(maxsize=16)
+def _hrp_state(hrp):
+    return polymod(bech32_hrp_expand(hrp))
+
+
+def to_values(data):
+    """Convert bytes to 5-bit values, zero-padding the last group."""
+    encoded = base64.b32encode(data).rstrip(b"=")
+    return encoded.translate(_RFC4648_TO_VALUES)
+
+
+def from_values(values):
+    """Convert 5-bit values to bytes. Return None for invalid padding."""
+    leftover = len(values) * 5 % 8
+    if leftover >= 5:
+        return None
+    if leftover and values[-1] & ((1 << leftover) - 1):
+        return None
+    encoded = values.translate(_VALUES_TO_RFC4648)
+    encoded += b"=" * (-len(encoded) % 8)
+    return base64.b32decode(encoded)
+
+
+def bech32_encode(hrp, values):
+    """Compute a Bech32 string given HRP and data values as bytes."""
+    chk = polymod(values, _hrp_state(hrp))
+    chk = polymod(b"\0" * CHECKSUM_LENGTH, chk) ^ 1
+    checksum = bytes((chk >> 5 * (5 - i)) & 31 for i in range(CHECKSUM_LENGTH))
+    return hrp + "1" + (values + checksum).translate(_VALUES_TO_CHARSET).decode()
+
+
+def bech32_decode(bech):
+    """Validate a Bech32 string, and determine HRP and data values as bytes."""
+    if len(bech) > MAX_LENGTH:
+        return (None, None)
+    try:
+        bech_bytes = bech.encode("ascii")
+    except UnicodeEncodeError:
+        return (None, None)
+    if min(bech_bytes, default=0) < 33 or max(bech_bytes, default=0) > 126:
+        return (None, None)
+    lower = bech_bytes.lower()
+    if lower != bech_bytes and bech_bytes.upper() != bech_bytes:
+        return (None, None)
+    pos = lower.rfind(b"1")
+    if pos < 1 or pos + 7 > len(lower):
+        return (None, None)
+    values = lower[pos + 1 :].translate(_CHARSET_TO_VALUES)
+    if _INVALID in values:
+        return (None, None)
+    hrp = lower[:pos].decode()
+    if polymod(values, _hrp_state(hrp)) != 1:
+        return (None, None)
+    return (hrp, values[:-CHECKSUM_LENGTH])
+
+
+def _check_program(witver, witprog):
+    if witver > 16 or not 2 <= len(witprog) <= 40:
+        return False
+    return witver != 0 or len(witprog) in (20, 32)
+
+
+def decode(hrp, addr):
+    """Decode a segwit address."""
+    hrpgot, values = bech32_decode(addr)
+    if hrpgot != hrp:
+        return (None, None)
+    if not values:
+        return (None, None)
+    witver = values[0]
+    witprog = from_values(values[1:])
+    if witprog is None or not _check_program(witver, witprog):
+        return (None, None)
+    return (witver, witprog)
+
+
+def encode(hrp, witver, witprog):
+    """Encode a segwit address."""
+    if not 0 <= witver <= 16 or not _check_program(witver, witprog):
+        return None
+    ret = bech32_encode(hrp, bytes((witver,)) + to_values(witprog))
+    if len(ret) > MAX_LENGTH:
+        return None
+    return ret
+
+
+def encode_many(hrp, programs):
+    """Encode an iterable of `(witver, witprog)` pairs to a list of addresses."""
+    return [encode(hrp, witver, witprog) for witver, witprog in programs]
+
+
+def decode_many(hrp, addrs):
+    """Decode an iterable of addresses to a list of `(witver, witprog)` pairs."""
+    return [decode(hrp, addr) for addr in addrs]
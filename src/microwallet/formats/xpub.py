@@ -1,7 +1,8 @@
 import construct as c
 
 from trezorlib.messages import HDNodeType
-from trezorlib.tools import b58check_decode, b58check_encode
+
+from . import base58
 
 XpubStruct = c.Struct(
     "version" / c.Int32ub,
@@ -15,7 +16,7 @@ XpubStruct = c.Struct(
 
 
 def deserialize(xpubstr):
-    xpub_bytes = b58check_decode(xpubstr)
+    xpub_bytes = base58.check_decode(xpubstr)
     data = XpubStruct.parse(xpub_bytes)
     node = HDNodeType(
         depth=data.depth,
@@ -39,9 +40,9 @@ def serialize(version, node):
         child_num=node.child_num,
         chain_code=node.chain_code,
     )
-    if node.private_key:
+    if getattr(node, "private_key", None):
         data["key"] = b"\0" + node.private_key
     else:
         data["key"] = node.public_key
     xpub_bytes = XpubStruct.build(data)
-    return b58check_encode(xpub_bytes)
+    return base58.check_encode(xpub_bytes)
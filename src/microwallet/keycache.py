@@ -0,0 +1,183 @@
+"""On-disk cache of derived public keys and addresses.
+
+Every account chain is stored in its own file: a fixed-size header followed by
+fixed-size records, one per derived index. The file is memory-mapped and records
+are read straight out of the mapping. Each record carries a CRC32 of its body,
+which is verified when the file is opened.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+
+LOG = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = "MICROWALLET_CACHE_DIR"
+
+MAGIC = b"MWKC"
+FORMAT_VERSION = 1
+
+ADDRESS_MAX_LENGTH = 90
+
+# magic, format version, record size, cache key, record count, checksum
+HEADER = struct.Struct(">4sBH32sI16s")
+# compressed public key, address length, address, CRC32 of the preceding fields
+RECORD = struct.Struct(f">33sB{ADDRESS_MAX_LENGTH}sI")
+RECORD_BODY = struct.Struct(f">33sB{ADDRESS_MAX_LENGTH}s")
+
+
+def default_cache_dir():
+    env_dir = os.environ.get(CACHE_DIR_ENV)
+    if env_dir:
+        return Path(env_dir)
+    xdg_cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache) / "microwallet"
+
+
+def cache_key(*parts):
+    """Make a cache key out of bytes or str parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        digest.update(len(part).to_bytes(4, "big") + part)
+    return digest.digest()
+
+
+def _header_checksum(key, count):
+    data = struct.pack(">4sBH32sI", MAGIC, FORMAT_VERSION, RECORD.size, key, count)
+    return hashlib.sha256(data).digest()[:16]
+
+
+class KeyCache:
+    """Append-only cache of `(public_key, address)` records for a single chain.
+
+    Records must be appended in index order. The header carries the number of
+    records and a checksum; a file with a bad header is discarded and rebuilt.
+    Records are cut off at the first one with a bad checksum, to be derived and
+    appended again.
+    """
+
+    def __init__(self, path, key):
+        self.path = Path(path)
+        self.key = key
+        self.count = 0
+        self._map = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, "r+b")
+        if not self._load():
+            self._reset()
+        self._remap()
+        self._verify()
+
+    @classmethod
+    def open(cls, cache_dir, key):
+        return cls(Path(cache_dir) / f"{key.hex()[:32]}.keys", key)
+
+    def _load(self):
+        header = self._file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            return False
+        magic, version, record_size, key, count, checksum = HEADER.unpack(header)
+        if (magic, version, record_size) != (MAGIC, FORMAT_VERSION, RECORD.size):
+            LOG.warning(f"Key cache {self.path} has unknown format, discarding")
+            return False
+        if key != self.key or checksum != _header_checksum(key, count):
+            LOG.warning(f"Key cache {self.path} is invalid, discarding")
+            return False
+        if os.fstat(self._file.fileno()).st_size < HEADER.size + count * RECORD.size:
+            LOG.warning(f"Key cache {self.path} is truncated, discarding")
+            return False
+        self.count = count
+        return True
+
+    def _verify(self):
+        for index in range(self.count):
+            offset = HEADER.size + index * RECORD.size
+            body = self._map[offset : offset + RECORD_BODY.size]
+            checksum = self._map[offset + RECORD_BODY.size : offset + RECORD.size]
+            if zlib.crc32(body) != int.from_bytes(checksum, "big"):
+                LOG.warning(f"Key cache {self.path} is corrupted at record {index}")
+                self.count = index
+                self._write_header()
+                return
+
+    def _reset(self):
+        self.count = 0
+        self._file.truncate(0)
+        self._write_header()
+
+    def _write_header(self):
+        checksum = _header_checksum(self.key, self.count)
+        header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, RECORD.size, self.key, self.count, checksum
+        )
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.flush()
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("key cache index out of range")
+        pubkey, length, address, _ = RECORD.unpack_from(
+            self._map, HEADER.size + index * RECORD.size
+        )
+        return pubkey, address[:length].decode("ascii")
+
+    def records(self, start=0):
+        """Iterate over cached records starting at index `start`.
+
+        Records appended during the iteration are included.
+        """
+        index = start
+        while index < self.count:
+            yield self[index]
+            index += 1
+
+    def append(self, start, records):
+        """Append records for indexes `start`, `start + 1`, ...
+
+        Records for indexes that are already cached are skipped, so that several
+        readers can derive the same range without corrupting the file. Records
+        that would leave a gap are ignored.
+        """
+        if start > self.count:
+            return
+        records = records[self.count - start :]
+        if not records:
+            return
+
+        data = bytearray()
+        for pubkey, address in records:
+            address_bytes = address.encode("ascii")
+            if len(pubkey) != 33 or len(address_bytes) > ADDRESS_MAX_LENGTH:
+                raise ValueError("Record does not fit the key cache")
+            body = RECORD_BODY.pack(pubkey, len(address_bytes), address_bytes)
+            data += body + zlib.crc32(body).to_bytes(4, "big")
+
+        self._file.seek(HEADER.size + self.count * RECORD.size)
+        self._file.write(data)
+        self._file.flush()
+        # the header is updated only after the records are written
+        self.count += len(records)
+        self._write_header()
+        self._remap()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
@@ -0,0 +1,98 @@
+"""Watch-only multisig accounts."""
+import asyncio
+import hashlib
+
+from . import account_types, coins
+from .account import Account
+from .address import Address, multisig_script
+from .bip32 import as_node, get_subnode
+from .derivation import derive_public_keys
+from .formats import bech32_fast, xpub
+
+
+def multisig_records(threshold, hrp, key_columns):
+    """Build `(witness_script, address)` records from cosigner public keys.
+
+    `key_columns` holds one list of consecutive child public keys per cosigner.
+    Keys of every index are sorted as per BIP-67, so the order of cosigners does
+    not matter.
+    """
+    scripts = [multisig_script(threshold, sorted(keys)) for keys in zip(*key_columns)]
+    programs = [(0, hashlib.sha256(script).digest()) for script in scripts]
+    return list(zip(scripts, bech32_fast.encode_many(hrp, programs)))
+
+
+class MultisigAccount(Account):
+    """Native segwit (P2WSH) m-of-n account built from cosigner xpubs.
+
+    With a derivation service, chains of all cosigners are derived in parallel
+    in its worker processes. Derived records are not stored in the key cache,
+    which holds single public keys only.
+    """
+
+    def __init__(self, coin_name, nodes, threshold, path=None, **kwargs):
+        if not 1 <= threshold <= len(nodes) <= 16:
+            raise ValueError("Invalid multisig parameters")
+        super().__init__(
+            coin_name,
+            nodes[0],
+            account_types.ACCOUNT_TYPE_MULTISIG_SEGWIT,
+            path,
+            **kwargs,
+        )
+        if not self.coin.get("bech32_prefix"):
+            raise ValueError(f"{coin_name} does not support segwit")
+
+        self.threshold = threshold
+        self.nodes = [as_node(node) for node in nodes]
+        self.addr_nodes = [get_subnode(node, 0) for node in self.nodes]
+        self.change_nodes = [get_subnode(node, 1) for node in self.nodes]
+
+    @classmethod
+    def from_xpubs(cls, coin_name, xpubstrs, threshold, **kwargs):
+        try:
+            coin = coins.by_name[coin_name]
+        except KeyError as e:
+            raise ValueError(f"Unknown coin: {coin_name}") from e
+
+        known_versions = (coin["xpub_magic"], coin["xpub_magic_segwit_native"])
+        nodes = []
+        for xpubstr in xpubstrs:
+            version, node = xpub.deserialize(xpubstr)
+            if node.private_key:
+                raise ValueError("Private key supplied, please use public key")
+            if version not in known_versions:
+                raise ValueError("Unrecognized xpub magic (wrong coin maybe?)")
+            nodes.append(node)
+
+        return cls(coin_name, nodes, threshold, **kwargs)
+
+    def _master_nodes(self, change):
+        return self.addr_nodes if not change else self.change_nodes
+
+    def _key_cache(self, change):
+        return None
+
+    def _derive(self, change, start, count):
+        key_columns = [
+            derive_public_keys(node, start, count)
+            for node in self._master_nodes(change)
+        ]
+        return multisig_records(self.threshold, self.coin["bech32_prefix"], key_columns)
+
+    async def _derive_async(self, change, start, count):
+        key_columns = await asyncio.gather(
+            *(
+                self.deriver.run(derive_public_keys, node, start, count)
+                for node in self._master_nodes(change)
+            )
+        )
+        return multisig_records(self.threshold, self.coin["bech32_prefix"], key_columns)
+
+    def _make_addresses(self, change, start, records):
+        return [
+            Address(
+                self.path + [int(change), i], change, None, address_str, script=script
+            )
+            for i, (script, address_str) in enumerate(records, start)
+        ]
@@ -0,0 +1,183 @@
+"""Reverse index from output scripts and addresses to wallet derivation paths."""
+import hashlib
+import math
+import os
+import struct
+import typing
+
+import attr
+
+from trezorlib.tools import hash_160
+
+INDEX_MAGIC = b"MWOI"
+INDEX_VERSION = 2
+DEFAULT_LOOKAHEAD = 1000
+
+ENTRY_FIXED = struct.Struct(">BI")
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Ownership:
+    account: str
+    change: bool
+    index: int
+    path: typing.Tuple[int, ...]
+    # master fingerprint of the device holding the keys, if known
+    fingerprint: typing.Optional[bytes] = None
+
+
+class BloomFilter:
+    """Bloom filter for cheap negative answers before the hash table lookup."""
+
+    def __init__(self, size_bits, num_hashes):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        size_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, num_hashes)
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+
+def account_id(account):
+    """Default identifier of an account: fingerprint of its node."""
+    return hash_160(account.node.public_key)[:4].hex()
+
+
+class OwnershipIndex:
+    """Maps scriptPubKeys and address strings to `Ownership` records.
+
+    The index is built by deriving each account's receive and change chains up
+    to a lookahead. Lookups are plain dict accesses, optionally preceded by a
+    Bloom filter check.
+    """
+
+    def __init__(self, use_bloom=True):
+        self.use_bloom = use_bloom
+        self._scripts = {}
+        self._addresses = {}
+        self._bloom = None
+
+    def __len__(self):
+        return len(self._scripts)
+
+    def add(self, script_pubkey, address_str, ownership):
+        self._scripts[script_pubkey] = ownership
+        self._addresses[address_str] = script_pubkey
+        # the filter is rebuilt lazily on next lookup
+        self._bloom = None
+
+    def add_account(
+        self, account, lookahead=DEFAULT_LOOKAHEAD, name=None, fingerprint=None
+    ):
+        if name is None:
+            name = account_id(account)
+        script_pubkey = account.account_type.script_pubkey
+        for change in (False, True):
+            batch = account.address_range(0, lookahead, change)
+            for path, address_str, public_key in batch:
+                ownership = Ownership(name, change, path[-1], tuple(path), fingerprint)
+                self.add(script_pubkey(public_key), address_str, ownership)
+
+    def _get_bloom(self):
+        if self._bloom is None:
+            self._bloom = BloomFilter.for_capacity(len(self._scripts))
+            for script in self._scripts:
+                self._bloom.add(script)
+        return self._bloom
+
+    def lookup_script(self, script_pubkey):
+        script_pubkey = bytes(script_pubkey)
+        if self.use_bloom and script_pubkey not in self._get_bloom():
+            return None
+        return self._scripts.get(script_pubkey)
+
+    def lookup_address(self, address_str):
+        script_pubkey = self._addresses.get(address_str)
+        if script_pubkey is None:
+            return None
+        return self._scripts[script_pubkey]
+
+    def is_mine(self, script_pubkey):
+        return self.lookup_script(script_pubkey) is not None
+
+    def to_bytes(self):
+        data = bytearray()
+        for address_str, script in self._addresses.items():
+            ownership = self._scripts[script]
+            for field in (script, address_str.encode(), ownership.account.encode()):
+                data += struct.pack(">B", len(field)) + field
+            data += ENTRY_FIXED.pack(ownership.change, ownership.index)
+            data += struct.pack(">B", len(ownership.path))
+            data += struct.pack(f">{len(ownership.path)}I", *ownership.path)
+            fingerprint = ownership.fingerprint or b""
+            data += struct.pack(">B", len(fingerprint)) + fingerprint
+        payload = bytes(data)
+        header = INDEX_MAGIC + bytes([INDEX_VERSION])
+        return header + hashlib.sha256(payload).digest() + payload
+
+    @classmethod
+    def from_bytes(cls, data, use_bloom=True):
+        magic_len = len(INDEX_MAGIC) + 1
+        header_len = magic_len + 32
+        if data[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError("Not an ownership index")
+        version = data[len(INDEX_MAGIC)]
+        if version != INDEX_VERSION:
+            raise ValueError(f"Unsupported ownership index version: {version}")
+        payload = data[header_len:]
+        if hashlib.sha256(payload).digest() != data[magic_len:header_len]:
+            raise ValueError("Ownership index checksum mismatch")
+
+        index = cls(use_bloom)
+        offset = 0
+
+        def read_field():
+            nonlocal offset
+            length = payload[offset]
+            field = payload[offset + 1 : offset + 1 + length]
+            offset += 1 + length
+            return field
+
+        while offset < len(payload):
+            script = read_field()
+            address_str = read_field().decode()
+            account = read_field().decode()
+            change, n = ENTRY_FIXED.unpack_from(payload, offset)
+            offset += ENTRY_FIXED.size
+            path_len = payload[offset]
+            path = struct.unpack_from(f">{path_len}I", payload, offset + 1)
+            offset += 1 + 4 * path_len
+            fingerprint = read_field() or None
+            ownership = Ownership(account, bool(change), n, path, fingerprint)
+            index.add(script, address_str, ownership)
+        return index
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, use_bloom=True):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read(), use_bloom)
@@ -0,0 +1,177 @@
+"""Lookahead pool of verified unused receive addresses."""
+import asyncio
+import logging
+import time
+from decimal import Decimal
+
+from . import exceptions
+from .account import BIP32_ADDRESS_DISCOVERY_LIMIT, FETCH_CONCURRENCY
+from .store import POOL_FREE, POOL_RESERVED, POOL_USED, WalletStore
+
+LOG = logging.getLogger(__name__)
+
+POOL_SIZE = 10
+POOL_MAX_AGE = 600
+
+
+def _is_unused(data):
+    return (
+        Decimal(data.get("totalReceived", 0)) == 0
+        and not data.get("txs", 0)
+        and not data.get("unconfirmedTxs", 0)
+    )
+
+
+class AddressPool:
+    """Hands out fresh receive addresses of `account` without scanning its chain.
+
+    Up to `size` addresses past the first unused one are checked with the
+    backend and kept in `store`. Every address is reserved before it is handed
+    out, so it is never given twice, and the pool is refilled in the background.
+    Free addresses checked more than `max_age` seconds ago are checked again on
+    refill. Without a store, the pool lives in memory.
+
+    Reserved addresses that never receive funds still count towards the gap
+    limit of wallets scanning the account. Addresses are therefore never pooled
+    past the gap limit. A reservation is only given up by `release`.
+    """
+
+    def __init__(self, account, store=None, size=POOL_SIZE, max_age=POOL_MAX_AGE):
+        if store is None:
+            store = account.store or WalletStore(":memory:")
+        self.account = account
+        self.store = store
+        self.size = size
+        self.max_age = max_age
+        self._refill = None
+
+    async def _check(self, entries):
+        limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def check(index, address_str):
+            async with limit:
+                data = await self.account.backend.get_address_data(address_str)
+            return index, address_str, POOL_FREE if _is_unused(data) else POOL_USED
+
+        return await asyncio.gather(*(check(i, a) for i, a in entries))
+
+    async def refill(self):
+        """Top up the pool to `size` free addresses.
+
+        The pool starts at the first unused address of the chain, which is
+        looked up again on every refill. Addresses are only added up to the gap
+        limit past the last used one.
+        """
+        async with self.account.backend:
+            now = time.time()
+            first = (await self.account.get_unused_address()).path[-1]
+            rows = self.store.pool_rows(self.account)
+            # all addresses before the first unused one have been paid
+            behind = [(i, a, POOL_USED) for i, a, *_ in rows if i < first]
+            for status in (POOL_FREE, POOL_RESERVED):
+                self.store.pool_update(self.account, behind, current=status)
+            rows = [row for row in rows if row[0] >= first]
+
+            free = [(i, a) for i, a, status, _, _ in rows if status == POOL_FREE]
+            stale = [
+                (i, a)
+                for i, a, status, checked, _ in rows
+                if status == POOL_FREE and now - checked >= self.max_age
+            ]
+            checked = await self._check(stale)
+            free_count = len(free) - len(stale)
+            free_count += sum(status == POOL_FREE for _, _, status in checked)
+
+            used = [i for i, _, status, _, _ in rows if status == POOL_USED]
+            used += [i for i, _, status in checked if status == POOL_USED]
+            last_used = max(used, default=first - 1)
+            start = rows[-1][0] + 1 if rows else first
+
+            if start + self.size - free_count > self._end(last_used):
+                # at the gap limit: paid reservations move it
+                results = await self._check(
+                    (i, a)
+                    for i, a, status, _, _ in rows
+                    if status == POOL_RESERVED and i > last_used
+                )
+                paid = [entry for entry in results if entry[2] == POOL_USED]
+                self.store.pool_update(self.account, paid, current=POOL_RESERVED)
+                last_used = max([last_used, *(i for i, _, _ in paid)])
+
+            end = self._end(last_used)
+            while free_count < self.size and start < end:
+                count = min(self.size - free_count, end - start)
+                batch = self.account.address_range(start, count)
+                results = await self._check(enumerate(batch.addresses, start))
+                checked.extend(results)
+                for i, _, status in results:
+                    if status == POOL_FREE:
+                        free_count += 1
+                    else:
+                        end = max(end, self._end(i))
+                start += count
+            self.store.pool_update(self.account, checked)
+
+    async def release(self, index):
+        """Give up the reservation of the receive address at `index`.
+
+        The address is checked first: if it has been paid in the meantime, it
+        is marked as used instead. Return True if it was put back in the pool.
+        """
+        rows = {row[0]: row for row in self.store.pool_rows(self.account)}
+        if index not in rows or rows[index][2] != POOL_RESERVED:
+            raise ValueError(f"Receive address {index} is not reserved")
+        async with self.account.backend:
+            ((_, address_str, status),) = await self._check([rows[index][:2]])
+        if status == POOL_USED:
+            self.store.pool_update(
+                self.account, [(index, address_str, status)], current=POOL_RESERVED
+            )
+            return False
+        return self.store.pool_release(self.account, [index]) == [index]
+
+    @staticmethod
+    def _end(last_used):
+        """Index past the last address wallets scanning the account look at."""
+        return last_used + 1 + BIP32_ADDRESS_DISCOVERY_LIMIT
+
+    def _refill_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            LOG.warning(f"Refilling the address pool failed: {task.exception()}")
+
+    def start_refill(self):
+        """Refill the pool in the background, unless a refill is running."""
+        if self._refill is None or self._refill.done():
+            self._refill = asyncio.ensure_future(self.refill())
+            self._refill.add_done_callback(self._refill_done)
+        return self._refill
+
+    async def wait_refill(self):
+        """Wait for a background refill to finish. Failures are only logged."""
+        if self._refill is not None:
+            await asyncio.wait([self._refill])
+
+    async def get_address(self):
+        """Reserve the next pooled receive address.
+
+        Only a call on an empty pool waits for the backend. Raise
+        `AddressPoolExhausted` if no address can be pooled without crossing the
+        gap limit.
+        """
+        reserved = self.store.pool_reserve(self.account)
+        while reserved is None:
+            await self.start_refill()
+            if not self.store.pool_free(self.account):
+                raise exceptions.AddressPoolExhausted(
+                    "All receive addresses within the gap limit are reserved"
+                )
+            # another caller may take the refilled addresses first
+            reserved = self.store.pool_reserve(self.account)
+        self.start_refill()
+
+        index, address_str = reserved
+        address = self.account.addresses_at([(False, index)])[False, index]
+        if address.str != address_str:
+            raise ValueError("Pooled address does not match the account")
+        address.balance = address.received = 0
+        return address
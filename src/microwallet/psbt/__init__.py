@@ -4,6 +4,7 @@ from typing import Dict, Any, List, Tuple, Optional
 
 from trezorlib.messages import TxInputType, TxOutputType, HDNodeType
 
+from .. import account_types
 from ..account import Account, Utxo
 from ..address import Address, derive_output_script
 from ..formats import psbt, xpub
@@ -18,7 +19,7 @@ def make_transaction(
 ) -> Dict[Any, Any]:
     def make_tx_input(utxo: Utxo) -> Dict[Any, Any]:
         return dict(
-            tx=bytes.fromhex(utxo.tx["txid"]),
+            tx=bytes.fromhex(utxo.txid),
             index=utxo.vout,
             script_sig=b"",
             sequence=0xFFFF_FFFD,
@@ -78,6 +79,8 @@ def make_psbt(
     change_address: Optional[Address],
     change_amount: int = 0,
 ) -> bytes:
+    if account.account_type is account_types.ACCOUNT_TYPE_MULTISIG_SEGWIT:
+        raise ValueError("Spending from multisig accounts is not supported")
     psbt_inputs = [
         psbt.PsbtInputType(
             non_witness_utxo=non_witness_utxo(utxo),
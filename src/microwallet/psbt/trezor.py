@@ -2,13 +2,18 @@ import typing
 
 from trezorlib import messages as m
 
-from microwallet.address import (
-    derive_address,
-    script_is_p2pkh,
-    script_is_p2sh,
-    script_is_witness,
-    get_op_return_data,
-)
+from microwallet.address import address_from_script
+from microwallet.script import ScriptKind, classify
+
+INPUT_SCRIPT_TYPES = {
+    ScriptKind.P2PKH: m.InputScriptType.SPENDADDRESS,
+    ScriptKind.P2SH: m.InputScriptType.SPENDP2SHWITNESS,
+}
+
+OUTPUT_SCRIPT_TYPES = {
+    ScriptKind.P2PKH: m.OutputScriptType.PAYTOADDRESS,
+    ScriptKind.P2SH: m.OutputScriptType.PAYTOP2SHWITNESS,
+}
 
 
 def make_transaction(tx) -> m.TransactionType:
@@ -60,42 +65,48 @@ def make_input(tx_in, psbt_in=None, fingerprint=None) -> m.TxInputType:
         raise ValueError("Signing path not provided")
 
     script_pubkey = psbt_in.non_witness_utxo.outputs[tx_in.index].script_pubkey
-    if script_is_p2pkh(script_pubkey):
-        trezor_in.script_type = m.InputScriptType.SPENDADDRESS
-    elif script_is_p2sh(script_pubkey):
-        trezor_in.script_type = m.InputScriptType.SPENDP2SHWITNESS
-    elif script_is_witness(script_pubkey):
+    classified = classify(script_pubkey)
+    if classified.is_witness:
         trezor_in.script_type = m.InputScriptType.SPENDWITNESS
+    elif classified.kind in INPUT_SCRIPT_TYPES:
+        trezor_in.script_type = INPUT_SCRIPT_TYPES[classified.kind]
     else:
         raise ValueError("Unsupported script type for input")
 
     return trezor_in
 
 
-def make_output(tx_out, psbt_out, fingerprint, coin) -> m.TxOutputType:
+def make_output(tx_out, psbt_out, fingerprint, coin, ownership=None) -> m.TxOutputType:
     # TODO coin passthrough?
-    trezor_out = m.TxOutputType(
-        amount=tx_out.value,
-        address=derive_address(coin, tx_out.script_pubkey),
-        script_type=m.OutputScriptType.PAYTOADDRESS,
-        op_return_data=get_op_return_data(tx_out.script_pubkey),
-    )
-    if trezor_out.op_return_data is not None:
-        trezor_out.address = None
+    classified = classify(tx_out.script_pubkey)
+    trezor_out = m.TxOutputType(amount=tx_out.value)
+    if classified.kind is ScriptKind.OP_RETURN:
+        trezor_out.op_return_data = bytes(classified.payload)
         trezor_out.script_type = m.OutputScriptType.PAYTOOPRETURN
+    else:
+        trezor_out.address = address_from_script(coin, classified)
+        trezor_out.script_type = m.OutputScriptType.PAYTOADDRESS
 
     trezor_out.address_n = find_address_n(psbt_out.bip32_path, fingerprint)
+    if trezor_out.address_n is None and ownership is not None:
+        owned = ownership.lookup_script(tx_out.script_pubkey)
+        # the path is only meaningful to the device the index entry belongs to;
+        # paths of xpub-only accounts lack the account part and can't be signed
+        if (
+            owned is not None
+            and owned.fingerprint == fingerprint
+            and len(owned.path) > 2
+        ):
+            trezor_out.address_n = list(owned.path)
     if trezor_out.address_n is not None:
-        if trezor_out.op_return_data:
+        if classified.kind is ScriptKind.OP_RETURN:
             raise ValueError("OP_RETURN must not have a BIP32 path")
 
         trezor_out.address = None
-        if script_is_p2pkh(tx_out.script_pubkey):
-            trezor_out.script_type = m.OutputScriptType.PAYTOADDRESS
-        elif script_is_p2sh(tx_out.script_pubkey):
-            trezor_out.script_type = m.OutputScriptType.PAYTOP2SHWITNESS
-        elif script_is_witness(tx_out.script_pubkey):
+        if classified.is_witness:
             trezor_out.script_type = m.OutputScriptType.PAYTOWITNESS
+        elif classified.kind in OUTPUT_SCRIPT_TYPES:
+            trezor_out.script_type = OUTPUT_SCRIPT_TYPES[classified.kind]
         else:
             raise ValueError("Unsupported script type")
 
@@ -0,0 +1,176 @@
+"""Classification of output scripts by template.
+
+`classify` recognizes a script in a single pass: templates are looked up by
+script length and first byte, so adding a template does not add checks for
+scripts of other shapes. The result carries the script kind and the extracted
+hash, witness program or data as a memoryview into the original script.
+"""
+import enum
+import typing
+
+import attr
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4C
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6A
+OP_CHECKMULTISIG = 0xAE
+
+MAX_OP_RETURN_LENGTH = 83
+
+
+class ScriptKind(enum.Enum):
+    P2PKH = "p2pkh"
+    P2SH = "p2sh"
+    P2WPKH = "p2wpkh"
+    P2WSH = "p2wsh"
+    P2TR = "p2tr"
+    WITNESS = "witness"
+    MULTISIG = "multisig"
+    OP_RETURN = "op_return"
+    NONSTANDARD = "nonstandard"
+
+
+WITNESS_KINDS = frozenset(
+    (ScriptKind.P2WPKH, ScriptKind.P2WSH, ScriptKind.P2TR, ScriptKind.WITNESS)
+)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ClassifiedScript:
+    kind: ScriptKind
+    payload: typing.Optional[memoryview] = None
+    witness_version: typing.Optional[int] = None
+
+    @property
+    def is_witness(self):
+        return self.kind in WITNESS_KINDS
+
+
+NONSTANDARD = ClassifiedScript(ScriptKind.NONSTANDARD)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class FixedTemplate:
+    """Script of a fixed shape: `prefix`, `payload_length` bytes, `suffix`."""
+
+    kind: ScriptKind
+    prefix: bytes
+    payload_length: int
+    suffix: bytes = b""
+    witness_version: typing.Optional[int] = None
+
+    @property
+    def length(self):
+        return len(self.prefix) + self.payload_length + len(self.suffix)
+
+    def match(self, script):
+        end = len(self.prefix) + self.payload_length
+        if script[: len(self.prefix)] != self.prefix or script[end:] != self.suffix:
+            return None
+        payload = script[len(self.prefix) : end]
+        return ClassifiedScript(self.kind, payload, self.witness_version)
+
+
+# templates by (script length, first byte)
+_FIXED = {}
+# variable-length matchers by first byte, tried in order of registration
+_MATCHERS = {}
+
+
+def register_template(template):
+    key = template.length, template.prefix[0]
+    _FIXED.setdefault(key, []).append(template)
+
+
+def register_matcher(first_bytes, matcher):
+    """Register a function `matcher(script) -> Optional[ClassifiedScript]`.
+
+    It is called for scripts starting with one of `first_bytes` that did not
+    match a fixed template.
+    """
+    for first in first_bytes:
+        _MATCHERS.setdefault(first, []).append(matcher)
+
+
+def classify(script) -> ClassifiedScript:
+    script = memoryview(script)
+    if not script:
+        return NONSTANDARD
+    first = script[0]
+    for template in _FIXED.get((len(script), first), ()):
+        result = template.match(script)
+        if result is not None:
+            return result
+    for matcher in _MATCHERS.get(first, ()):
+        result = matcher(script)
+        if result is not None:
+            return result
+    return NONSTANDARD
+
+
+def match_witness(script):
+    """Any witness program: version opcode followed by a single push."""
+    if not 4 <= len(script) <= 42 or script[1] != len(script) - 2:
+        return None
+    version = script[0] - OP_1 + 1 if script[0] else 0
+    return ClassifiedScript(ScriptKind.WITNESS, script[2:], version)
+
+
+def match_op_return(script):
+    """OP_RETURN followed by a single data push."""
+    if len(script) > MAX_OP_RETURN_LENGTH:
+        return None
+    if len(script) == 1:
+        return ClassifiedScript(ScriptKind.OP_RETURN, script[1:])
+    if script[1] < OP_PUSHDATA1:
+        start = 2
+    elif script[1] == OP_PUSHDATA1 and len(script) > 2:
+        start = 3
+    else:
+        return None
+    if script[start - 1] != len(script) - start:
+        return None
+    return ClassifiedScript(ScriptKind.OP_RETURN, script[start:])
+
+
+def parse_multisig(script):
+    """Parse a bare multisig script into `(threshold, [public keys])`.
+
+    Return None if the script is not a bare multisig.
+    """
+    script = memoryview(script)
+    if len(script) < 3 or script[-1] != OP_CHECKMULTISIG:
+        return None
+    m, n = script[0] - OP_1 + 1, script[-2] - OP_1 + 1
+    if not (OP_1 <= script[0] <= OP_16 and OP_1 <= script[-2] <= OP_16):
+        return None
+    pubkeys = []
+    pos = 1
+    while pos < len(script) - 2:
+        length = script[pos]
+        if length not in (33, 65):
+            return None
+        pubkeys.append(script[pos + 1 : pos + 1 + length])
+        pos += 1 + length
+    if pos != len(script) - 2 or len(pubkeys) != n or not 1 <= m <= n:
+        return None
+    return m, pubkeys
+
+
+def match_multisig(script):
+    if parse_multisig(script) is None:
+        return None
+    return ClassifiedScript(ScriptKind.MULTISIG, script[1:-2])
+
+
+register_template(FixedTemplate(ScriptKind.P2PKH, b"\x76\xa9\x14", 20, b"\x88\xac"))
+register_template(FixedTemplate(ScriptKind.P2SH, b"\xa9\x14", 20, b"\x87"))
+register_template(FixedTemplate(ScriptKind.P2WPKH, b"\x00\x14", 20, b"", 0))
+register_template(FixedTemplate(ScriptKind.P2WSH, b"\x00\x20", 32, b"", 0))
+register_template(FixedTemplate(ScriptKind.P2TR, b"\x51\x20", 32, b"", 1))
+
+register_matcher([OP_0] + list(range(OP_1, OP_16 + 1)), match_witness)
+register_matcher([OP_RETURN], match_op_return)
+register_matcher(range(OP_1, OP_16 + 1), match_multisig)
@@ -0,0 +1,448 @@
+"""Local wallet database with incremental sync.
+
+Addresses with their last-known backend data, UTXOs and the sync state of every
+account are kept in an SQLite database, together with transaction bodies loaded
+for signing. A sync re-queries
+the address data of known addresses up to the last used one, fetches UTXOs only
+of addresses whose data changed, and extends discovery from the last used
+index. Progress is committed after every batch, so an interrupted sync resumes
+where it stopped. The database also holds the lookahead pool of receive
+addresses, see `pool.AddressPool`.
+"""
+import asyncio
+import json
+import sqlite3
+import time
+import weakref
+from decimal import Decimal
+
+from . import keycache
+from .account import (
+    BIP32_ADDRESS_DISCOVERY_LIMIT,
+    DERIVATION_BATCH_SIZE,
+    FETCH_CONCURRENCY,
+    NULL_PROGRESS,
+    AccountSnapshot,
+    Utxo,
+    cancel_all,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    coin TEXT NOT NULL,
+    sync_height INTEGER,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS chains (
+    account TEXT NOT NULL,
+    change INTEGER NOT NULL,
+    scanned_to INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    PRIMARY KEY (account, change)
+);
+CREATE TABLE IF NOT EXISTS addresses (
+    account TEXT NOT NULL,
+    change INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    balance TEXT NOT NULL,
+    total_received TEXT NOT NULL,
+    total_sent TEXT NOT NULL,
+    txs INTEGER NOT NULL,
+    unconfirmed_txs INTEGER NOT NULL,
+    PRIMARY KEY (account, change, idx)
+);
+CREATE TABLE IF NOT EXISTS utxos (
+    account TEXT NOT NULL,
+    change INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    txid TEXT NOT NULL,
+    vout INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (account, txid, vout)
+);
+CREATE INDEX IF NOT EXISTS utxos_by_address ON utxos (account, change, idx);
+CREATE TABLE IF NOT EXISTS transactions (
+    txid TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS address_pool (
+    account TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    status TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    reserved_at REAL,
+    PRIMARY KEY (account, idx)
+);
+"""
+
+POOL_FREE = "free"
+POOL_RESERVED = "reserved"
+POOL_USED = "used"
+
+ADDRESS_COLUMNS = "balance, total_received, total_sent, txs, unconfirmed_txs"
+
+
+_account_keys = weakref.WeakKeyDictionary()
+
+
+def account_key(account):
+    """Identify an account by its coin, type and first addresses of both chains.
+
+    The key is derived once per account object.
+    """
+    key = _account_keys.get(account)
+    if key is None:
+        receive = account.address_range(0, 1).addresses[0]
+        change = account.address_range(0, 1, change=True).addresses[0]
+        key = keycache.cache_key(
+            account.coin_name, str(account.account_type.type_id), receive, change
+        ).hex()[:32]
+        _account_keys[account] = key
+    return key
+
+
+def _address_state(data):
+    return (
+        str(data.get("balance", 0)),
+        str(data.get("totalReceived", 0)),
+        str(data.get("totalSent", 0)),
+        int(data.get("txs", 0)),
+        int(data.get("unconfirmedTxs", 0)),
+    )
+
+
+def _dump_json(value):
+    """Serialize backend JSON data, keeping `Decimal`s as JSON numbers."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, dict):
+        items = (f"{json.dumps(k)}:{_dump_json(v)}" for k, v in value.items())
+        return "{" + ",".join(items) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_dump_json(v) for v in value) + "]"
+    return json.dumps(value)
+
+
+def _is_used(state):
+    return Decimal(state[1]) > 0
+
+
+def _may_change(state):
+    """Whether the address holds funds or unconfirmed transactions."""
+    return Decimal(state[0]) != 0 or state[4] > 0
+
+
+class WalletStore:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _address_rows(self, key, change):
+        cursor = self.db.execute(
+            f"SELECT idx, address, {ADDRESS_COLUMNS} FROM addresses "
+            "WHERE account = ? AND change = ? ORDER BY idx",
+            (key, int(change)),
+        )
+        return {idx: (address_str, tuple(state)) for idx, address_str, *state in cursor}
+
+    def _chain_checkpoint(self, key, change):
+        row = self.db.execute(
+            "SELECT scanned_to, complete FROM chains WHERE account = ? AND change = ?",
+            (key, int(change)),
+        ).fetchone()
+        return row if row is not None else (0, True)
+
+    def _save_checkpoint(self, key, change, scanned_to, complete):
+        self.db.execute(
+            "INSERT OR REPLACE INTO chains VALUES (?, ?, ?, ?)",
+            (key, int(change), scanned_to, int(complete)),
+        )
+
+    def _save_address(self, key, change, index, address_str, state, utxos):
+        self.db.execute(
+            "INSERT OR REPLACE INTO addresses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, int(change), index, address_str, *state),
+        )
+        if utxos is None:
+            return
+        self.db.execute(
+            "DELETE FROM utxos WHERE account = ? AND change = ? AND idx = ?",
+            (key, int(change), index),
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (key, int(change), index, u["txid"], int(u["vout"]), str(u["value"]))
+                for u in utxos
+            ],
+        )
+
+    async def sync(self, account, progress=NULL_PROGRESS, full=False):
+        """Bring the stored state of `account` up to date with its backend.
+
+        With `full`, UTXOs of every funded address are fetched again. Return an
+        `AccountSnapshot` of the synced state.
+        """
+        key = account_key(account)
+        limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+        queried = 0
+
+        async def refresh(address_str, old_state):
+            nonlocal queried
+            async with limit:
+                data = await account.backend.get_address_data(address_str)
+            state = _address_state(data)
+            utxos = None
+            if full or state != old_state:
+                if _may_change(state):
+                    async with limit:
+                        utxos = await account.backend.get_utxos(address_str)
+                else:
+                    utxos = []
+            queried += 1
+            progress(addrs=queried)
+            return state, utxos
+
+        async def sync_chain(change):
+            rows = self._address_rows(key, change)
+            used = [i for i, (_, state) in rows.items() if _is_used(state)]
+            last_used = max(used, default=-1)
+
+            # any known address up to the last used one can be paid again;
+            # UTXOs are only fetched where the address data changed
+            recheck = [i for i in rows if i <= last_used]
+            for start in range(0, len(recheck), DERIVATION_BATCH_SIZE):
+                batch = recheck[start : start + DERIVATION_BATCH_SIZE]
+                results = await asyncio.gather(
+                    *(refresh(rows[i][0], rows[i][1]) for i in batch)
+                )
+                for i, (state, utxos) in zip(batch, results):
+                    self._save_address(key, change, i, rows[i][0], state, utxos)
+                self.db.commit()
+
+            scanned_to, complete = self._chain_checkpoint(key, change)
+            if complete or scanned_to <= last_used:
+                scanned_to = last_used + 1
+            while scanned_to - last_used - 1 <= BIP32_ADDRESS_DISCOVERY_LIMIT:
+                batch = account.address_range(scanned_to, DERIVATION_BATCH_SIZE, change)
+                results = await asyncio.gather(
+                    *(
+                        refresh(address_str, rows.get(i, (None, None))[1])
+                        for i, address_str in enumerate(batch.addresses, scanned_to)
+                    )
+                )
+                for i, (state, utxos) in enumerate(results, scanned_to):
+                    self._save_address(
+                        key, change, i, batch.addresses[i - scanned_to], state, utxos
+                    )
+                    if _is_used(state):
+                        last_used = i
+                scanned_to += len(batch)
+                # checkpoint: an interrupted sync continues from here
+                self._save_checkpoint(key, change, scanned_to, False)
+                self.db.commit()
+            self._save_checkpoint(key, change, scanned_to, True)
+            self.db.commit()
+
+        async with account.backend:
+            height = await account.backend.get_best_height()
+            self.db.execute(
+                "INSERT OR IGNORE INTO accounts (id, coin) VALUES (?, ?)",
+                (key, account.coin_name),
+            )
+            change_sync = asyncio.ensure_future(sync_chain(change=True))
+            try:
+                await sync_chain(change=False)
+                await change_sync
+            finally:
+                await cancel_all([change_sync])
+
+            self.db.execute(
+                "UPDATE accounts SET sync_height = ?, synced_at = ? WHERE id = ?",
+                (height, time.time(), key),
+            )
+            self.db.commit()
+            fee_rate = await account.estimate_fee()
+
+        return self.snapshot(account, fee_rate)
+
+    def transactions(self, txids):
+        """Stored transactions out of `txids`, as a dict by txid."""
+        txids = list(txids)
+        result = {}
+        # stay below the SQLite limit on query parameters
+        for start in range(0, len(txids), 500):
+            chunk = txids[start : start + 500]
+            cursor = self.db.execute(
+                "SELECT txid, data FROM transactions WHERE txid IN "
+                f"({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for txid, data in cursor:
+                result[txid] = json.loads(data, parse_float=Decimal)
+        return result
+
+    def save_transactions(self, transactions):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO transactions VALUES (?, ?)",
+            [(txid, _dump_json(data)) for txid, data in transactions.items()],
+        )
+        self.db.commit()
+
+    def pool_rows(self, account):
+        """All pooled addresses of `account` in index order.
+
+        Rows are `(index, address, status, checked_at, reserved_at)`.
+        """
+        cursor = self.db.execute(
+            "SELECT idx, address, status, checked_at, reserved_at FROM address_pool "
+            "WHERE account = ? ORDER BY idx",
+            (account_key(account),),
+        )
+        return cursor.fetchall()
+
+    def pool_free(self, account):
+        """Free pooled addresses of `account` as `(index, address, checked_at)`."""
+        cursor = self.db.execute(
+            "SELECT idx, address, checked_at FROM address_pool "
+            "WHERE account = ? AND status = ? ORDER BY idx",
+            (account_key(account), POOL_FREE),
+        )
+        return cursor.fetchall()
+
+    def pool_update(self, account, entries, current=POOL_FREE):
+        """Store checked pool addresses given as `(index, address, status)`.
+
+        Only new addresses and those with the `current` status are changed, so
+        addresses reserved in the meantime keep their reservation.
+        """
+        key = account_key(account)
+        now = time.time()
+        entries = list(entries)
+        self.db.executemany(
+            "INSERT OR IGNORE INTO address_pool VALUES (?, ?, ?, ?, ?, NULL)",
+            [(key, index, address, status, now) for index, address, status in entries],
+        )
+        self.db.executemany(
+            "UPDATE address_pool SET status = ?, checked_at = ? "
+            "WHERE account = ? AND idx = ? AND status = ?",
+            [(status, now, key, index, current) for index, _, status in entries],
+        )
+        self.db.commit()
+
+    def pool_release(self, account, indexes):
+        """Free the reservations of `indexes`, return those that were reserved."""
+        key = account_key(account)
+        released = []
+        for index in indexes:
+            cursor = self.db.execute(
+                "UPDATE address_pool SET status = ?, checked_at = ?, "
+                "reserved_at = NULL WHERE account = ? AND idx = ? AND status = ?",
+                (POOL_FREE, time.time(), key, index, POOL_RESERVED),
+            )
+            if cursor.rowcount == 1:
+                released.append(index)
+        self.db.commit()
+        return released
+
+    def pool_reserve(self, account):
+        """Reserve the lowest free pooled address, return `(index, address)`.
+
+        Return None if the pool is empty. A reservation is committed at once,
+        so that processes sharing the database never hand out the same address.
+        """
+        key = account_key(account)
+        while True:
+            row = self.db.execute(
+                "SELECT idx, address FROM address_pool "
+                "WHERE account = ? AND status = ? ORDER BY idx LIMIT 1",
+                (key, POOL_FREE),
+            ).fetchone()
+            if row is None:
+                return None
+            cursor = self.db.execute(
+                "UPDATE address_pool SET status = ?, reserved_at = ? "
+                "WHERE account = ? AND idx = ? AND status = ?",
+                (POOL_RESERVED, time.time(), key, row[0], POOL_FREE),
+            )
+            self.db.commit()
+            if cursor.rowcount == 1:
+                return row
+
+    def sync_height(self, account):
+        row = self.db.execute(
+            "SELECT sync_height FROM accounts WHERE id = ?", (account_key(account),)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def balance(self, account):
+        """Balance of `account` as of its last sync, without network access."""
+        cursor = self.db.execute(
+            "SELECT balance FROM addresses WHERE account = ?", (account_key(account),)
+        )
+        return sum((Decimal(balance) for (balance,) in cursor), Decimal(0))
+
+    def snapshot(self, account, fee_rate):
+        """Make an `AccountSnapshot` out of the stored state of `account`."""
+        key = account_key(account)
+        rows = {change: self._address_rows(key, change) for change in (False, True)}
+
+        used = {}
+        unused_paths = {}
+        for change, chain_rows in rows.items():
+            unused_paths[change] = next(
+                i
+                for i in range(len(chain_rows) + 1)
+                if i not in chain_rows or not _is_used(chain_rows[i][1])
+            )
+            for i, (address_str, state) in chain_rows.items():
+                if _is_used(state):
+                    used[change, i] = address_str, state
+
+        paths = list(used) + list(unused_paths.items())
+        addresses = account.addresses_at(paths)
+        for path, (address_str, state) in used.items():
+            if addresses[path].str != address_str:
+                raise ValueError("Stored addresses do not match the account")
+            addresses[path].balance = int(Decimal(state[0]))
+            addresses[path].received = int(Decimal(state[1]))
+        unused = {}
+        for change, i in unused_paths.items():
+            unused[change] = addresses[change, i]
+            unused[change].balance = unused[change].received = 0
+
+        utxos = [
+            Utxo(
+                address=addresses[bool(change), i],
+                txid=txid,
+                vout=vout,
+                value=int(value),
+            )
+            for change, i, txid, vout, value in self.db.execute(
+                "SELECT change, idx, txid, vout, value FROM utxos WHERE account = ? "
+                "ORDER BY change, idx, txid, vout",
+                (key,),
+            )
+        ]
+
+        return AccountSnapshot(
+            addresses=[addresses[path] for path in sorted(used)],
+            utxos=utxos,
+            unused=unused,
+            fee_rate=fee_rate,
+            taken_at=time.monotonic(),
+            ttl=account.snapshot_ttl,
+        )
@@ -9,7 +9,7 @@ from trezorlib.messages import OutputScriptType, SignTx, TxInputType, TxOutputTy
 from trezorlib.transport import enumerate_devices, get_transport
 from trezorlib.ui import ClickUI
 
-from . import account, coins
+from . import account, account_types, coins
 from .address import Address
 
 SATOSHIS = account.SATOSHIS
@@ -86,7 +86,7 @@ def utxo_to_input(utxo, script_type):
         amount=int(utxo.value),
         address_n=utxo.address.path,
         script_type=script_type,
-        prev_hash=bytes.fromhex(utxo.tx["txid"]),
+        prev_hash=bytes.fromhex(utxo.txid),
         prev_index=utxo.vout,
         sequence=0xFFFF_FFFD,
     )
@@ -102,9 +102,11 @@ def recipient_to_output(address, amount, script_type=OutputScriptType.PAYTOADDRE
 
 
 def signing_data(account, utxos, recipients, change_address, change_amount):
+    if account.account_type is account_types.ACCOUNT_TYPE_MULTISIG_SEGWIT:
+        raise ValueError("Spending from multisig accounts is not supported")
     details = SignTx(version=2)
     prev_txes = {
-        bytes.fromhex(u.tx["txid"]): coins.json_to_tx(account.coin, u.tx) for u in utxos
+        bytes.fromhex(u.txid): coins.json_to_tx(account.coin, u.tx) for u in utxos
     }
     inputs = [utxo_to_input(u, account.account_type.input_script_type) for u in utxos]
     outputs = [recipient_to_output(address, amount) for address, amount in recipients]
@@ -0,0 +1,130 @@
+import asyncio
+import collections
+from decimal import Decimal
+from hashlib import sha256
+
+from trezorlib.messages import HDNodeType
+
+from microwallet import coins, ec
+from microwallet.formats import xpub
+
+
+def make_node(seed, child_num=0x8000_0000):
+    """Make an account node with keys derived from a bytes or str `seed`."""
+    if isinstance(seed, str):
+        seed = seed.encode()
+    k = int.from_bytes(sha256(seed).digest(), "big")
+    return HDNodeType(
+        depth=3,
+        fingerprint=0,
+        child_num=child_num,
+        chain_code=sha256(b"chain code" + seed).digest(),
+        public_key=ec.encode_compressed(ec.to_affine(ec.multiply_generator(k))),
+    )
+
+
+def make_xpub(seed, coin_name="Bitcoin"):
+    return xpub.serialize(coins.by_name[coin_name]["xpub_magic"], make_node(seed))
+
+
+class InFlight:
+    """Counts address queries running at once, possibly across backends."""
+
+    def __init__(self):
+        self.count = 0
+        self.peak = 0
+
+
+class FakeBackend:
+    """Backend holding UTXOs of addresses, counting requests.
+
+    Address queries take `delay` seconds within the semaphore `limit`, if
+    given, and are tracked in `in_flight`. While `gate` is set to a cleared
+    event, they wait for it. Once `fail_after` requests were made, all further
+    ones fail.
+    """
+
+    def __init__(self, delay=0, limit=None, in_flight=None):
+        self.delay = delay
+        self.limit = limit
+        self.in_flight = in_flight or InFlight()
+        self.gate = None
+        self.received = collections.Counter()
+        self.utxos = collections.defaultdict(list)
+        self.requests = collections.Counter()
+        self.requested = []
+        self.height = 100
+        self.fail_after = None
+        self.connections = 0
+        self.connected = 0
+
+    async def __aenter__(self):
+        if self.connected == 0:
+            self.connections += 1
+        self.connected += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.connected -= 1
+
+    def pay(self, address, value):
+        txid = sha256(f"{address}{len(self.utxos[address])}".encode()).hexdigest()
+        self.utxos[address].append({"txid": txid, "vout": 0, "value": str(value)})
+        self.received[address] += value
+
+    def spend(self, address):
+        del self.utxos[address]
+
+    def _request(self, name):
+        if (
+            self.fail_after is not None
+            and sum(self.requests.values()) >= self.fail_after
+        ):
+            raise RuntimeError("Connection was closed")
+        self.requests[name] += 1
+
+    async def _wait(self):
+        if self.gate is not None:
+            await self.gate.wait()
+        if not self.delay:
+            return
+        self.in_flight.count += 1
+        self.in_flight.peak = max(self.in_flight.peak, self.in_flight.count)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight.count -= 1
+
+    async def get_best_height(self):
+        self._request("height")
+        return self.height
+
+    async def get_address_data(self, address):
+        self._request("address")
+        if self.limit is not None:
+            async with self.limit:
+                await self._wait()
+        else:
+            await self._wait()
+        self.requested.append(address)
+        balance = sum(Decimal(u["value"]) for u in self.utxos[address])
+        received = Decimal(self.received[address])
+        return {
+            "address": address,
+            "balance": balance,
+            "totalReceived": received,
+            "totalSent": received - balance,
+            "txs": len(self.utxos[address]),
+        }
+
+    async def get_utxos(self, address):
+        self._request("utxos")
+        return self.utxos[address]
+
+    async def get_txdata(self, txid):
+        self._request("tx")
+        return {"txid": txid, "fees": Decimal("0.0001")}
+
+    async def estimate_fee(self, blocks):
+        self._request("fee")
+        return 1000
@@ -1,11 +1,18 @@
+import asyncio
+import collections
 import itertools
+import os
+import subprocess
+import sys
 import typing
+from decimal import Decimal
 from hashlib import sha256
 
 import attr
 import pytest
 from asynctest import MagicMock
 
+import microwallet
 from microwallet import account_types, exceptions
 from microwallet.account import BIP32_ADDRESS_DISCOVERY_LIMIT, Account
 from microwallet.formats import xpub
@@ -193,6 +200,67 @@ async def test_active_after_gap(account):
     assert change_addresses[0].str == selected_address
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("window", (1, 7, 40))
+async def test_address_data_window(account, window):
+    active = set(account.test_vector.addresses[:2])
+    in_flight = 0
+    max_in_flight = 0
+    requested = 0
+    completed = 0
+
+    async def fetch(addr):
+        nonlocal in_flight, max_in_flight, completed
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            await asyncio.sleep(0.001)
+        finally:
+            in_flight -= 1
+        completed += 1
+        total = 100 if addr in active else 0
+        return {"address": addr, "totalReceived": total}
+
+    def mock_address_data(addr):
+        nonlocal requested
+        requested += 1
+        return fetch(addr)
+
+    account.backend.get_address_data = mock_address_data
+    account.scan_window = window
+    active_addresses = [a async for a in account.active_address_data()]
+
+    assert [a.str for a in active_addresses] == account.test_vector.addresses[:2]
+    assert max_in_flight == window
+    # gap limit is reached at address 2 + 21, surplus requests are cancelled
+    scanned = 2 + BIP32_ADDRESS_DISCOVERY_LIMIT + 1
+    assert requested == scanned + window - 1
+    assert completed < requested or window == 1
+    assert in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_active_addresses_both_chains(account):
+    vector = account.test_vector
+    active = {vector.addresses[0], vector.addresses[2], vector.change[1]}
+    change_addresses = set(account.address_range(0, 40, True).addresses)
+    requests = []
+
+    async def mock_address_data(addr):
+        requests.append(addr in change_addresses)
+        await asyncio.sleep(0.001)
+        total = 100 if addr in active else 0
+        return {"address": addr, "totalReceived": total}
+
+    account.backend.get_address_data = mock_address_data
+    found = [a.str async for a in account.active_addresses()]
+
+    assert found == [vector.addresses[0], vector.addresses[2], vector.change[1]]
+    # change chain requests were interleaved with the receive chain ones
+    first_change = requests.index(True)
+    assert False in requests[first_change:]
+
+
 @pytest.mark.asyncio
 async def test_balance(account):
     counter = 0
@@ -261,6 +329,57 @@ def utxo_account(account):
     return account
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", (1, 2, 20))
+async def test_find_utxos(utxo_account, concurrency):
+    in_flight = 0
+    max_in_flight = 0
+    fetched = []
+    get_utxos = utxo_account.backend.get_utxos
+
+    async def track(coro):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            return await coro
+        finally:
+            in_flight -= 1
+
+    async def mock_utxos(addr):
+        return await track(get_utxos(addr))
+
+    async def mock_txdata(txid):
+        fetched.append(txid)
+        return await track(asyncio.sleep(0, {"txid": txid}))
+
+    utxo_account.backend.get_utxos = mock_utxos
+    utxo_account.backend.get_txdata = mock_txdata
+    utxos = [u async for u in utxo_account.find_utxos(concurrency=concurrency)]
+
+    expected = [
+        (addr, sha256(addr.encode()).hexdigest(), n)
+        for addr in VECTORS[0].addresses[:3]
+        for n in range(3)
+    ]
+    assert [(u.address.str, u.txid, u.vout) for u in utxos] == expected
+    # parent transactions are loaded only on demand
+    assert not fetched
+    assert all(u.tx is None for u in utxos)
+
+    await utxo_account.load_transactions(utxos, concurrency=concurrency)
+    assert all(u.tx["txid"] == u.txid for u in utxos)
+    # every transaction pays three UTXOs, but is fetched only once
+    assert sorted(fetched) == sorted({txid for _, txid, _ in expected})
+    assert max_in_flight <= concurrency
+
+    # and kept for later
+    utxos = [u async for u in utxo_account.find_utxos(concurrency=concurrency)]
+    await utxo_account.load_transactions(utxos)
+    assert len(fetched) == 3
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("amount", (1000, 10000, 20000, 50000))
 async def test_fund_simple(utxo_account, amount):
@@ -317,3 +436,301 @@ async def test_fee_rolls_over(utxo_account):
     amount = SATOSHI_PER_UTXO - fee + 1
     _, change = await utxo_account.fund_tx([(ADDRESS, amount)])
     assert change is None
+
+
+@pytest.mark.parametrize("vector", VECTORS)
+def test_address_range(vector):
+    account = Account.from_xpub(vector.coin_name, vector.xpub)
+    batch = account.address_range(2, 4)
+    assert len(batch) == 4
+    assert batch.addresses == vector.addresses[2:6]
+    assert batch.path(0) == [0, 2]
+
+    expected = list(itertools.islice(account.addresses(change=True), 6))[1:]
+    rows = list(account.address_range(1, 5, change=True))
+    assert rows == [(a.path, a.str, a.public_key) for a in expected]
+
+
+def test_address_range_cached(tmp_path):
+    vector = VECTORS[2]
+    account = Account.from_xpub(vector.coin_name, vector.xpub, key_cache_dir=tmp_path)
+    # partially cached range
+    next(account.addresses())
+    assert account.address_range(0, 6).addresses == vector.addresses
+    # range that does not start in the cache
+    batch = account.address_range(40, 2)
+    assert len(account._key_cache(False)) < 40
+    assert batch.addresses == account.address_range(40, 2).addresses
+
+
+class XpubBackend:
+    supports_xpub_queries = True
+
+    def __init__(self, vector, used_receive, used_change):
+        self.vector = vector
+        self.used = [(0, i) for i in used_receive] + [(1, i) for i in used_change]
+        self.requests = collections.Counter()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def name(self, change, i):
+        return (self.vector.change if change else self.vector.addresses)[i]
+
+    async def get_xpub_info(self, descriptor):
+        self.requests["info"] += 1
+        assert descriptor == self.vector.xpub
+        tokens = [
+            {
+                "name": self.name(change, i),
+                "path": f"m/49'/2'/15'/{change}/{i}",
+                "transfers": 1,
+                "balance": Decimal(100 * (i + 1)),
+                "totalReceived": Decimal(100 * (i + 1)),
+                "totalSent": Decimal(0),
+            }
+            for change, i in self.used
+        ]
+        return {"balance": sum(t["balance"] for t in tokens), "tokens": tokens}
+
+    async def get_xpub_utxos(self, descriptor):
+        self.requests["utxos"] += 1
+        return [
+            {
+                "txid": f"{change}{i:063x}",
+                "vout": 0,
+                "value": "100",
+                "path": f"m/49'/2'/15'/{change}/{i}",
+                "address": self.name(change, i),
+            }
+            for change, i in reversed(self.used)
+        ]
+
+    async def get_txdata(self, txid):
+        self.requests["tx"] += 1
+        return {"txid": txid}
+
+    async def get_address_data(self, addr):
+        raise AssertionError("per-address scan with xpub discovery")
+
+    async def get_history(self, descriptor, page_size, from_height, to_height):
+        self.requests["history"] += 1
+        for change, i in self.used:
+            yield {"txid": f"{change}{i:063x}", "descriptor": descriptor}
+
+
+@pytest.fixture
+def xpub_account():
+    vector = VECTORS[0]
+    backend = XpubBackend(vector, used_receive=(0, 3), used_change=(1,))
+    return Account.from_xpub(vector.coin_name, vector.xpub, backend=backend)
+
+
+def test_xpub(vector=VECTORS[0]):
+    assert Account.from_xpub(vector.coin_name, vector.xpub).xpub == vector.xpub
+
+
+@pytest.mark.asyncio
+async def test_xpub_discovery(xpub_account):
+    vector = VECTORS[0]
+    active = [a async for a in xpub_account.active_addresses()]
+    assert [a.str for a in active] == [
+        vector.addresses[0],
+        vector.addresses[3],
+        vector.change[1],
+    ]
+    assert active[1].path == [0, 3]
+    assert await xpub_account.balance() == 100 + 400 + 200
+
+    unused = await xpub_account.get_unused_address()
+    assert unused.str == vector.addresses[1]
+    unused = await xpub_account.get_unused_address(change=True)
+    assert unused.str == vector.change[0]
+
+    utxos = [u async for u in xpub_account.find_utxos()]
+    assert [u.address.str for u in utxos] == [a.str for a in active]
+    assert xpub_account.backend.requests == {"info": 4, "utxos": 1}
+
+
+@pytest.mark.asyncio
+async def test_xpub_discovery_fallback(xpub_account):
+    vector = VECTORS[0]
+
+    backend = xpub_account.backend
+    get_xpub_info = backend.get_xpub_info
+
+    async def unsupported(descriptor):
+        raise exceptions.BackendError("Invalid address")
+
+    async def mock_address_data(addr):
+        total = 100 if addr == vector.addresses[2] else 0
+        return {"address": addr, "totalReceived": total, "balance": total}
+
+    backend.get_xpub_info = unsupported
+    backend.get_address_data = mock_address_data
+    assert await xpub_account.balance() == 100
+
+    # only the failed call scans addresses
+    backend.get_xpub_info = get_xpub_info
+    assert xpub_account.xpub_discovery
+    assert await xpub_account.balance() == 100 + 400 + 200
+    assert backend.requests["info"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", (asyncio.CancelledError, KeyError))
+async def test_xpub_discovery_error(xpub_account, error):
+    async def failing(descriptor):
+        raise error()
+
+    # only backend errors fall back to scanning addresses
+    xpub_account.backend.get_xpub_info = failing
+    with pytest.raises(error):
+        await xpub_account.balance()
+    assert xpub_account.xpub_discovery
+
+
+@pytest.mark.asyncio
+async def test_history(xpub_account):
+    vector = VECTORS[0]
+    history = [tx async for tx in xpub_account.history()]
+    assert [tx["descriptor"] for tx in history] == [vector.xpub] * 3
+    assert xpub_account.backend.requests == {"history": 1}
+
+    # without xpub queries, active addresses are listed one by one
+    xpub_account.xpub_discovery = False
+    used = {vector.addresses[0], vector.addresses[3], vector.change[1]}
+
+    async def mock_address_data(addr):
+        total = 100 if addr in used else 0
+        return {"address": addr, "totalReceived": total, "balance": total}
+
+    xpub_account.backend.get_address_data = mock_address_data
+    history = [tx async for tx in xpub_account.history()]
+    assert {tx["descriptor"] for tx in history} == used
+    assert xpub_account.backend.requests == {"history": 4}
+
+
+@pytest.mark.asyncio
+async def test_snapshot(utxo_account):
+    requests = collections.Counter()
+    backend = utxo_account.backend
+    for name in ("get_address_data", "get_utxos", "get_txdata", "estimate_fee"):
+
+        def counting(*args, _name=name, _request=getattr(backend, name)):
+            requests[_name] += 1
+            return _request(*args)
+
+        setattr(backend, name, counting)
+
+    snapshot = await utxo_account.refresh_snapshot()
+    scanned = dict(requests)
+    assert scanned["estimate_fee"] == 1
+    assert scanned["get_utxos"] == 3
+    assert [a.str for a in snapshot.addresses] == VECTORS[0].addresses[:3]
+
+    assert await utxo_account.balance() == 9 * SATOSHI_PER_UTXO
+    utxos, change = await utxo_account.fund_tx([(VECTORS[0].addresses[0], 1000)])
+    assert utxos and change
+    assert await utxo_account.estimate_fee() == 1000
+    receive = await utxo_account.get_unused_address()
+    assert receive.str == VECTORS[0].addresses[3]
+    change_address = await utxo_account.get_unused_address(change=True)
+    assert change_address.str == VECTORS[0].change[0]
+    assert len([u async for u in utxo_account.find_utxos()]) == 9
+    # everything was answered from the snapshot
+    assert requests == scanned
+
+    utxo_account.invalidate_snapshot()
+    assert await utxo_account.balance() == 9 * SATOSHI_PER_UTXO
+    assert requests["get_address_data"] > scanned["get_address_data"]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_expires(utxo_account):
+    utxo_account.snapshot_ttl = 10
+    snapshot = await utxo_account.refresh_snapshot()
+    assert snapshot.is_valid(snapshot.taken_at + 9)
+    assert not snapshot.is_valid(snapshot.taken_at + 10)
+
+    snapshot.taken_at -= 10
+    utxo_account.backend.estimate_fee = None
+    # expired snapshot is dropped and the fallback fee is used
+    assert await utxo_account.estimate_fee() != 1000
+    assert utxo_account.snapshot is None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_xpub(xpub_account):
+    vector = VECTORS[0]
+    xpub_account.backend.estimate_fee = lambda blocks: asyncio.sleep(0, 2000)
+    snapshot = await xpub_account.refresh_snapshot()
+    assert xpub_account.backend.requests == {"info": 1, "utxos": 1}
+    assert snapshot.unused[False].str == vector.addresses[1]
+    assert snapshot.unused[True].str == vector.change[0]
+    assert snapshot.balance == 700
+    assert snapshot.fee_rate == 2000
+
+
+ADDRESS_MEMORY_SCRIPT = """
+import resource, sys
+from decimal import Decimal
+from hashlib import sha256
+from microwallet.account import Account
+
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+account = Account.from_xpub(sys.argv[1], sys.argv[2])
+count = int(sys.argv[3])
+baseline = peak_rss()
+records = [
+    (b"\\x02" + sha256(n.to_bytes(4, "big")).digest(), f"bc1q{n:038d}")
+    for n in range(count)
+]
+addresses = account._make_addresses(False, 0, records)
+del records
+for n, address in enumerate(addresses):
+    balance = n % 3 * 1000
+    address.update({
+        "address": address.str,
+        "balance": Decimal(balance),
+        "totalReceived": Decimal(balance * 2),
+        "totalSent": Decimal(balance),
+        "unconfirmedBalance": Decimal(0),
+        "unconfirmedTxs": 0,
+        "txs": 2,
+        "txids": [sha256(address.str.encode()).hexdigest()] * 2,
+    })
+assert sum(a.used for a in addresses) == count * 2 // 3
+print(peak_rss() - baseline)
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs the resource module")
+def test_address_memory(account):
+    """Peak RSS growth of a process scanning 10k addresses is bounded.
+
+    The scan runs in a fresh interpreter, so that memory already held by the
+    test session does not hide the growth.
+    """
+    COUNT = 10_000
+    # upper bound on peak RSS growth per 10k scanned addresses
+    MAX_BYTES = 8_000_000
+
+    vector = account.test_vector
+    src = os.path.dirname(os.path.dirname(microwallet.__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([src, *sys.path]))
+    args = [vector.coin_name, vector.xpub, str(COUNT)]
+    output = subprocess.run(
+        [sys.executable, "-c", ADDRESS_MEMORY_SCRIPT, *args],
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    assert int(output) < MAX_BYTES
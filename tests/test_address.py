@@ -1,6 +1,6 @@
 import pytest
 
-from microwallet import address, coins
+from microwallet import account_types, address, coins
 
 VECTORS_P2PKH = [
     # m/44h/0h/15h/0/3
@@ -173,3 +173,47 @@ def test_address_segwit(addr, pubkey):
     pubkey_bytes = bytes.fromhex(pubkey)
     computed_addr = address.address_p2wpkh(version, pubkey_bytes)
     assert computed_addr == addr
+
+
+@pytest.mark.parametrize(
+    "account_type, vectors",
+    [
+        (account_types.ACCOUNT_TYPE_LEGACY, VECTORS_P2PKH[:4]),
+        (
+            account_types.ACCOUNT_TYPE_DEFAULT,
+            [("Bitcoin",) + v for v in VECTORS_P2SH_SEGWIT],
+        ),
+        (account_types.ACCOUNT_TYPE_SEGWIT, [("Bitcoin",) + v for v in VECTORS_SEGWIT]),
+    ],
+)
+def test_address_encoder(account_type, vectors):
+    encoder = account_type.address_encoder(coins.by_name["Bitcoin"])
+    for _, addr, pubkey in vectors:
+        assert encoder(bytes.fromhex(pubkey)) == addr
+
+
+def test_derive_output_scripts():
+    coin = coins.by_name["Bitcoin"]
+    vectors = VECTORS_P2PKH[:4] + [
+        ("Bitcoin",) + v for v in VECTORS_P2SH_SEGWIT + VECTORS_SEGWIT
+    ]
+    addresses = [addr for _, addr, _ in vectors]
+    expected = [
+        script_pubkey(bytes.fromhex(pubkey))
+        for script_pubkey, vecs in (
+            (address.script_pubkey_p2pkh, VECTORS_P2PKH[:4]),
+            (address.script_pubkey_p2sh_p2wpkh, VECTORS_P2SH_SEGWIT),
+            (address.script_pubkey_p2wpkh, VECTORS_SEGWIT),
+        )
+        for *_, pubkey in vecs
+    ]
+    assert address.derive_output_scripts(coin, addresses) == expected
+    assert [address.derive_output_script(coin, a) for a in addresses] == expected
+
+    with pytest.raises(ValueError):
+        address.derive_output_scripts(coin, addresses + [addresses[0][:-1] + "x"])
+    with pytest.raises(ValueError):
+        address.derive_output_script(coin, VECTORS_SEGWIT[0][0][:-1] + "q")
+    # Litecoin address is valid base58check, but not a Bitcoin address
+    with pytest.raises(ValueError):
+        address.derive_output_script(coin, VECTORS_P2PKH[4][1])
@@ -0,0 +1,57 @@
+import pytest
+
+from microwallet.formats import base58
+
+VECTORS = [
+    ("", ""),
+    ("61", "2g"),
+    ("626262", "a3gV"),
+    ("636363", "aPEr"),
+    ("73696d706c792061206c6f6e6720737472696e67", "2cFupjhnEsSn59qHXstmK2ffpLv2"),
+    (
+        "00eb15231dfceb60925886b67d065299925915aeb172c06647",
+        "1NS17iag9jJgTHD1VXjvLCEnZuQ3rJDE9L",
+    ),
+    ("516b6fcd0f", "ABnLTmg"),
+    ("bf4f89001e670274dd", "3SEo3LWLoPntC"),
+    ("572e4794", "3EFU7m"),
+    ("ecac89cad93923c02321", "EJDM8drfXA6uyA"),
+    ("10c8511e", "Rt5zm"),
+    ("00000000000000000000", "1111111111"),
+    (
+        "000111d38e5fc9071ffcd20b4a763cc9ae4f252bb4e48fd66a835e252ada93ff480d6dd43dc62a641155a5",
+        "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz",
+    ),
+]
+
+
+@pytest.mark.parametrize("data_hex, string", VECTORS)
+def test_vectors(data_hex, string):
+    data = bytes.fromhex(data_hex)
+    assert base58.encode(data) == string
+    assert base58.decode(string) == data
+
+
+def test_decode_invalid():
+    for string in ("0", "O", "I", "l", "3mJr0", "3mJr7AoUXx2Wqd "):
+        with pytest.raises(ValueError):
+            base58.decode(string)
+    assert base58.decode("2g", length=2) is None
+
+
+def test_check():
+    string = "1HeVhjL5hm3m6YB46KPaVKCsUFQTPVXpbZ"
+    data = base58.check_decode(string)
+    assert len(data) == 21 and data[0] == 0
+    assert base58.check_encode(data) == string
+    with pytest.raises(ValueError):
+        base58.check_decode(string[:-1] + "a")
+    with pytest.raises(ValueError):
+        base58.check_decode(string, length=20)
+
+
+def test_many():
+    items = [bytes([0, i]) * 10 for i in range(100)]
+    strings = base58.check_encode_many(items)
+    assert strings == [base58.check_encode(item) for item in items]
+    assert base58.check_decode_many(strings + ["1111", "0"]) == items + [None, None]
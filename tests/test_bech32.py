@@ -0,0 +1,104 @@
+import pytest
+
+from microwallet.formats import bech32, bech32_fast
+
+# BIP-173 test vectors
+VALID_CHECKSUM = [
+    "A12UEL5L",
+    "an83characterlonghumanreadablepartthatcontainsthenumber1andtheexcludedcharactersbio1tt5tgs",
+    "abcdef1qpzry9x8gf2tvdw0s3jn54khce6mua7lmqqqxw",
+    "11" + "q" * 82 + "c8247j",
+    "split1checkupstagehandshakeupstreamerranterredcaperred2y9e3w",
+]
+
+INVALID_CHECKSUM = [
+    " 1nwldj5",
+    "\x7f1axkwrx",
+    "an84characterslonghumanreadablepartthatcontainsthenumber1andtheexcludedcharactersbio1569pvx",
+    "pzry9x0s0muk",
+    "1pzry9x0s0muk",
+    "x1b4n0q5v",
+    "li1dgmt3",
+    "de1lg7wt\xff",
+]
+
+VALID_ADDRESS = [
+    (
+        "BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4",
+        "0014751e76e8199196d454941c45d1b3a323f1433bd6",
+    ),
+    (
+        "tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7",
+        "00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262",
+    ),
+    (
+        "bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7k7grplx",
+        "5128751e76e8199196d454941c45d1b3a323f1433bd6751e76e8199196d454941c45d1b3a323f1433bd6",
+    ),
+    ("BC1SW50QA3JX3S", "6002751e"),
+    ("bc1zw508d6qejxtdg4y5r3zarvaryvg6kdaj", "5210751e76e8199196d454941c45d1b3a323"),
+    (
+        "tb1qqqqqp399et2xygdj5xreqhjjvcmzhxw4aywxecjdzew6hylgvsesrxh6hy",
+        "0020000000c4a5cad46221b2a187905e5266362b99d5e91c6ce24d165dab93e86433",
+    ),
+]
+
+INVALID_ADDRESS = [
+    "tc1qw508d6qejxtdg4y5r3zarvary0c5xw7kg3g4ty",
+    "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5",
+    "BC13W508D6QEJXTDG4Y5R3ZARVARY0C5XW7KN40WF2",
+    "bc1rw5uspcuh",
+    "bc10w508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kw5rljs90",
+    "BC1QR508D6QEJXTDG4Y5R3ZARVARYV98GJ9P",
+    "tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sL5k7",
+    "bc1zw508d6qejxtdg4y5r3zarvaryvqyzf3du",
+    "tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3pjxtptv",
+    "bc1gmk9yu",
+]
+
+
+def script_pubkey(witver, witprog):
+    return bytes([witver + 0x50 if witver else 0, len(witprog)]) + witprog
+
+
+@pytest.mark.parametrize("bech", VALID_CHECKSUM)
+def test_valid_checksum(bech):
+    hrp, values = bech32_fast.bech32_decode(bech)
+    assert hrp is not None
+    assert (hrp, list(values)) == bech32.bech32_decode(bech)
+    assert bech32_fast.bech32_encode(hrp, values) == bech.lower()
+
+
+@pytest.mark.parametrize("bech", INVALID_CHECKSUM)
+def test_invalid_checksum(bech):
+    assert bech32_fast.bech32_decode(bech) == (None, None)
+
+
+@pytest.mark.parametrize("address, script_hex", VALID_ADDRESS)
+def test_valid_address(address, script_hex):
+    hrp = "bc" if address.lower().startswith("bc") else "tb"
+    witver, witprog = bech32_fast.decode(hrp, address)
+    assert witver is not None
+    assert script_pubkey(witver, witprog).hex() == script_hex
+    assert bech32_fast.encode(hrp, witver, witprog) == address.lower()
+    assert bech32.encode(hrp, witver, witprog) == address.lower()
+
+
+@pytest.mark.parametrize("address", INVALID_ADDRESS)
+def test_invalid_address(address):
+    assert bech32_fast.decode("bc", address) == (None, None)
+    assert bech32_fast.decode("tb", address) == (None, None)
+
+
+def test_encode_invalid_program():
+    assert bech32_fast.encode("bc", 17, b"\0" * 20) is None
+    assert bech32_fast.encode("bc", 0, b"\0" * 21) is None
+    assert bech32_fast.encode("bc", 1, b"\0") is None
+
+
+def test_many():
+    programs = [(0, bytes([i]) * 20) for i in range(50)] + [(1, b"\xab" * 32)]
+    addresses = bech32_fast.encode_many("bc", programs)
+    assert addresses == [bech32.encode("bc", *p) for p in programs]
+    assert bech32_fast.decode_many("bc", addresses) == programs
+    assert bech32_fast.decode_many("tb", addresses[:1]) == [(None, None)]
@@ -0,0 +1,73 @@
+import pytest
+
+from microwallet import bip32, coins
+from microwallet.formats import xpub
+from trezorlib.tools import H_, hash_160
+
+BITCOIN = coins.by_name["Bitcoin"]
+
+XPUB = (
+    "xpub6BiVtCpG9fQQdziwDT8EyYPLnuXs14FwNZqGHhMzPDMdLKc97agw"
+    "FKMb3FfiweRsnqkeHYymF31RJc9EozZxHUSHzkjQ2H9SKGe7GmRDGPM"
+)
+
+
+@pytest.fixture
+def node():
+    _, node = xpub.deserialize(XPUB)
+    return node
+
+
+@pytest.mark.parametrize("start, count", [(0, 1), (0, 25), (920, 10)])
+def test_get_subnodes(node, start, count):
+    subnodes = bip32.get_subnodes(node, start, count)
+    expected = [bip32.get_subnode(node, i) for i in range(start, start + count)]
+    assert subnodes == expected
+
+
+def test_get_subnodes_deeper(node):
+    receive = bip32.get_subnode(node, 0)
+    subnodes = bip32.get_subnodes(receive, 0, 16)
+    assert subnodes[3].public_key == bytes.fromhex(
+        "026b4fc8187155120547f9b2074bd8edb907c82edb0b0c00b7cff3a3b122072a49"
+    )
+    assert subnodes[14].public_key == bytes.fromhex(
+        "03259227d6d0bc4b16ff88d39f216319b71ca357c6add40bc4b165a4691acdcaf4"
+    )
+
+
+def test_get_subnodes_empty(node):
+    assert bip32.get_subnodes(node, 5, 0) == []
+
+
+def test_get_subnodes_hardened(node):
+    with pytest.raises(ValueError):
+        bip32.get_subnodes(node, H_(0), 1)
+    with pytest.raises(ValueError):
+        bip32.get_subnodes(node, H_(0) - 2, 5)
+
+
+def test_node_conversion(node):
+    compact = bip32.Node.from_hdnode(node)
+    assert compact.to_hdnode() == node
+    assert compact.fingerprint == node.fingerprint
+
+
+def test_node_lazy_fingerprint(node):
+    child = bip32.get_subnode(node, 0)
+    assert child._fingerprint is None
+    assert child.fingerprint == int.from_bytes(hash_160(node.public_key)[:4], "big")
+    assert child.to_hdnode().fingerprint == child.fingerprint
+
+
+def test_node_point(node):
+    child = bip32.get_subnode(node, 7)
+    assert child.point == bip32.Node.from_hdnode(child.to_hdnode()).point
+
+
+def test_node_xpub(node):
+    version = BITCOIN["xpub_magic"]
+    child = bip32.get_subnode(node, 5)
+    xpub_str = xpub.serialize(version, child)
+    _, parsed = xpub.deserialize(xpub_str)
+    assert bip32.Node.from_hdnode(parsed) == child
@@ -263,3 +263,262 @@ async def test_estimate_fee(backend):
     fee = await backend.estimate_fee(10)
     assert fee
     assert int(fee)
+
+
+class AddressSocket:
+    """Answers getAccountInfo after a delay, remembering what was asked."""
+
+    def __init__(self, used, delay=0.002):
+        self.used = used
+        self.delay = delay
+        self.sent = []
+        self.responses = asyncio.Queue()
+
+    async def send(self, datastr):
+        data = json.loads(datastr)
+        address = data["params"]["descriptor"]
+        self.sent.append(address)
+        total = 100 if address in self.used else 0
+        result = dict(id=data["id"], data=dict(address=address, totalReceived=total))
+        loop = asyncio.get_event_loop()
+        loop.call_later(self.delay, self.responses.put_nowait, json.dumps(result))
+
+    async def recv(self):
+        return await self.responses.get()
+
+    async def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("used", (0, 3, 30))
+async def test_abandoned_requests(caplog, used):
+    from microwallet.account import Account
+
+    socket = AddressSocket(set())
+    fut = asyncio.Future()
+    fut.set_result(socket)
+    websockets_connect = asynctest.Mock(return_value=fut)
+    backend = BlockbookWebsocketBackend("Bitcoin")
+    account = Account.from_xpub(
+        "Bitcoin",
+        "xpub6BiVtCpG9fQPxnPmHXG8PhtzQdWC2Su4qWu6XW9tpWFYhxydCLJGrWBJZ5H6qTAHdPQ7pQhtpjiYZVZARo14qHiay2fvrX996oEP42u8wZy",
+        backend=backend,
+        xpub_discovery=False,
+    )
+    socket.used = set(account.address_range(0, used).addresses)
+
+    with mock.patch("websockets.connect", websockets_connect):
+        async with backend:
+            address = await account.get_unused_address()
+            assert address.path[-1] == used
+            # nobody waits for abandoned requests any more
+            assert not backend._ws_response_cache
+            # late responses arrive and are dropped quietly
+            await asyncio.sleep(socket.delay * 5)
+
+    consumed = used + 1
+    wasted = len(socket.sent) - consumed
+    assert wasted <= consumed
+    assert not [r for r in caplog.records if r.levelname == "ERROR"]
+
+
+@pytest.mark.asyncio
+async def test_cancel_before_send():
+    socket = AddressSocket(set())
+    fut = asyncio.Future()
+    fut.set_result(socket)
+    websockets_connect = asynctest.Mock(return_value=fut)
+    with mock.patch("websockets.connect", websockets_connect):
+        backend = BlockbookWebsocketBackend("Bitcoin")
+        async with backend:
+            requests = [
+                asyncio.ensure_future(backend.get_address_data(str(n)))
+                for n in range(5)
+            ]
+            for request in requests:
+                request.cancel()
+            await asyncio.gather(*requests, return_exceptions=True)
+            assert not socket.sent
+            assert not backend._ws_response_cache
+
+
+@pytest.mark.asyncio
+async def test_request_limit():
+    socket = AddressSocket(set())
+    fut = asyncio.Future()
+    fut.set_result(socket)
+    websockets_connect = asynctest.Mock(return_value=fut)
+    limit = asyncio.Semaphore(3)
+    with mock.patch("websockets.connect", websockets_connect):
+        backends = [BlockbookWebsocketBackend("Bitcoin", limit=limit) for _ in "ab"]
+        async with backends[0], backends[1]:
+            requests = [
+                asyncio.ensure_future(backend.get_address_data(str(n)))
+                for n in range(5)
+                for backend in backends
+            ]
+            await asyncio.sleep(0)
+            # the limit is shared by both backends
+            assert len(socket.sent) == 3
+            await asyncio.gather(*requests)
+            assert len(socket.sent) == 10
+
+
+class HistorySocket:
+    """Serves pages of a list of transactions, newest first."""
+
+    def __init__(self, count, total_pages=True):
+        self.txs = [{"txid": f"{n:064x}", "blockHeight": n} for n in range(count)]
+        self.txs.reverse()
+        self.total_pages = total_pages
+        self.arrivals = {}
+        self.sent = []
+        self.responses = asyncio.Queue()
+
+    async def send(self, datastr):
+        data = json.loads(datastr)
+        params = data["params"]
+        self.sent.append(params)
+        page, size = params["page"], params["pageSize"]
+        for tx in self.arrivals.pop(page, []):
+            self.txs.insert(0, tx)
+        txs = [
+            tx
+            for tx in self.txs
+            if params.get("from", 0) <= tx["blockHeight"] <= params.get("to", 1e9)
+        ]
+        result = dict(page=page, transactions=txs[(page - 1) * size : page * size])
+        if self.total_pages:
+            result["totalPages"] = -(-len(txs) // size)
+        loop = asyncio.get_event_loop()
+        loop.call_later(
+            0.001,
+            self.responses.put_nowait,
+            json.dumps(dict(id=data["id"], data=result)),
+        )
+
+    async def recv(self):
+        return await self.responses.get()
+
+    async def close(self):
+        pass
+
+
+class XpubSocket:
+    """Serves getAccountInfo of an xpub, paging tokens and transactions."""
+
+    def __init__(self, token_count, tx_count):
+        self.tokens = [
+            {"name": f"address{n}", "path": f"m/84'/0'/0'/0/{n}", "balance": "1"}
+            for n in range(token_count)
+        ]
+        self.tx_count = tx_count
+        self.sent = []
+        self.responses = asyncio.Queue()
+
+    async def send(self, datastr):
+        data = json.loads(datastr)
+        params = data["params"]
+        self.sent.append(params)
+        page, size = params["page"], params["pageSize"]
+        result = dict(
+            page=page,
+            totalPages=-(-self.tx_count // size),
+            balance=str(len(self.tokens)),
+            tokens=self.tokens[(page - 1) * size : page * size],
+        )
+        self.responses.put_nowait(json.dumps(dict(id=data["id"], data=result)))
+
+    async def recv(self):
+        return await self.responses.get()
+
+    async def close(self):
+        pass
+
+
+def history_backend(socket):
+    fut = asyncio.Future()
+    fut.set_result(socket)
+    websockets_connect = asynctest.Mock(return_value=fut)
+    return mock.patch("websockets.connect", websockets_connect)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("total_pages", (True, False))
+async def test_get_history(total_pages):
+    socket = HistorySocket(25, total_pages)
+    with history_backend(socket):
+        backend = BlockbookWebsocketBackend("Bitcoin")
+        async with backend:
+            history = backend.get_history("xpub", page_size=10)
+            heights = []
+            async for tx in history:
+                heights.append(tx["blockHeight"])
+                await asyncio.sleep(0)
+                # the next page is requested while the current one is consumed,
+                # but never more than one page ahead
+                page = (len(heights) - 1) // 10 + 1
+                assert len(socket.sent) == min(page + 1, 3)
+    assert heights == list(range(24, -1, -1))
+    assert {p["details"] for p in socket.sent} == {"txs"}
+
+
+@pytest.mark.asyncio
+async def test_get_history_bounds():
+    socket = HistorySocket(25)
+    with history_backend(socket):
+        backend = BlockbookWebsocketBackend("Bitcoin")
+        async with backend:
+            history = backend.get_history("xpub", 10, from_height=5, to_height=12)
+            heights = [tx["blockHeight"] async for tx in history]
+    assert heights == list(range(12, 4, -1))
+    assert socket.sent[0]["from"] == 5 and socket.sent[0]["to"] == 12
+
+
+@pytest.mark.asyncio
+async def test_get_history_shifted():
+    socket = HistorySocket(25)
+    # a new transaction pushes the last one of page 1 to page 2
+    socket.arrivals[2] = [{"txid": "ff" * 32, "blockHeight": 30}]
+    with history_backend(socket):
+        backend = BlockbookWebsocketBackend("Bitcoin")
+        async with backend:
+            heights = [tx["blockHeight"] async for tx in backend.get_history("x", 10)]
+    assert heights == list(range(24, -1, -1))
+
+
+@pytest.mark.asyncio
+async def test_get_history_close():
+    socket = HistorySocket(100)
+    with history_backend(socket):
+        backend = BlockbookWebsocketBackend("Bitcoin")
+        async with backend:
+            history = backend.get_history("xpub", 10)
+            async for tx in history:
+                break
+            await history.aclose()
+            # the prefetched page is abandoned
+            assert not backend._ws_response_cache
+            await asyncio.sleep(0.01)
+    assert len(socket.sent) <= 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "token_count, tx_count, pages",
+    [(25, 25, [1, 2, 3]), (5, 40, [1, 2]), (5, 5, [1]), (0, 0, [1])],
+)
+async def test_get_xpub_info_pages(token_count, tx_count, pages):
+    socket = XpubSocket(token_count, tx_count)
+    with history_backend(socket), mock.patch(
+        "microwallet.blockbook.XPUB_PAGE_SIZE", 10
+    ):
+        backend = BlockbookWebsocketBackend("Bitcoin")
+        async with backend:
+            info = await backend.get_xpub_info("xpub")
+    assert info["balance"] == token_count
+    assert [t["name"] for t in info["tokens"]] == [t["name"] for t in socket.tokens]
+    assert all(t["balance"] == 1 for t in info["tokens"])
+    # each page is requested once, and none past the last one with tokens
+    assert [p["page"] for p in socket.sent] == pages
@@ -0,0 +1,84 @@
+import itertools
+
+import pytest
+from asynctest import MagicMock
+
+from microwallet.account import Account
+from microwallet.derivation import DerivationService, derive_chunk
+
+XPUB = (
+    "Mtub2syZtptY6mWDbfUYxStNwpWfnC1GCjgn94i7LACu9euPviukSSVp"
+    "tfWu8kC7LKjD2pEUAf4Tk78zEG3eNEeFp1vdCuEaWu4thgYCiTP5fiA"
+)
+
+
+def expected_addresses(change, n):
+    account = Account.from_xpub("Litecoin", XPUB)
+    return list(itertools.islice(account.addresses(change), n))
+
+
+async def collect(account, change, n):
+    stream = account.address_stream(change)
+    try:
+        return [a async for a in _take(stream, n)]
+    finally:
+        await stream.aclose()
+
+
+async def _take(stream, n):
+    async for address in stream:
+        if n == 0:
+            return
+        yield address
+        n -= 1
+
+
+def test_derive_chunk():
+    account = Account.from_xpub("Litecoin", XPUB)
+    encoder = account._address_encoder()
+    records = derive_chunk(account.addr_node, 3, 4, encoder)
+    expected = expected_addresses(False, 7)[3:]
+    assert records == [(a.public_key, a.str) for a in expected]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", (None, 0, 2))
+async def test_address_stream(workers):
+    with DerivationService(workers, chunk_size=7) as deriver:
+        if workers is None:
+            deriver = None
+        account = Account.from_xpub("Litecoin", XPUB, deriver=deriver)
+        assert await collect(account, False, 30) == expected_addresses(False, 30)
+        assert await collect(account, True, 10) == expected_addresses(True, 10)
+
+
+@pytest.mark.asyncio
+async def test_address_stream_cached(tmp_path):
+    expected = expected_addresses(False, 30)
+
+    account = Account.from_xpub("Litecoin", XPUB, key_cache_dir=tmp_path)
+    assert list(itertools.islice(account.addresses(), 12)) == expected[:12]
+
+    with DerivationService(2, chunk_size=5) as deriver:
+        account = Account.from_xpub(
+            "Litecoin", XPUB, key_cache_dir=tmp_path, deriver=deriver
+        )
+        assert await collect(account, False, 30) == expected
+    assert len(account._key_cache(False)) >= 30
+
+
+@pytest.mark.asyncio
+async def test_scan_with_workers():
+    with DerivationService(2) as deriver:
+        account = Account.from_xpub(
+            "Litecoin", XPUB, backend=MagicMock(), deriver=deriver
+        )
+        active = set(a.str for a in expected_addresses(False, 30)[::4])
+
+        async def mock_address_data(addr):
+            total = 100 if addr in active else 0
+            return {"address": addr, "totalReceived": total, "balance": total}
+
+        account.backend.get_address_data = mock_address_data
+        found = [a.str async for a in account.active_address_data()]
+        assert set(found) == active
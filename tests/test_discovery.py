@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import FakeBackend, make_node
+from microwallet import account_types
+from microwallet.account import ADDRESS_DATA_WINDOW, Account
+from microwallet.discovery import discover_accounts, supported_account_types
+
+TYPES = [
+    account_types.ACCOUNT_TYPE_LEGACY,
+    account_types.ACCOUNT_TYPE_DEFAULT,
+    account_types.ACCOUNT_TYPE_SEGWIT,
+]
+
+
+@pytest.mark.asyncio
+async def test_discover_accounts():
+    backend = FakeBackend(delay=0.001)
+    opened = []
+
+    def open_account(account_type, number):
+        opened.append((account_type.type_id, number))
+        seed = f"{account_type.type_id}/{number}"
+        node = make_node(seed, 0x8000_0000 + number)
+        return Account("Bitcoin", node, account_type, backend=backend)
+
+    # legacy accounts 0 and 1, native segwit account 0 are used
+    for account_type, number, index, value in (
+        (TYPES[0], 0, 0, 1000),
+        (TYPES[0], 1, 5, 2000),
+        (TYPES[2], 0, 1, 300),
+    ):
+        account = open_account(account_type, number)
+        backend.pay(account.address_range(index, 1).addresses[0], value)
+    opened.clear()
+
+    summaries = await discover_accounts("Bitcoin", open_account)
+    result = [
+        (s.account_type.type_id, s.number, s.active_addresses, s.balance)
+        for s in summaries
+    ]
+    assert result == [
+        (44, 0, 1, 1000),
+        (44, 1, 1, 2000),
+        (44, 2, 0, 0),
+        (49, 0, 0, 0),
+        (84, 0, 1, 300),
+        (84, 1, 0, 0),
+    ]
+    # every type stops at its first unused account
+    assert sorted(opened) == [(44, 0), (44, 1), (44, 2), (49, 0), (84, 0), (84, 1)]
+    # one connection for the whole discovery; both chains of three account
+    # types are scanned at the same time
+    assert backend.connections == 1
+    assert backend.in_flight.peak > 2 * ADDRESS_DATA_WINDOW
+
+
+def test_supported_account_types():
+    assert supported_account_types("Bitcoin") == TYPES
+    assert supported_account_types("Dogecoin") == TYPES[:1]
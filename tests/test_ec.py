@@ -0,0 +1,90 @@
+import hashlib
+
+import pytest
+from fastecdsa.curve import secp256k1
+
+from microwallet import ec
+
+SCALARS = [1, 2, 255, 256, 2 ** 255 + 12345, ec.N - 1, ec.N, ec.N + 7] + [
+    int.from_bytes(hashlib.sha256(bytes([i])).digest(), "big") for i in range(8)
+]
+
+
+def fastecdsa_multiply(k):
+    point = k * secp256k1.G
+    return point.x, point.y
+
+
+@pytest.mark.parametrize("k", SCALARS)
+def test_multiply_generator(k):
+    result = ec.multiply_generator(k)
+    if k % ec.N == 0:
+        assert result is None
+    else:
+        assert ec.to_affine(result) == fastecdsa_multiply(k)
+
+
+def test_batch_normalize():
+    points = [ec.multiply_generator(k) for k in SCALARS[:5]]
+    expected = [fastecdsa_multiply(k) for k in SCALARS[:5]]
+    assert ec.batch_normalize(points) == expected
+    assert ec.batch_normalize([]) == []
+
+
+def test_table_roundtrip(tmp_path):
+    table = ec.generator_table()
+    path = str(tmp_path / "table.bin")
+    table.save(path)
+    loaded = ec.GeneratorTable.load(path)
+    assert loaded.rows == table.rows
+
+
+def test_table_corrupted():
+    data = bytearray(ec.generator_table().to_bytes())
+    data[-1] ^= 1
+    with pytest.raises(ValueError):
+        ec.GeneratorTable.from_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        ec.GeneratorTable.from_bytes(b"garbage")
+
+
+def tampered_table(tamper):
+    """Serialized generator table with rows changed by `tamper`, and a valid checksum."""
+    rows = [row[1:] for row in ec.generator_table().rows]
+    tamper(rows)
+    payload = b"".join(
+        x.to_bytes(32, "big") + y.to_bytes(32, "big") for row in rows for x, y in row
+    )
+    return ec.GENERATOR_TABLE_MAGIC + hashlib.sha256(payload).digest() + payload
+
+
+def replace_last(rows):
+    # another point on the curve
+    rows[5][-1] = ec.G
+
+
+def replace_row(rows):
+    rows[2] = rows[3]
+
+
+def off_curve(rows):
+    x, y = rows[7][100]
+    rows[7][100] = x, y + 1
+
+
+@pytest.mark.parametrize("tamper", (replace_last, replace_row, off_curve))
+def test_table_tampered(tamper):
+    with pytest.raises(ValueError):
+        ec.GeneratorTable.from_bytes(tampered_table(tamper))
+
+
+def test_table_tampered_file(tmp_path, monkeypatch):
+    path = tmp_path / "table.bin"
+    path.write_bytes(tampered_table(replace_last))
+    monkeypatch.setenv(ec.GENERATOR_TABLE_ENV, str(path))
+    monkeypatch.setattr(ec, "_generator_table", None)
+
+    # the table is computed again and replaces the file
+    table = ec.generator_table()
+    assert ec.to_affine(table.multiply(12345)) == fastecdsa_multiply(12345)
+    assert ec.GeneratorTable.load(str(path)).rows == table.rows
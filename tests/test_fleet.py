@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeBackend, InFlight, make_xpub
+from microwallet.account import Account
+from microwallet.fleet import FleetEntry, FleetStats, read_fleet, scan_fleet
+
+
+def test_read_fleet():
+    lines = [
+        "# coin, xpub",
+        "",
+        f"Bitcoin {make_xpub('Bitcoin/0', 'Bitcoin')}",
+        f"Litecoin,{make_xpub('Litecoin/0', 'Litecoin')}",
+    ]
+    assert list(read_fleet(lines)) == [
+        FleetEntry(3, "Bitcoin", make_xpub("Bitcoin/0", "Bitcoin")),
+        FleetEntry(4, "Litecoin", make_xpub("Litecoin/0", "Litecoin")),
+    ]
+
+    with pytest.raises(ValueError):
+        list(read_fleet(["FakeCoin$$$ xpub"]))
+    with pytest.raises(ValueError):
+        list(read_fleet(["Bitcoin"]))
+
+
+@pytest.mark.asyncio
+async def test_scan_fleet():
+    in_flight = InFlight()
+    backends = {}
+
+    def make_backend(coin_name, limit):
+        assert coin_name not in backends
+        backends[coin_name] = FakeBackend(0.001, limit, in_flight)
+        return backends[coin_name]
+
+    entries = [
+        FleetEntry(n, coin_name, make_xpub(f"{coin_name}/{n}", coin_name))
+        for n, coin_name in enumerate(["Bitcoin", "Litecoin", "Dogecoin"] * 4)
+    ]
+    entries.append(FleetEntry(12, "Bitcoin", "not an xpub"))
+
+    results = []
+    stats = FleetStats()
+    async for result in scan_fleet(
+        entries, make_backend, max_requests=7, max_accounts=5, xpub_discovery=False
+    ):
+        # results are streamed while the scan runs
+        assert all(backend.connected for backend in backends.values())
+        results.append(result)
+        stats.add(result)
+
+    assert sorted(r.entry.line for r in results) == list(range(13))
+    assert [r.entry.line for r in results if not r.ok] == [12]
+    assert all(r.balance == 0 for r in results if r.ok)
+    assert stats.scanned == 13 and stats.failed == 1
+    assert stats.xpubs_per_minute > 0
+
+    # one connection per coin for the whole scan, all requests under one cap
+    assert sorted(backends) == ["Bitcoin", "Dogecoin", "Litecoin"]
+    assert all(b.connections == 1 and b.connected == 0 for b in backends.values())
+    assert in_flight.peak == 7
+
+
+@pytest.mark.asyncio
+async def test_scan_fleet_utxos():
+    def make_backend(coin_name, limit):
+        return backend
+
+    entry = FleetEntry(1, "Bitcoin", make_xpub("Bitcoin/1", "Bitcoin"))
+    backend = FakeBackend()
+    account = Account.from_xpub("Bitcoin", entry.xpub)
+    for index, value in ((0, 1000), (2, 500)):
+        backend.pay(account.address_range(index, 1).addresses[0], value)
+
+    results = [
+        r
+        async for r in scan_fleet(
+            [entry], make_backend, utxos=True, xpub_discovery=False
+        )
+    ]
+    assert [(r.balance, r.utxos) for r in results] == [(1500, 2)]
+
+
+@pytest.mark.asyncio
+async def test_scan_fleet_backend_down():
+    backends = {}
+
+    class DownBackend(FakeBackend):
+        async def __aenter__(self):
+            raise OSError("Connection refused")
+
+    def make_backend(coin_name, limit):
+        cls = DownBackend if coin_name == "Litecoin" else FakeBackend
+        backends[coin_name] = cls(0.001, limit)
+        return backends[coin_name]
+
+    entries = [
+        FleetEntry(n, coin_name, make_xpub(f"{coin_name}/{n}", coin_name))
+        for n, coin_name in enumerate(["Bitcoin", "Litecoin"] * 3)
+    ]
+    results = [
+        r
+        async for r in scan_fleet(
+            entries, make_backend, max_accounts=2, xpub_discovery=False
+        )
+    ]
+
+    assert sorted(r.entry.line for r in results) == list(range(6))
+    failed = [r for r in results if not r.ok]
+    assert [r.entry.coin_name for r in failed] == ["Litecoin"] * 3
+    assert all("Connection refused" in r.error for r in failed)
+    assert all(r.balance == 0 for r in results if r.ok)
+    # one connection attempt per coin
+    assert sorted(backends) == ["Bitcoin", "Litecoin"]
+    assert backends["Bitcoin"].connected == 0
@@ -0,0 +1,119 @@
+import itertools
+
+import pytest
+
+from microwallet import keycache
+from microwallet.account import Account
+
+KEY = keycache.cache_key("test", b"\x01\x02")
+XPUB = (
+    "zpub6rszzdAK6RubKxxKxydVq6Bpjz1mt8BBitik5JMBy3QZeegBLHYp"
+    "9Nw5UR6xa6PrMdn4hfF79rQcfri7pvqo5jJdrYj1WowiVDtGBjD9nbS"
+)
+PUBKEY = bytes.fromhex(
+    "026b4fc8187155120547f9b2074bd8edb907c82edb0b0c00b7cff3a3b122072a49"
+)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = keycache.KeyCache.open(tmp_path, KEY)
+    yield cache
+    cache.close()
+
+
+def test_append_and_read(tmp_path, cache):
+    records = [(PUBKEY, f"address{i}") for i in range(5)]
+    cache.append(0, records[:3])
+    cache.append(3, records[3:])
+    assert len(cache) == 5
+    assert list(cache.records()) == records
+    assert cache[4] == records[4]
+    cache.close()
+
+    reopened = keycache.KeyCache.open(tmp_path, KEY)
+    assert list(reopened.records(2)) == records[2:]
+    reopened.close()
+
+
+def test_append_overlap(cache):
+    cache.append(0, [(PUBKEY, "a"), (PUBKEY, "b")])
+    # overlapping range only appends the new part
+    cache.append(1, [(PUBKEY, "b"), (PUBKEY, "c")])
+    # range leaving a gap is ignored
+    cache.append(5, [(PUBKEY, "f")])
+    assert [a for _, a in cache.records()] == ["a", "b", "c"]
+
+
+def test_invalid_header(tmp_path, cache):
+    cache.append(0, [(PUBKEY, "a")])
+    cache.close()
+
+    with open(cache.path, "r+b") as f:
+        f.seek(keycache.HEADER.size - 1)
+        f.write(b"\xff")
+
+    reopened = keycache.KeyCache.open(tmp_path, KEY)
+    assert len(reopened) == 0
+    reopened.close()
+
+
+def test_corrupted_record(tmp_path, cache):
+    cache.append(0, [(PUBKEY, f"address{i}") for i in range(5)])
+    cache.close()
+
+    with open(cache.path, "r+b") as f:
+        f.seek(keycache.HEADER.size + 3 * keycache.RECORD.size + 40)
+        f.write(b"X")
+
+    # records from the corrupted one on are dropped
+    reopened = keycache.KeyCache.open(tmp_path, KEY)
+    assert [a for _, a in reopened.records()] == ["address0", "address1", "address2"]
+    reopened.append(3, [(PUBKEY, "address3")])
+    reopened.close()
+    reopened = keycache.KeyCache.open(tmp_path, KEY)
+    assert len(reopened) == 4
+    reopened.close()
+
+
+def test_different_key(tmp_path, cache):
+    cache.append(0, [(PUBKEY, "a")])
+    other = keycache.KeyCache(cache.path, keycache.cache_key("other"))
+    assert len(other) == 0
+    other.close()
+
+
+def test_account_addresses(tmp_path):
+    fresh = Account.from_xpub("Bitcoin", XPUB)
+    expected = list(itertools.islice(fresh.addresses(change=True), 30))
+
+    account = Account.from_xpub("Bitcoin", XPUB, key_cache_dir=tmp_path)
+    generated = list(itertools.islice(account.addresses(change=True), 5))
+    assert generated == expected[:5]
+    assert len(account._key_cache(True)) >= 5
+
+    cached_account = Account.from_xpub("Bitcoin", XPUB, key_cache_dir=tmp_path)
+    generated = list(itertools.islice(cached_account.addresses(change=True), 30))
+    assert generated == expected
+    assert [a.path for a in generated] == [[1, i] for i in range(30)]
+
+    # receive chain has a separate cache
+    receive = next(cached_account.addresses())
+    assert receive.str == "bc1q9yjrygcxx93ur9jgmjle60l8kqwwcxllld3d7s"
+
+
+def test_account_corrupted_cache(tmp_path):
+    expected = list(
+        itertools.islice(Account.from_xpub("Bitcoin", XPUB).addresses(), 10)
+    )
+    account = Account.from_xpub("Bitcoin", XPUB, key_cache_dir=tmp_path)
+    list(itertools.islice(account.addresses(), 10))
+    path = account._key_cache(False).path
+    account._key_cache(False).close()
+
+    with open(path, "r+b") as f:
+        f.seek(keycache.HEADER.size + 5 * keycache.RECORD.size + 34)
+        f.write(b"q")
+
+    cached_account = Account.from_xpub("Bitcoin", XPUB, key_cache_dir=tmp_path)
+    assert list(itertools.islice(cached_account.addresses(), 10)) == expected
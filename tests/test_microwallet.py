@@ -1,9 +1,22 @@
 """Tests for `microwallet` package."""
 
+import itertools
+import json
+from unittest import mock
+
 import pytest
 from click.testing import CliRunner
 
-from microwallet import cli
+from conftest import make_xpub
+from microwallet import cli, derivation
+from microwallet.cli.microwallet import main
+from microwallet.multisig import MultisigAccount
+
+XPUB = (
+    "zpub6rszzdAK6RubKxxKxydVq6Bpjz1mt8BBitik5JMBy3QZeegBLHYp"
+    "9Nw5UR6xa6PrMdn4hfF79rQcfri7pvqo5jJdrYj1WowiVDtGBjD9nbS"
+)
+RECIPIENT = "bc1qvp7jgc5uyn62w34fywe4v6kpp2wy4k9yyv9hgw"
 
 
 @pytest.mark.xfail
@@ -16,3 +29,75 @@ def test_command_line_interface():
     help_result = runner.invoke(cli.main, ["--help"])
     assert help_result.exit_code == 0
     assert "--help  Show this message and exit." in help_result.output
+
+
+def test_export_addresses():
+    runner = CliRunner()
+    args = ["-x", XPUB, "--no-cache", "addresses", "-s", "3", "-n", "2"]
+
+    result = runner.invoke(main, args)
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0] == "path,address,public_key"
+    assert lines[1].startswith(
+        "m/0/3,bc1qvp7jgc5uyn62w34fywe4v6kpp2wy4k9yyv9hgw,02b274"
+    )
+    assert len(lines) == 3
+
+    result = runner.invoke(main, args + ["-f", "ndjson"])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [r["path"] for r in records] == ["m/0/3", "m/0/4"]
+    assert records[0]["address"] == "bc1qvp7jgc5uyn62w34fywe4v6kpp2wy4k9yyv9hgw"
+
+
+def test_export_multisig_addresses():
+    xpubs = [make_xpub(b"a"), make_xpub(b"b")]
+    account = MultisigAccount.from_xpubs("Bitcoin", xpubs, 2)
+    expected = list(itertools.islice(account.addresses(change=True), 2))
+
+    runner = CliRunner()
+    args = ["-x", xpubs[0], "-x", xpubs[1], "-m", "2", "--no-cache", "addresses"]
+    result = runner.invoke(main, args + ["-C", "-n", "2"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0] == "path,address,witness_script"
+    assert lines[1:] == [
+        f"m/1/{i},{a.str},{a.script.hex()}" for i, a in enumerate(expected)
+    ]
+
+    result = runner.invoke(main, args + ["-C", "-n", "2", "-f", "ndjson"])
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [r["witness_script"] for r in records] == [a.script.hex() for a in expected]
+    assert "public_key" not in records[0]
+
+
+@pytest.mark.parametrize("command", ("fund", "send"))
+def test_spend_multisig(command):
+    xpubs = [make_xpub(b"a"), make_xpub(b"b")]
+    runner = CliRunner()
+    args = ["-x", xpubs[0], "-x", xpubs[1], "-m", "2", "--no-cache", command]
+    result = runner.invoke(main, args + [RECIPIENT, "0.001"])
+    assert result.exit_code == 1
+    assert "multisig accounts is not supported" in result.output
+
+
+def test_workers_closed():
+    services = []
+
+    class DerivationService(derivation.DerivationService):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.closed = False
+            services.append(self)
+
+        def close(self):
+            super().close()
+            self.closed = True
+
+    runner = CliRunner()
+    args = ["-x", XPUB, "-w", "2", "--no-cache", "addresses", "-n", "2"]
+    with mock.patch.object(derivation, "DerivationService", DerivationService):
+        result = runner.invoke(main, args)
+    assert result.exit_code == 0
+    assert [s.closed for s in services] == [True]
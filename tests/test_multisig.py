@@ -0,0 +1,122 @@
+import itertools
+
+import pytest
+from asynctest import MagicMock
+
+from conftest import make_xpub
+from microwallet import address, coins, trezor
+from microwallet.bip32 import get_subnode
+from microwallet.derivation import DerivationService
+from microwallet.formats import xpub
+from microwallet.multisig import MultisigAccount, multisig_records
+from microwallet.psbt import make_psbt
+from microwallet.script import ScriptKind, classify, parse_multisig
+
+COIN = coins.by_name["Bitcoin"]
+XPUBS = [make_xpub(bytes([i])) for i in range(3)]
+
+
+@pytest.fixture
+def account():
+    return MultisigAccount.from_xpubs("Bitcoin", XPUBS, 2, backend=MagicMock())
+
+
+def test_addresses(account):
+    addresses = list(itertools.islice(account.addresses(), 5))
+    for i, addr in enumerate(addresses):
+        assert addr.path == [0, i]
+        threshold, pubkeys = parse_multisig(addr.script)
+        assert threshold == 2
+        expected_keys = [
+            get_subnode(get_subnode(xpub.deserialize(x)[1], 0), i).public_key
+            for x in XPUBS
+        ]
+        assert pubkeys == sorted(expected_keys)
+
+        script_pubkey = address.derive_output_script(COIN, addr.str)
+        assert classify(script_pubkey).kind is ScriptKind.P2WSH
+        assert account.account_type.script_pubkey(addr.script) == script_pubkey
+
+
+def test_known_answer(account):
+    # wsh(multi(2,...)) test vector of BIP-383
+    pubkeys = [
+        bytes.fromhex(k)
+        for k in (
+            "03a0434d9e47f3c86235477c7b1ae6ae5d3442d49b1943c2b752a68e2a47e247c7",
+            "03774ae7f858a9411e5ef4246b70c65aac5649980be5c17891bbec17895da008cb",
+            "03d01115d548e7561b15c38f004d734633687cf4419620095bc5b0f47070afe85a",
+        )
+    ]
+    script_pubkey = bytes.fromhex(
+        "0020773d709598b76c4e3b575c08aad40658963f9322affc0f8c28d1d9a68d0c944a"
+    )
+    script = address.multisig_script(2, pubkeys)
+    assert account.account_type.script_pubkey(script) == script_pubkey
+    address_str = address.encode_p2wsh("bc", script)
+    assert address.derive_output_script(COIN, address_str) == script_pubkey
+
+    # sorted keys, redeem script of the first BIP-67 test vector
+    keys = [
+        bytes.fromhex(
+            "02ff12471208c14bd580709cb2358d98975247d8765f92bc25eab3b2763ed605f8"
+        ),
+        bytes.fromhex(
+            "02fe6f0a5a297eb38c391581c4413e084773ea23954d93f7753db7dc0adc188b2f"
+        ),
+    ]
+    [(script, _)] = multisig_records(2, "bc", [[k] for k in keys])
+    assert script == bytes.fromhex(
+        "522102fe6f0a5a297eb38c391581c4413e084773ea23954d93f7753db7dc0adc188b2f"
+        "2102ff12471208c14bd580709cb2358d98975247d8765f92bc25eab3b2763ed605f852ae"
+    )
+
+
+def test_spend_unsupported(account):
+    with pytest.raises(ValueError):
+        trezor.signing_data(account, [], [], None, 0)
+    with pytest.raises(ValueError):
+        make_psbt(0, account, [], [], None)
+
+
+def test_cosigner_order(account):
+    reordered = MultisigAccount.from_xpubs("Bitcoin", XPUBS[::-1], 2)
+    batch = account.address_range(0, 10, change=True)
+    assert reordered.address_range(0, 10, change=True).addresses == batch.addresses
+    other = MultisigAccount.from_xpubs("Bitcoin", XPUBS, 3)
+    assert other.address_range(0, 10, change=True).addresses != batch.addresses
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        MultisigAccount.from_xpubs("Bitcoin", XPUBS, 4)
+    with pytest.raises(ValueError):
+        MultisigAccount.from_xpubs("Dogecoin", XPUBS, 2)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", (0, 2))
+async def test_address_stream(account, workers):
+    expected = list(itertools.islice(account.addresses(change=True), 25))
+    with DerivationService(workers, chunk_size=10) as deriver:
+        account.deriver = deriver
+        stream = account.address_stream(change=True)
+        streamed = [a async for a in _take(stream, 25)]
+    assert streamed == expected
+
+
+async def _take(stream, n):
+    async for item in stream:
+        yield item
+        n -= 1
+        if n == 0:
+            break
+    await stream.aclose()
+
+
+def test_input_size(account):
+    addr = next(account.addresses())
+    fake_sig = b"\0" * 71
+    script_sig, witness = account.account_type.script_sig(addr, fake_sig)
+    assert script_sig == b""
+    assert witness == [b"", fake_sig, fake_sig, addr.script]
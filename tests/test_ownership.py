@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import pytest
+
+from microwallet import account_types
+from microwallet.account import Account
+from microwallet.address import derive_output_script
+from microwallet.ownership import INDEX_MAGIC, BloomFilter, OwnershipIndex
+from microwallet.psbt.trezor import make_output
+
+H = 0x8000_0000
+
+XPUBS = [
+    # m/49h/2h/15h
+    (
+        "Litecoin",
+        "Mtub2syZtptY6mWDbfUYxStNwpWfnC1GCjgn94i7LACu9euPviukSSVp"
+        "tfWu8kC7LKjD2pEUAf4Tk78zEG3eNEeFp1vdCuEaWu4thgYCiTP5fiA",
+    ),
+    # m/44h/3h/15h
+    (
+        "Dogecoin",
+        "dgub8sbe5Mi8LA4eBLHDvNhQWYu8awPXZThRPr4B4o3yzUYx4HswUunt"
+        "8C5pTCQS45ZGcEaTbeJ1NuwyTfD8hERktZw3r3r3iypBnAAxhNxQLFM",
+    ),
+]
+
+
+@pytest.fixture(params=XPUBS, ids=[coin for coin, _ in XPUBS])
+def account(request):
+    coin_name, xpub = request.param
+    return Account.from_xpub(coin_name, xpub)
+
+
+@pytest.mark.parametrize(
+    "account_type",
+    [
+        account_types.ACCOUNT_TYPE_LEGACY,
+        account_types.ACCOUNT_TYPE_DEFAULT,
+        account_types.ACCOUNT_TYPE_SEGWIT,
+    ],
+    ids=lambda t: str(t.type_id),
+)
+def test_script_pubkey(account_type):
+    account = Account.from_xpub(*XPUBS[0])
+    account.account_type = account_type
+    for _, address_str, public_key in account.address_range(0, 5):
+        expected = derive_output_script(account.coin, address_str)
+        assert account_type.script_pubkey(public_key) == expected
+
+
+def test_lookup(account):
+    index = OwnershipIndex()
+    index.add_account(account, lookahead=30, name="test")
+    assert len(index) == 60
+
+    change_address = list(account.address_range(17, 1, change=True))[0][1]
+    script = derive_output_script(account.coin, change_address)
+    owned = index.lookup_script(script)
+    assert owned.account == "test"
+    assert owned.change
+    assert owned.index == 17
+    assert owned.path == (1, 17)
+    assert index.lookup_address(change_address) == owned
+    assert index.is_mine(memoryview(script))
+
+    outside = list(account.address_range(30, 1))[0][1]
+    assert not index.is_mine(derive_output_script(account.coin, outside))
+    assert index.lookup_address(outside) is None
+
+
+def test_bloom_filter():
+    bloom = BloomFilter.for_capacity(1000)
+    items = [i.to_bytes(4, "big") for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(i.to_bytes(8, "big") in bloom for i in range(10000))
+    assert false_positives < 100
+
+
+def test_roundtrip(account, tmp_path):
+    index = OwnershipIndex()
+    index.add_account(account, lookahead=10)
+    path = tmp_path / "index"
+    index.save(path)
+
+    loaded = OwnershipIndex.load(path, use_bloom=False)
+    assert len(loaded) == len(index)
+    for _, address_str, _ in account.address_range(0, 10, change=True):
+        assert loaded.lookup_address(address_str) == index.lookup_address(address_str)
+
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 1
+    with pytest.raises(ValueError):
+        OwnershipIndex.from_bytes(bytes(data))
+
+
+def test_roundtrip_fingerprint(account):
+    index = OwnershipIndex()
+    index.add_account(account, lookahead=2, fingerprint=b"\x01\x02\x03\x04")
+    loaded = OwnershipIndex.from_bytes(index.to_bytes())
+    address_str = list(account.address_range(1, 1))[0][1]
+    assert loaded.lookup_address(address_str).fingerprint == b"\x01\x02\x03\x04"
+
+
+def test_load_other_version(account):
+    index = OwnershipIndex()
+    index.add_account(account, lookahead=2)
+    data = bytearray(index.to_bytes())
+    data[len(INDEX_MAGIC)] = 1
+    with pytest.raises(ValueError):
+        OwnershipIndex.from_bytes(bytes(data))
+
+
+@pytest.mark.parametrize("device", (b"\x01\x02\x03\x04", b"\xff\xff\xff\xff"))
+def test_make_output_fingerprint(device):
+    coin_name, xpub = XPUBS[0]
+    account = Account.from_xpub(coin_name, xpub, path=[49 | H, 2 | H, 15 | H])
+    index = OwnershipIndex()
+    index.add_account(account, lookahead=5, fingerprint=b"\x01\x02\x03\x04")
+
+    change_address = list(account.address_range(3, 1, change=True))[0][1]
+    tx_out = SimpleNamespace(
+        value=1000, script_pubkey=derive_output_script(account.coin, change_address)
+    )
+    psbt_out = SimpleNamespace(bip32_path={})
+    trezor_out = make_output(tx_out, psbt_out, device, account.coin, index)
+    if device == b"\x01\x02\x03\x04":
+        assert trezor_out.address_n == [49 | H, 2 | H, 15 | H, 1, 3]
+        assert trezor_out.address is None
+    else:
+        # another device's account: pay to the address, not to own keys
+        assert trezor_out.address_n is None
+        assert trezor_out.address == change_address
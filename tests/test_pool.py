@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeBackend, make_xpub
+from microwallet import exceptions
+from microwallet.account import Account
+from microwallet.pool import AddressPool
+from microwallet.store import WalletStore
+
+XPUB = make_xpub("pool")
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+@pytest.fixture
+def account(backend):
+    return Account.from_xpub("Bitcoin", XPUB, backend=backend)
+
+
+@pytest.mark.asyncio
+async def test_pool(account, backend):
+    receive = account.address_range(0, 20).addresses
+    backend.received[receive[0]] = 1000
+    # used by another wallet, past the first unused address
+    backend.received[receive[3]] = 500
+
+    pool = AddressPool(account, size=3)
+    first = await pool.get_address()
+    assert (first.path[-1], first.str) == (1, receive[1])
+    await pool.wait_refill()
+
+    # a filled pool answers without waiting for the backend
+    backend.gate = asyncio.Event()
+    requests = len(backend.requested)
+    second = await asyncio.wait_for(pool.get_address(), 0.1)
+    assert second.str == receive[2]
+    backend.gate.set()
+    await pool.wait_refill()
+
+    addresses = [(await pool.get_address()).str for _ in range(3)]
+    assert addresses == [receive[4], receive[5], receive[6]]
+    await pool.wait_refill()
+    # each refill looks up the first unused address at the start of the chain,
+    # past it only the addresses following the pool were checked
+    checked = backend.requested[requests:]
+    assert [a for a in checked if a not in receive[:4]] == receive[6:10]
+    assert len(pool.store.pool_free(account)) == 3
+
+
+@pytest.mark.asyncio
+async def test_pool_persistent(tmp_path, account, backend):
+    receive = account.address_range(0, 20).addresses
+    with WalletStore(tmp_path / "wallet.db") as store:
+        pool = AddressPool(account, store, size=2)
+        assert (await pool.get_address()).str == receive[0]
+        await pool.wait_refill()
+
+    # reservations survive, stale addresses are checked again
+    backend.received[receive[1]] = 100
+    with WalletStore(tmp_path / "wallet.db") as store:
+        pool = AddressPool(account, store, size=2, max_age=0)
+        await pool.refill()
+        assert [a for _, a, _ in store.pool_free(account)] == receive[2:4]
+        assert (await pool.get_address()).str == receive[2]
+        await pool.wait_refill()
+
+
+@pytest.mark.asyncio
+async def test_pool_shared(tmp_path, account, backend):
+    with WalletStore(tmp_path / "wallet.db") as store_a, WalletStore(
+        tmp_path / "wallet.db"
+    ) as store_b:
+        pools = [AddressPool(account, store, size=4) for store in (store_a, store_b)]
+        await pools[0].refill()
+        addresses = [(await pools[n % 2].get_address()).str for n in range(6)]
+        await asyncio.gather(*(p.wait_refill() for p in pools))
+    # no address is handed out twice
+    assert len(set(addresses)) == 6
+
+
+@pytest.mark.asyncio
+async def test_pool_gap_limit(account, backend):
+    receive = account.address_range(0, 40).addresses
+    backend.received[receive[0]] = 1000
+
+    pool = AddressPool(account, size=5)
+    addresses = []
+    for _ in range(20):
+        addresses.append((await pool.get_address()).str)
+        await pool.wait_refill()
+    # nothing past the gap limit after the last used address is handed out
+    assert addresses == receive[1:21]
+    assert not pool.store.pool_free(account)
+    assert max(row[0] for row in pool.store.pool_rows(account)) == 20
+    with pytest.raises(exceptions.AddressPoolExhausted):
+        await pool.get_address()
+
+    # a paid reservation moves the limit
+    backend.received[receive[4]] = 100
+    await pool.refill()
+    assert [a for _, a, _ in pool.store.pool_free(account)] == receive[21:25]
+
+    # reservations stay taken until they are released
+    await pool.refill()
+    assert [a for _, a, _ in pool.store.pool_free(account)] == receive[21:25]
+    assert await pool.release(2)
+    assert (await pool.get_address()).str == receive[2]
+    await pool.wait_refill()
+
+    # a paid reservation is not released
+    backend.received[receive[3]] = 100
+    assert not await pool.release(3)
+    with pytest.raises(ValueError):
+        await pool.release(3)
+    with pytest.raises(ValueError):
+        await pool.release(21)
+
+
+@pytest.mark.asyncio
+async def test_pool_reanchor(account, backend):
+    receive = account.address_range(0, 20).addresses
+    pool = AddressPool(account, size=3)
+    await pool.refill()
+    assert [a for _, a, _ in pool.store.pool_free(account)] == receive[0:3]
+
+    # another wallet uses addresses past the pool
+    for address in receive[:5]:
+        backend.pay(address, 100)
+    await pool.refill()
+    assert [a for _, a, _ in pool.store.pool_free(account)] == receive[5:8]
+    assert (await pool.get_address()).str == receive[5]
+    await pool.wait_refill()
+
+
+@pytest.mark.asyncio
+async def test_pool_taken_during_refill(account, backend):
+    pool = AddressPool(account, size=1)
+    reserve = pool.store.pool_reserve
+    stolen = []
+
+    def reserve_after_other(account):
+        # another process takes the address refilled for this call
+        if not stolen and pool.store.pool_free(account):
+            stolen.append(reserve(account))
+        return reserve(account)
+
+    pool.store.pool_reserve = reserve_after_other
+    address = await pool.get_address()
+    assert [index for index, _ in stolen] == [0]
+    assert address.path[-1] == 1
+    await pool.wait_refill()
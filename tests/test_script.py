@@ -0,0 +1,82 @@
+import pytest
+
+from microwallet import address, coins, script
+from microwallet.script import ScriptKind, classify
+
+HASH20 = bytes(range(20))
+HASH32 = bytes(range(32))
+PUBKEY = b"\x02" + bytes(range(32))
+
+VECTORS = [
+    (b"\x76\xa9\x14" + HASH20 + b"\x88\xac", ScriptKind.P2PKH, HASH20, None),
+    (b"\xa9\x14" + HASH20 + b"\x87", ScriptKind.P2SH, HASH20, None),
+    (b"\x00\x14" + HASH20, ScriptKind.P2WPKH, HASH20, 0),
+    (b"\x00\x20" + HASH32, ScriptKind.P2WSH, HASH32, 0),
+    (b"\x51\x20" + HASH32, ScriptKind.P2TR, HASH32, 1),
+    (b"\x52\x10" + HASH20[:16], ScriptKind.WITNESS, HASH20[:16], 2),
+    (b"\x6a\x04test", ScriptKind.OP_RETURN, b"test", None),
+    (b"\x6a\x4c\x04test", ScriptKind.OP_RETURN, b"test", None),
+    (b"\x6a", ScriptKind.OP_RETURN, b"", None),
+    (
+        b"\x51\x21" + PUBKEY + b"\x21" + PUBKEY + b"\x52\xae",
+        ScriptKind.MULTISIG,
+        b"\x21" + PUBKEY + b"\x21" + PUBKEY,
+        None,
+    ),
+]
+
+NONSTANDARD = [
+    b"",
+    b"\x76\xa9\x14" + HASH20 + b"\x88\xad",
+    b"\xa9\x14" + HASH20,
+    b"\x00\x15" + HASH20,
+    b"\x6a\x05test",
+    b"\x6a\x4d\x04\x00test",
+    b"\x52\x21" + PUBKEY + b"\x51\xae",
+]
+
+
+@pytest.mark.parametrize("script_bytes, kind, payload, witness_version", VECTORS)
+def test_classify(script_bytes, kind, payload, witness_version):
+    classified = classify(script_bytes)
+    assert classified.kind is kind
+    assert isinstance(classified.payload, memoryview)
+    assert classified.payload == payload
+    assert classified.witness_version == witness_version
+
+
+@pytest.mark.parametrize("script_bytes", NONSTANDARD)
+def test_nonstandard(script_bytes):
+    assert classify(script_bytes).kind is ScriptKind.NONSTANDARD
+
+
+def test_parse_multisig():
+    m, pubkeys = script.parse_multisig(VECTORS[-1][0])
+    assert m == 1
+    assert pubkeys == [PUBKEY, PUBKEY]
+    assert script.parse_multisig(NONSTANDARD[-1]) is None
+
+
+def test_register_template(monkeypatch):
+    monkeypatch.setattr(script, "_FIXED", {})
+    p2tr = b"\x51\x20" + HASH32
+    assert classify(p2tr).kind is ScriptKind.WITNESS
+
+    template = script.FixedTemplate(ScriptKind.P2TR, b"\x51\x20", 32, b"", 1)
+    script.register_template(template)
+    assert classify(p2tr).kind is ScriptKind.P2TR
+
+
+def test_derive_address():
+    coin = coins.by_name["Bitcoin"]
+    for addr in (
+        "1HeVhjL5hm3m6YB46KPaVKCsUFQTPVXpbZ",
+        "3BCKHw64xVF3SHbfkYca7Kx2QP9fLRMwZz",
+        "bc1qvp7jgc5uyn62w34fywe4v6kpp2wy4k9yyv9hgw",
+    ):
+        script_pubkey = address.derive_output_script(coin, addr)
+        assert address.derive_address(coin, script_pubkey) == addr
+
+    assert address.get_op_return_data(b"\x6a\x04test") == b"test"
+    with pytest.raises(ValueError):
+        address.derive_address(coin, b"\x6a\x04test")
@@ -0,0 +1,148 @@
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from conftest import FakeBackend, make_xpub
+from microwallet.account import Account
+from microwallet.store import WalletStore, account_key
+
+XPUB = make_xpub("store")
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+@pytest.fixture
+def account(backend):
+    account = Account.from_xpub("Bitcoin", XPUB, backend=backend)
+    receive = account.address_range(0, 10).addresses
+    change = account.address_range(0, 10, change=True).addresses
+    backend.pay(receive[0], 1000)
+    backend.pay(receive[2], 2000)
+    backend.pay(change[0], 500)
+    return account
+
+
+@pytest.mark.asyncio
+async def test_sync(tmp_path, account, backend):
+    receive = account.address_range(0, 10).addresses
+    with WalletStore(tmp_path / "wallet.db") as store:
+        snapshot = await store.sync(account)
+        assert snapshot.balance == 3500
+        assert [a.str for a in snapshot.addresses] == receive[0:3:2] + [
+            account.address_range(0, 1, change=True).addresses[0]
+        ]
+        assert [u.value for u in snapshot.utxos] == [1000, 2000, 500]
+        assert snapshot.unused[False].str == receive[1]
+        assert store.sync_height(account) == 100
+        assert backend.requests["utxos"] == 3
+        assert backend.requests["tx"] == 0
+
+        # nothing changed: known addresses up to the last used ones and the gap
+        # windows are queried, no UTXOs are fetched
+        backend.requests.clear()
+        await store.sync(account)
+        assert backend.requests["address"] == 3 + 1 + 2 * 40
+        assert backend.requests["utxos"] == 0
+        assert backend.requests["tx"] == 0
+
+        backend.spend(receive[0])
+        backend.pay(receive[7], 300)
+        backend.requests.clear()
+        snapshot = await store.sync(account)
+        assert snapshot.balance == 2800
+        # the spent address is known to be empty without asking for its UTXOs
+        assert backend.requests["utxos"] == 1
+        assert [u.address.str for u in snapshot.utxos][:2] == [receive[2], receive[7]]
+
+    # balance of a synced wallet is available offline
+    with WalletStore(tmp_path / "wallet.db") as store:
+        assert store.balance(account) == 2800
+
+
+@pytest.mark.asyncio
+async def test_sync_gap_paid(tmp_path, account, backend):
+    receive = account.address_range(0, 10).addresses
+    backend.pay(receive[5], 700)
+    with WalletStore(tmp_path / "wallet.db") as store:
+        await store.sync(account)
+        # an empty address below the last used one receives funds later
+        backend.pay(receive[1], 50)
+        snapshot = await store.sync(account)
+        assert snapshot.balance == 3500 + 700 + 50
+        assert receive[1] in [u.address.str for u in snapshot.utxos]
+
+        # so does an address that was spent to empty
+        backend.spend(receive[0])
+        await store.sync(account)
+        backend.pay(receive[0], 20)
+        snapshot = await store.sync(account)
+        assert snapshot.balance == 2500 + 700 + 50 + 20
+
+        # an incremental sync gives the same wallet as a full one
+        full = await store.sync(account, full=True)
+        assert [u.txid for u in full.utxos] == [u.txid for u in snapshot.utxos]
+
+
+@pytest.mark.asyncio
+async def test_sync_resume(tmp_path, account, backend):
+    receive = account.address_range(0, 40).addresses
+    backend.pay(receive[30], 100)
+    with WalletStore(tmp_path / "wallet.db") as store:
+        backend.fail_after = 50
+        with pytest.raises(RuntimeError):
+            await store.sync(account)
+
+        backend.fail_after = None
+        backend.requests.clear()
+        snapshot = await store.sync(account)
+        assert snapshot.balance == 3600
+        # committed batches were not scanned again
+        # the first batch of both chains was committed before the failure:
+        # known addresses up to the last used ones are rechecked, the scan
+        # continues at index 20
+        assert backend.requests["address"] == 4 + 40 + 20
+
+
+@pytest.mark.asyncio
+async def test_stored_transactions(tmp_path, account, backend):
+    with WalletStore(tmp_path / "wallet.db") as store:
+        account.store = store
+        snapshot = await account.refresh_snapshot()
+        await account.load_transactions(snapshot.utxos)
+        assert snapshot.utxos[0].tx["fees"] == Decimal("0.0001")
+        assert backend.requests["tx"] == 3
+
+    # loaded transactions are kept in the store
+    account = Account.from_xpub("Bitcoin", XPUB, backend=backend)
+    with WalletStore(tmp_path / "wallet.db") as store:
+        account.store = store
+        utxos = store.snapshot(account, fee_rate=None).utxos
+        await account.load_transactions(utxos)
+        assert [u.tx["txid"] for u in utxos] == [u.txid for u in utxos]
+        assert backend.requests["tx"] == 3
+
+
+@pytest.mark.asyncio
+async def test_account_store(tmp_path, account, backend):
+    with WalletStore(tmp_path / "wallet.db") as store:
+        account.store = store
+        await account.refresh_snapshot()
+        backend.requests.clear()
+        assert await account.balance() == 3500
+        assert len([u async for u in account.find_utxos()]) == 3
+        assert await account.estimate_fee() == 1000
+        assert not backend.requests
+
+
+def test_account_key(account):
+    key = account_key(account)
+    # later calls do not derive addresses again
+    with mock.patch.object(account, "address_range", side_effect=AssertionError):
+        assert account_key(account) == key
+    same = Account.from_xpub("Bitcoin", XPUB)
+    assert account_key(same) == key
+    assert account_key(Account.from_xpub("Bitcoin", make_xpub("other"))) != key